@@ -5,29 +5,39 @@ from tkinter import filedialog, messagebox
 from lxml import etree
 import sys
 import numpy as np
-from skimage import transform
+from correct_kml_core import correct_kml, COMPACT_DECIMALS
+from correct_kml_fit import TRANSFORM_TYPES, to_core_transform, fit_transform_cached, format_residual_report, load_control_points
 import traceback # 导入 traceback 用于打印详细错误信息 (调试用)
 
+
 # --- 核心修正函数 ---
 # 这个函数只负责读取文件，应用变换，并保存文件
 # 它不处理文件对话框，也不应该调用 sys.exit()
-def correct_kml_coordinates(input_kml_path, output_kml_path, transform_matrix, status_callback=None):
+def correct_kml_coordinates(input_kml_path, output_kml_path, transform_matrix, status_callback=None, streaming=False, workers=1,
+                            decimals=None, minify=False):
     """
-    Reads a KML file from input_kml_path, applies an affine transformation
+    Reads a KML file from input_kml_path, applies the fitted transformation
     to all <coordinates> and <gx:coord> tags using transform_matrix,
     and saves the result to output_kml_path.
 
     Args:
         input_kml_path (str): Path to the input KML file.
         output_kml_path (str): Path to save the corrected output KML file.
-        transform_matrix (skimage.transform.AffineTransform): The calculated affine transform.
+        transform_matrix (skimage.transform.AffineTransform): The calculated transform.
+                                              Projective and polynomial skimage transforms,
+                                              or any correct_kml_core transform, work as well.
         status_callback (function, optional): A function to call with status messages.
                                               Defaults to None (messages will be printed).
+        streaming (bool, optional): If True, the file is processed with iterparse and written
+                                    incrementally so memory stays flat for multi-GB files.
+        workers (int, optional): Number of processes used to correct the coordinates of one
+                                 file (not used in streaming mode). Defaults to 1.
+        decimals (int, optional): Fixed number of decimals for the corrected lon/lat
+                                  (7 is about 1 cm). Defaults to None (full repr precision).
+        minify (bool, optional): If True, the output is written without indentation.
     Raises:
         FileNotFoundError: If the input file is not found.
         etree.XMLSyntaxError: If the input file is not valid XML/KML.
-        ValueError: If coordinate values cannot be parsed as floats.
-        IndexError: If coordinate strings have unexpected structure.
         Exception: For other unexpected errors during processing.
     """
     def update_status(message):
@@ -39,136 +49,11 @@ def correct_kml_coordinates(input_kml_path, output_kml_path, transform_matrix, s
     update_status(f"正在读取文件: {input_kml_path}")
 
     try:
-        # Parse the KML file
-        # recover=True helps in parsing slightly malformed XML if necessary
-        parser = etree.XMLParser(ns_clean=True, recover=True)
-        tree = etree.parse(input_kml_path, parser)
-        root = tree.getroot()
-
-        # Define KML and Google Extension (gx) namespaces
-        # Ensure these match the namespaces used in your KML file if they are different
-        ns = {
-            'kml': 'http://www.opengis.net/kml/2.2',
-            'gx': 'http://www.google.com/kml/ext/2.2' # Google Extension namespace
-        }
-
-        # Find all <coordinates> (standard KML) and <gx:coord> (Google Extension) elements
-        # The | operator combines the results of two XPath queries
-        all_coord_elements = root.xpath('//kml:coordinates | //gx:coord', namespaces=ns)
-
-        update_status(f"找到 {len(all_coord_elements)} 个坐标元素 (<coordinates> 或 <gx:coord>)。")
-
-        corrected_point_count = 0
-        skipped_element_count = 0
-
-        for i, element in enumerate(all_coord_elements):
-            original_text = element.text
-            if original_text is None or not original_text.strip(): # Skip empty or whitespace-only elements
-                skipped_element_count += 1
-                # update_status(f"Warning: Skipping empty coordinate element {i+1}.") # Optional detailed warning
-                continue
-
-            original_text = original_text.strip()
-            corrected_text = ""
-            element_corrected_count = 0 # Counter for points corrected within this element
-
-            # --- Handle <coordinates> tags (standard KML) ---
-            if element.tag == '{http://www.opengis.net/kml/2.2}coordinates':
-                # <coordinates> format: lon,lat[,alt] space-separated
-                tuples_str = original_text.split() # Split by space into individual lon,lat[,alt] strings
-                corrected_tuples = []
-                for coord_tuple_str in tuples_str:
-                    try:
-                        coords = coord_tuple_str.split(',')
-                        if len(coords) >= 2: # Must have at least longitude and latitude
-                            lon = float(coords[0])
-                            lat = float(coords[1])
-                            alt_part = "," + coords[2] if len(coords) > 2 else "" # Keep altitude and leading comma if present
-
-                            # --- 应用仿射变换 ---
-                            original_point = np.array([[lon, lat]]) # 将点转换为 numpy 数组 (需要是二维的 [[lon, lat]])
-                            corrected_point = transform_matrix(original_point) # 应用变换
-                            corrected_lon = corrected_point[0, 0] # 获取修正后的经度
-                            corrected_lat = corrected_point[0, 1] # 获取修正后的纬度
-                            # --- 变换结束 ---
-
-                            # Reconstruct the corrected tuple string
-                            corrected_tuple_str = f"{corrected_lon},{corrected_lat}{alt_part}"
-                            corrected_tuples.append(corrected_tuple_str)
-                            element_corrected_count += 1
-                        else:
-                            # update_status(f"Warning: Element {i+1}: <coordinates> 内的坐标组格式不正确 '{coord_tuple_str}'。跳过此坐标组。") # Optional detailed warning
-                            skipped_element_count += 1 # Count this as a skipped point within an element
-
-                    except (ValueError, IndexError) as e:
-                        # update_status(f"Warning: Element {i+1}: 无法解析 <coordinates> 内的坐标组 '{coord_tuple_str}'。跳过此坐标组。错误: {e}") # Optional detailed warning
-                        skipped_element_count += 1 # Count this as a skipped point within an element
-                        pass # Skip problematic tuples
-
-                # Join corrected tuples back with spaces
-                corrected_text = " ".join(corrected_tuples)
-                corrected_point_count += element_corrected_count # Add to total count
-
-                # Update element text only if some tuples were corrected
-                if corrected_tuples:
-                     element.text = corrected_text
-                # else: # If original text wasn't empty but all points failed
-                #      update_status(f"Warning: Element {i+1}: <coordinates> 元素 '{original_text}' 中所有坐标组均无法解析。保留原始内容。") # Optional detailed warning
-                     # Optionally set text to empty or a placeholder, but leaving original is safer
-
-
-            # --- Handle <gx:coord> tags (Google Extension) ---
-            elif element.tag == '{http://www.google.com/kml/ext/2.2}coord':
-                 # <gx:coord> format: lon lat alt space-separated
-                 parts = original_text.split() # Split by space
-
-                 try:
-                     # gx:coord typically has exactly 3 parts: lon lat alt
-                     if len(parts) == 3:
-                         lon = float(parts[0])
-                         lat = float(parts[1])
-                         alt = parts[2] # Keep altitude as string
-
-                         # --- 应用仿射变换 ---
-                         original_point = np.array([[lon, lat]]) # 将点转换为 numpy 数组 (需要是二维的 [[lon, lat]])
-                         corrected_point = transform_matrix(original_point) # 应用变换
-                         corrected_lon = corrected_point[0, 0] # 获取修正后的经度
-                         corrected_lat = corrected_point[0, 1] # 获取修正后的纬度
-                         # --- 变换结束 ---
-
-                         # Reconstruct the corrected string (space separated lon lat alt)
-                         corrected_gx_coord_str = f"{corrected_lon} {corrected_lat} {alt}"
-
-                         # Update the element's text
-                         element.text = corrected_gx_coord_str
-                         corrected_point_count += 1 # Count this single point
-                         element_corrected_count += 1
-
-                     else:
-                         # update_status(f"Warning: Element {i+1}: <gx:coord> 元素格式不正确 '{original_text}'。期望 '经度 纬度 高度'。跳过此元素。") # Optional detailed warning
-                         skipped_element_count += 1 # Count this as a skipped element
-
-                 except (ValueError, IndexError) as e:
-                     # update_status(f"Warning: Element {i+1}: 无法解析 <gx:coord> '{original_text}'。跳过此元素。错误: {e}") # Optional detailed warning
-                     skipped_element_count += 1 # Count this as a skipped element
-                     pass # Skip problematic gx:coord
-
-            # else: # This case should not be reached with the current XPath
-            #      update_status(f"Warning: Element {i+1}: 发现未知元素标签 {element.tag}。跳过。") # Optional detailed warning
-            #      skipped_element_count += 1
-
-
-        update_status(f"修正处理完成。成功修正 {corrected_point_count} 个坐标点。跳过 {skipped_element_count} 个格式错误或无法解析的坐标元素/点。")
-
-
-        update_status(f"正在保存文件到 '{output_kml_path}'")
-        # Save the modified tree to a new file
-        # Use xml_declaration=True to ensure the <?xml version="1.0" encoding="utf-8"?> header is included
-        # Use pretty_print=True for readability of the output file
-        tree.write(output_kml_path, pretty_print=True, encoding='utf-8', xml_declaration=True)
+        correct_kml(input_kml_path, output_kml_path, to_core_transform(transform_matrix),
+                    update_status, streaming=streaming, workers=workers,
+                    decimals=decimals, minify=minify)
         update_status("文件保存成功。")
 
-
     except FileNotFoundError:
         raise FileNotFoundError(f"错误: 输入文件未找到 '{input_kml_path}'")
     except etree.XMLSyntaxError as e:
@@ -193,13 +78,16 @@ class KmlCorrectorGUI:
 
         self.incorrect_entries = []
         self.correct_entries = []
-        self.num_points = 5 # Allow input for up to 5 points by default (can be more than 3)
+        self.num_points = 6 # Allow input for up to 6 points (2nd-order polynomial needs 6)
+        self.transform_type = tk.StringVar(value='affine')
+        self.compact_output = tk.BooleanVar(value=False)
+        self.csv_points = None # 从 CSV 导入的控制点 (incorrect_points, correct_points), 导入后优先于手动输入
 
         self.input_file_path = ""
         self.output_file_path = ""
 
         # --- Coordinate Input Frame ---
-        self.coord_frame = tk.LabelFrame(master, text="输入参考点 (至少 3 对)")
+        self.coord_frame = tk.LabelFrame(master, text="输入参考点 (仿射至少 3 对)")
         self.coord_frame.grid(row=0, column=0, columnspan=4, padx=10, pady=5, sticky="ew")
 
         # Configure coord_frame columns to expand
@@ -239,6 +127,18 @@ class KmlCorrectorGUI:
             entry_corr_lat.grid(row=i+2, column=4, padx=2, pady=2, sticky="ew")
             self.correct_entries.append((correct_lon, correct_lat))
 
+        # --- Transform type selection ---
+        tk.Label(self.coord_frame, text="变换类型:").grid(row=self.num_points+2, column=0, sticky="w", padx=5)
+        for column, (type_name, (_, _, min_points, display_name)) in enumerate(TRANSFORM_TYPES.items(), start=1):
+            tk.Radiobutton(self.coord_frame, text=f"{display_name} (至少 {min_points} 对)",
+                           variable=self.transform_type, value=type_name).grid(row=self.num_points+2, column=column, sticky="w")
+
+        # --- Control points from CSV (hundreds of points, fitted with RANSAC) ---
+        self.csv_button = tk.Button(self.coord_frame, text="导入控制点 CSV...", command=self.select_control_points_file)
+        self.csv_button.grid(row=self.num_points+3, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+        self.csv_label = tk.Label(self.coord_frame, text="未导入 (使用上方手动输入的点)", fg="blue", anchor="w")
+        self.csv_label.grid(row=self.num_points+3, column=2, columnspan=3, sticky="ew", padx=5)
+
         # --- File Selection Frame ---
         self.file_frame = tk.LabelFrame(master, text="文件选择")
         self.file_frame.grid(row=1, column=0, columnspan=4, padx=10, pady=5, sticky="ew")
@@ -247,18 +147,21 @@ class KmlCorrectorGUI:
         self.file_frame.grid_columnconfigure(1, weight=1)
 
 
-        tk.Label(self.file_frame, text="输入 KML 文件:").grid(row=0, column=0, sticky="w", padx=5)
+        tk.Label(self.file_frame, text="输入 KML/KMZ 文件:").grid(row=0, column=0, sticky="w", padx=5)
         self.input_file_label = tk.Label(self.file_frame, text="未选择", fg="blue", anchor="w")
         self.input_file_label.grid(row=0, column=1, sticky="ew", padx=5)
         self.input_button = tk.Button(self.file_frame, text="浏览...", command=self.select_input_file)
         self.input_button.grid(row=0, column=2, padx=5, pady=5) # Place button next to label, spanning 2 columns
 
-        tk.Label(self.file_frame, text="输出 KML 文件:").grid(row=1, column=0, sticky="w", padx=5)
+        tk.Label(self.file_frame, text="输出 KML/KMZ 文件:").grid(row=1, column=0, sticky="w", padx=5)
         self.output_file_label = tk.Label(self.file_frame, text="未选择", fg="blue", anchor="w")
         self.output_file_label.grid(row=1, column=1, sticky="ew", padx=5)
         self.output_button = tk.Button(self.file_frame, text="保存为...", command=self.select_output_file)
         self.output_button.grid(row=1, column=2, padx=5, pady=5) # Place button next to label
 
+        tk.Checkbutton(self.file_frame, text=f"紧凑输出 (坐标保留 {COMPACT_DECIMALS} 位小数, 不缩进)",
+                       variable=self.compact_output).grid(row=2, column=0, columnspan=3, sticky="w", padx=5)
+
 
         # --- Control Button ---
         self.correct_button = tk.Button(master, text="开始修正", command=self.start_correction, font='TkDefaultFont 10 bold', bg="green", fg="white")
@@ -323,8 +226,8 @@ class KmlCorrectorGUI:
 
     def select_input_file(self):
         file_path = filedialog.askopenfilename(
-            title="选择需要修正的 KML 文件",
-            filetypes=(("KML 文件", "*.kml"), ("所有文件", "*.*"))
+            title="选择需要修正的 KML/KMZ 文件",
+            filetypes=(("KML/KMZ 文件", "*.kml *.kmz"), ("KML 文件", "*.kml"), ("KMZ 文件", "*.kmz"), ("所有文件", "*.*"))
         )
         if file_path:
             self.input_file_path = file_path
@@ -337,16 +240,18 @@ class KmlCorrectorGUI:
     def select_output_file(self):
         # Suggest a default name based on input file if selected
         initial_file = ""
+        default_extension = ".kml"
         if self.input_file_path:
              original_filename = self.input_file_path.split('/')[-1].split('\\')[-1]
-             if original_filename.lower().endswith('.kml'):
+             if original_filename.lower().endswith(('.kml', '.kmz')):
+                 default_extension = original_filename[-4:].lower() # KMZ 输入默认输出 KMZ, 保留其中的图标等文件
                  original_filename = original_filename[:-4]
              initial_file = "corrected_affine_" + original_filename
 
         file_path = filedialog.asksaveasfilename(
-            title="保存修正后的 KML 文件为...",
-            defaultextension=".kml",
-            filetypes=(("KML 文件", "*.kml"), ("所有文件", "*.*")),
+            title="保存修正后的 KML/KMZ 文件为...",
+            defaultextension=default_extension,
+            filetypes=(("KML 文件", "*.kml"), ("KMZ 文件", "*.kmz"), ("所有文件", "*.*")),
             initialfile=initial_file
         )
         if file_path:
@@ -357,6 +262,23 @@ class KmlCorrectorGUI:
             self.update_status(f"已选择输出文件路径: {display_name}")
 
 
+    def select_control_points_file(self):
+        file_path = filedialog.askopenfilename(
+            title="选择控制点 CSV 文件 (错误经度,错误纬度,正确经度,正确纬度)",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+        try:
+            self.csv_points = load_control_points(file_path)
+        except (OSError, ValueError) as e:
+            self.csv_points = None
+            self.csv_label.config(text="未导入 (使用上方手动输入的点)")
+            messagebox.showerror("错误", f"无法读取控制点文件。\n错误详情: {e}")
+            return
+        self.csv_label.config(text=f"{file_path} ({len(self.csv_points[0])} 对)")
+        self.update_status(f"已导入 {len(self.csv_points[0])} 对控制点: {file_path}")
+
     def update_status(self, message):
         """Appends a message to the status text area."""
         self.status_text.config(state='normal') # Enable editing
@@ -374,7 +296,7 @@ class KmlCorrectorGUI:
         correct_points_list = []
 
         try:
-            for i in range(self.num_points):
+            for i in range(self.num_points if self.csv_points is None else 0):
                 inc_lon_str = self.incorrect_entries[i][0].get().strip()
                 inc_lat_str = self.incorrect_entries[i][1].get().strip()
                 corr_lon_str = self.correct_entries[i][0].get().strip()
@@ -400,9 +322,13 @@ class KmlCorrectorGUI:
                 incorrect_points_list.append([inc_lon, inc_lat])
                 correct_points_list.append([corr_lon, corr_lat])
 
+            if self.csv_points is not None:
+                incorrect_points_list, correct_points_list = self.csv_points
+
             # Check if enough points were provided
-            if len(incorrect_points_list) < 3:
-                messagebox.showwarning("警告", "请至少填写 3 对完整的参考点坐标来计算仿射变换！")
+            _, _, min_points, display_name = TRANSFORM_TYPES[self.transform_type.get()]
+            if len(incorrect_points_list) < min_points:
+                messagebox.showwarning("警告", f"请至少填写 {min_points} 对完整的参考点坐标来计算{display_name}！")
                 self.update_status("参考点数量不足。")
                 self.correct_button.config(state='normal')
                 return
@@ -436,27 +362,29 @@ class KmlCorrectorGUI:
             return
 
 
-        # --- 3. Calculate Affine Transformation ---
-        self.update_status("正在计算仿射变换...")
+        # --- 3. Calculate Transformation ---
+        self.update_status(f"正在计算{display_name}...")
 
         try:
-            affine_transform = transform.estimate_transform('affine', incorrect_points, correct_points)
-
-            if affine_transform is None:
-                 messagebox.showerror("错误", "无法计算仿射变换。请检查输入的参考点是否共线或数据是否存在其他问题。")
-                 self.update_status("计算仿射变换失败：点可能共线或数据有问题。")
-                 self.correct_button.config(state='normal')
-                 return
-
-            self.update_status("成功计算仿射变换。")
+            # 点数多于最少点数时用 RANSAC 剔除输错的点; 结果按控制点哈希缓存, 批处理可直接复用
+            fitted_transform, fit_report, from_cache = fit_transform_cached(
+                incorrect_points, correct_points, self.transform_type.get())
+            self.update_status(f"成功计算{display_name}。" + (" (从缓存加载)" if from_cache else ""))
+            for line in format_residual_report(fit_report, incorrect_points):
+                self.update_status(line)
             # Optional: Display the transform matrix
-            # self.update_status(f"变换矩阵:\n{affine_transform.params}")
+            # self.update_status(f"变换矩阵:\n{fit_report['params']}")
 
+        except ValueError as e:
+            messagebox.showerror("错误", f"无法计算{display_name}。\n{e}")
+            self.update_status(f"计算{display_name}失败：点可能共线或数据有问题。")
+            self.correct_button.config(state='normal')
+            return
 
         except Exception as e:
-            messagebox.showerror("错误", f"计算仿射变换时发生未知错误。\n错误详情: {e}")
+            messagebox.showerror("错误", f"计算{display_name}时发生未知错误。\n错误详情: {e}")
             # traceback.print_exc() # Print traceback to console for debugging
-            self.update_status("计算仿射变换时发生错误。")
+            self.update_status(f"计算{display_name}时发生错误。")
             self.correct_button.config(state='normal')
             return
 
@@ -468,7 +396,9 @@ class KmlCorrectorGUI:
         try:
             # Call the core correction function
             # Pass the status_callback so the function can update the GUI status area
-            correct_kml_coordinates(self.input_file_path, self.output_file_path, affine_transform, self.update_status)
+            compact = self.compact_output.get()
+            correct_kml_coordinates(self.input_file_path, self.output_file_path, fitted_transform, self.update_status,
+                                    decimals=COMPACT_DECIMALS if compact else None, minify=compact)
 
             self.update_status("文件修正完成！")
             messagebox.showinfo("完成", "KML 文件修正成功！")
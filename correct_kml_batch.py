@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from correct_kml_core import correct_kml, OffsetTransform, COMPACT_DECIMALS
+
+KML_EXTENSIONS = ('.kml', '.kmz')
+
+
+# --- 批量修正 (无界面) ---
+# 每周有几百个来自同一偏差来源的 KML 文件, GUI 一次只能处理一对输入/输出,
+# 这里用一个变换批量处理目录或通配符匹配的所有文件, 并用进程池把文件分配到所有 CPU 核心
+def collect_input_files(inputs):
+    """
+    Expands directories (non-recursive) and glob patterns into a sorted list
+    of KML/KMZ files, without duplicates.
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item)
+        files.extend(path for path in candidates
+                     if os.path.isfile(path) and path.lower().endswith(KML_EXTENSIONS))
+    return sorted(set(files))
+
+
+def build_transform(args):
+    """Builds the batched correction transform from the command line arguments."""
+    if args.offset:
+        return OffsetTransform(*args.offset)
+
+    # 仅在使用控制点时才需要 skimage
+    from correct_kml_fit import (DEFAULT_CACHE_DIR, DEFAULT_RESIDUAL_THRESHOLD_M, fit_transform_cached,
+                                 format_residual_report, load_control_points)
+
+    cache_dir = None if args.no_cache else (args.cache_dir or DEFAULT_CACHE_DIR)
+    residual_threshold = DEFAULT_RESIDUAL_THRESHOLD_M if args.residual_threshold is None else args.residual_threshold
+    incorrect_points, correct_points = load_control_points(args.control_points)
+    fitted_transform, fit_report, from_cache = fit_transform_cached(
+        incorrect_points, correct_points, args.transform, use_ransac=not args.no_ransac,
+        residual_threshold_m=residual_threshold, cache_dir=cache_dir)
+    print(f"{'从缓存加载' if from_cache else '已拟合'} {args.transform} 变换 ({len(incorrect_points)} 对控制点):")
+    for line in format_residual_report(fit_report, incorrect_points):
+        print(line)
+    return fitted_transform
+
+
+def _quiet(message):
+    pass
+
+
+def correct_one_file(input_path, output_path, transform, streaming=False, decimals=None, minify=False):
+    """
+    Worker: corrects one file and returns its statistics. Runs in a separate
+    process, so errors are returned rather than raised.
+    """
+    start_time = time.perf_counter()
+    input_bytes = 0
+    try:
+        input_bytes = os.path.getsize(input_path)
+        coord_element_count, corrected_point_count, skipped_element_count = correct_kml(
+            input_path, output_path, transform, _quiet, streaming=streaming, decimals=decimals, minify=minify)
+        error = None
+    except Exception as e:
+        coord_element_count = corrected_point_count = skipped_element_count = 0
+        error = f"{type(e).__name__}: {e}"
+    return {
+        'input': input_path,
+        'output': output_path,
+        'elements': coord_element_count,
+        'points': corrected_point_count,
+        'skipped': skipped_element_count,
+        'seconds': time.perf_counter() - start_time,
+        'input_bytes': input_bytes,
+        'output_bytes': 0 if error else os.path.getsize(output_path),
+        'error': error,
+    }
+
+
+def plan_output_paths(input_files, output_dir):
+    """
+    Maps each input file to output_dir/<same file name>.
+
+    Raises:
+        ValueError: If an output would overwrite its own input (output_dir is
+            the input's directory), or if two inputs share a file name.
+    """
+    output_paths = []
+    sources = {}
+    for input_path in input_files:
+        output_path = os.path.join(output_dir, os.path.basename(input_path))
+        key = os.path.normcase(os.path.realpath(output_path))
+        if key == os.path.normcase(os.path.realpath(input_path)):
+            raise ValueError(f"输出文件与输入文件相同: {input_path} (请换一个输出目录)")
+        if key in sources:
+            raise ValueError(f"输入文件 {sources[key]} 和 {input_path} 同名, 输出会互相覆盖: {output_path}")
+        sources[key] = input_path
+        output_paths.append(output_path)
+    return output_paths
+
+
+def run_batch(input_files, output_dir, transform, workers=None, streaming=False, decimals=None, minify=False):
+    """
+    Corrects all input_files in parallel with a ProcessPoolExecutor and writes
+    each result under output_dir with the same file name.
+
+    Returns:
+        tuple: (results, wall_seconds) where results is sorted like input_files.
+
+    Raises:
+        ValueError: See plan_output_paths; checked before any file is written.
+    """
+    output_paths = plan_output_paths(input_files, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, max(len(input_files), 1))) as executor:
+        futures = [
+            executor.submit(correct_one_file, input_path, output_path, transform, streaming, decimals, minify)
+            for input_path, output_path in zip(input_files, output_paths)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = "失败" if result['error'] else "完成"
+            print(f"[{len(results)}/{len(input_files)}] {status}: {os.path.basename(result['input'])} ({result['seconds']:.2f}s)")
+    order = {path: index for index, path in enumerate(input_files)}
+    results.sort(key=lambda result: order[result['input']])
+    return results, time.perf_counter() - start_time
+
+
+def print_report(results, wall_seconds, workers):
+    """Prints per-file timings, output size change and overall throughput."""
+    print("\n" + "-" * 88)
+    print(f"{'文件':<36}{'坐标点':>12}{'跳过':>8}{'耗时(s)':>10}{'点/秒':>12}{'大小变化':>10}")
+    print("-" * 88)
+    for result in results:
+        name = os.path.basename(result['input'])
+        if result['error']:
+            print(f"{name:<36} 失败: {result['error']}")
+            continue
+        rate = result['points'] / result['seconds'] if result['seconds'] > 0 else 0.0
+        change = (result['output_bytes'] - result['input_bytes']) / result['input_bytes'] * 100 if result['input_bytes'] else 0.0
+        print(f"{name:<36}{result['points']:>12}{result['skipped']:>8}{result['seconds']:>10.2f}{rate:>12.0f}{change:>+9.1f}%")
+    print("-" * 88)
+
+    succeeded = [result for result in results if not result['error']]
+    total_points = sum(result['points'] for result in succeeded)
+    cpu_seconds = sum(result['seconds'] for result in succeeded)
+    input_bytes = sum(result['input_bytes'] for result in succeeded)
+    output_bytes = sum(result['output_bytes'] for result in succeeded)
+    print(f"成功 {len(succeeded)} 个文件, 失败 {len(results) - len(succeeded)} 个, 进程数 {workers}")
+    print(f"总坐标点: {total_points}, 总耗时: {wall_seconds:.2f}s, 吞吐量: {total_points / wall_seconds if wall_seconds > 0 else 0:.0f} 点/秒")
+    if input_bytes:
+        print(f"输入 {input_bytes / 1e6:.2f} MB, 输出 {output_bytes / 1e6:.2f} MB "
+              f"(变化 {(output_bytes - input_bytes) / input_bytes * 100:+.1f}%), "
+              f"输出吞吐量 {output_bytes / wall_seconds / 1e6 if wall_seconds > 0 else 0:.1f} MB/s")
+    if wall_seconds > 0:
+        print(f"并行加速比: {cpu_seconds / wall_seconds:.2f}x (各文件耗时之和 / 总耗时)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量修正 KML/KMZ 坐标 (多进程)")
+    parser.add_argument('inputs', nargs='+', help="输入目录或通配符, 例如 data/ 或 'data/*.kml'")
+    parser.add_argument('-o', '--output-dir', required=True, help="输出目录, 文件名与输入相同")
+    spec = parser.add_mutually_exclusive_group(required=True)
+    spec.add_argument('--offset', nargs=2, type=float, metavar=('DLON', 'DLAT'), help="常量偏移 (经度, 纬度)")
+    spec.add_argument('--control-points', metavar='CSV', help="控制点 CSV: 错误经度,错误纬度,正确经度,正确纬度")
+    parser.add_argument('--transform', choices=('affine', 'projective', 'polynomial'), default='affine',
+                        help="使用控制点时的变换类型 (默认 affine)")
+    parser.add_argument('--no-ransac', action='store_true', help="不使用 RANSAC 剔除异常控制点")
+    # 默认值 (None) 在 build_transform 中取 correct_kml_fit.DEFAULT_RESIDUAL_THRESHOLD_M, 只用 --offset 时不必导入 skimage
+    parser.add_argument('--residual-threshold', type=float, default=None, metavar='METRES',
+                        help="RANSAC 内点的最大残差, 单位米 (默认 correct_kml_fit.DEFAULT_RESIDUAL_THRESHOLD_M)")
+    parser.add_argument('--cache-dir', default=None, help="拟合结果缓存目录 (默认脚本目录下的 transform_cache)")
+    parser.add_argument('--no-cache', action='store_true', help="不读取也不保存拟合缓存")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help="进程数 (默认 CPU 核心数)")
+    parser.add_argument('--streaming', action='store_true', help="使用流式模式处理 (适合超大文件)")
+    parser.add_argument('--compact', action='store_true',
+                        help=f"紧凑输出: 坐标保留 {COMPACT_DECIMALS} 位小数 (约 1 厘米) 且不缩进")
+    parser.add_argument('--decimals', type=int, default=None, help="坐标保留的小数位数 (默认完整精度)")
+    parser.add_argument('--minify', action='store_true', help="输出不缩进, 去掉标签之间的空白")
+    args = parser.parse_args(argv)
+
+    input_files = collect_input_files(args.inputs)
+    if not input_files:
+        print("未找到任何 KML/KMZ 文件。")
+        return 1
+
+    try:
+        transform = build_transform(args)
+    except (OSError, ValueError) as e:
+        # 控制点文件不存在 / 格式错误, 或控制点不足以拟合变换
+        print(f"错误: {e}")
+        return 1
+    workers = args.workers or os.cpu_count() or 1
+    print(f"共 {len(input_files)} 个文件, 使用 {workers} 个进程, 输出到 '{args.output_dir}'")
+    decimals = args.decimals
+    if args.compact and decimals is None:
+        decimals = COMPACT_DECIMALS
+    try:
+        results, wall_seconds = run_batch(input_files, args.output_dir, transform, workers, args.streaming,
+                                          decimals, args.minify or args.compact)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 1
+    print_report(results, wall_seconds, workers)
+    return 1 if any(result['error'] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
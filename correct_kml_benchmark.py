@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import lxml
+import numpy as np
+from lxml import etree
+from correct_kml_core import (KML_NAMESPACES, AffineTransform, OffsetTransform, correct_coordinate_elements,
+                              correct_kml)
+from correct_kml_kmz import open_kml_source, open_kml_target
+
+try:
+    import resource # 仅 Unix 可用, 用于读取峰值内存
+except ImportError:
+    resource = None
+
+BENCHMARK_DELTA = (0.000007, -0.000116) # 与 correct_kml_simple 中的默认偏差相同
+BENCHMARK_MATRIX = np.array([[1.0000012, 0.0000021, -0.0002],
+                             [-0.0000008, 0.9999991, 0.0001],
+                             [0.0, 0.0, 1.0]])
+CASES = ('phases-offset', 'phases-affine', 'simple', 'affine', 'streaming')
+
+
+# --- 合成 KML 生成器 ---
+# 生成可控大小的测试文件: Placemark 数量、每条 LineString/Polygon 的顶点数、
+# gx:Track 所占比例、格式错误坐标的比例; 相同的 seed 生成完全相同的文件
+def _random_tuple(rng, malformed_rate):
+    lon = 118.0 + rng.random() * 0.1
+    lat = 24.4 + rng.random() * 0.1
+    if malformed_rate and rng.random() < malformed_rate:
+        return rng.choice((f"{lon:.6f}", f"{lon:.6f},abc,0", f"{lon:.6f},{lat:.6f}x"))
+    return f"{lon:.6f},{lat:.6f},{rng.randint(0, 80)}"
+
+
+def _placemark_kml(rng, index, vertices, gx_share, polygon_share, malformed_rate):
+    if rng.random() < gx_share:
+        whens = "".join(f"<when>2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z</when>" for i in range(vertices))
+        coords = "".join(f"<gx:coord>{118.0 + rng.random() * 0.1:.6f} {24.4 + rng.random() * 0.1:.6f} {rng.randint(0, 80)}</gx:coord>"
+                         for _ in range(vertices))
+        return f"    <Placemark>\n      <name>track {index}</name>\n      <gx:Track>{whens}{coords}</gx:Track>\n    </Placemark>\n"
+
+    tuples = " ".join(_random_tuple(rng, malformed_rate) for _ in range(vertices))
+    if rng.random() < polygon_share:
+        geometry = (f"<Polygon><outerBoundaryIs><LinearRing><coordinates>{tuples}</coordinates>"
+                    f"</LinearRing></outerBoundaryIs></Polygon>")
+    else:
+        geometry = f"<LineString><coordinates>{tuples}</coordinates></LineString>"
+    return f"    <Placemark>\n      <name>placemark {index}</name>\n      {geometry}\n    </Placemark>\n"
+
+
+def generate_kml(output_path, placemarks=1000, vertices=50, gx_share=0.1, polygon_share=0.3,
+                 malformed_rate=0.0, seed=0):
+    """
+    Writes a synthetic KML (or KMZ, by extension) file for benchmarking.
+
+    Args:
+        output_path (str): Path of the .kml or .kmz file to write.
+        placemarks (int, optional): Number of placemarks.
+        vertices (int, optional): Vertices per LineString/Polygon, or gx:coord per gx:Track.
+        gx_share (float, optional): Share of placemarks that are gx:Track.
+        polygon_share (float, optional): Share of the other placemarks that are Polygons.
+        malformed_rate (float, optional): Share of <coordinates> tuples that are malformed.
+        seed (int, optional): Random seed; the same arguments give the same file.
+
+    Returns:
+        int: Size of the written file in bytes.
+    """
+    rng = random.Random(seed)
+    with open_kml_target(output_path) as output_file:
+        output_file.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                           f'<kml xmlns="{KML_NAMESPACES["kml"]}" xmlns:gx="{KML_NAMESPACES["gx"]}">\n'
+                           '  <Document>\n    <name>benchmark</name>\n').encode('utf-8'))
+        for index in range(placemarks):
+            output_file.write(_placemark_kml(rng, index, vertices, gx_share, polygon_share, malformed_rate).encode('utf-8'))
+        output_file.write(b'  </Document>\n</kml>\n')
+    return os.path.getsize(output_path)
+
+
+# --- 基准测试用例 ---
+# 每个用例在新的 (spawn) 进程中运行, 这样峰值内存 (ru_maxrss) 只属于该用例
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024 # macOS 单位是字节, Linux 是 KB
+
+
+def _time_phases(input_path, output_path, transform):
+    """Times parse, transform and serialize separately, the way correct_kml does them."""
+    timings = {}
+    start_time = time.perf_counter()
+    with open_kml_source(input_path) as input_file:
+        tree = etree.parse(input_file, etree.XMLParser(ns_clean=True, recover=True))
+    coord_elements = tree.getroot().xpath('//kml:coordinates | //gx:coord', namespaces=KML_NAMESPACES)
+    timings['parse'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    points, skipped = correct_coordinate_elements(coord_elements, transform)
+    timings['transform'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with open_kml_target(output_path, input_path) as output_file:
+        tree.write(output_file, pretty_print=True, encoding='utf-8', xml_declaration=True)
+    timings['serialize'] = time.perf_counter() - start_time
+    return timings, points, skipped
+
+
+def _run_engine(case, input_path, output_path):
+    """Times one whole call of a correction engine."""
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if case == 'simple':
+            from correct_kml_simple import correct_kml_coordinates
+            correct_kml_coordinates(input_path, output_path, *BENCHMARK_DELTA)
+            counts = None
+        elif case == 'affine':
+            from correct_kml_Affine import correct_kml_coordinates
+            correct_kml_coordinates(input_path, output_path, AffineTransform(BENCHMARK_MATRIX), lambda message: None)
+            counts = None
+        else:
+            counts = correct_kml(input_path, output_path, OffsetTransform(*BENCHMARK_DELTA),
+                                 lambda message: None, streaming=True)
+    return {'total': time.perf_counter() - start_time}, counts
+
+
+def run_case(case, input_path, output_path, repeat=3):
+    """
+    Runs one benchmark case repeat times in the current process and keeps
+    the fastest time of every phase.
+
+    Returns:
+        dict: Machine-readable result of the case.
+    """
+    best = {}
+    points = skipped = None
+    for _ in range(repeat):
+        if case == 'phases-offset':
+            timings, points, skipped = _time_phases(input_path, output_path, OffsetTransform(*BENCHMARK_DELTA))
+        elif case == 'phases-affine':
+            timings, points, skipped = _time_phases(input_path, output_path, AffineTransform(BENCHMARK_MATRIX))
+        else:
+            timings, counts = _run_engine(case, input_path, output_path)
+            if counts is not None:
+                _, points, skipped = counts
+        for phase, seconds in timings.items():
+            best[phase] = min(seconds, best.get(phase, float('inf')))
+    if 'total' not in best:
+        best['total'] = sum(best.values())
+
+    return {
+        'case': case,
+        'seconds': best,
+        'points': points,
+        'skipped': skipped,
+        'points_per_second': points / best['total'] if points and best['total'] > 0 else None,
+        'output_bytes': os.path.getsize(output_path),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _run_case_isolated(case, input_path, output_path, repeat):
+    """Runs run_case in a fresh process so peak RSS is measured per case."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            return executor.submit(run_case, case, input_path, output_path, repeat).result()
+        except Exception as e:
+            return {'case': case, 'error': f"{type(e).__name__}: {e}"}
+
+
+def run_benchmark(input_path, cases=CASES, repeat=3, work_dir=None):
+    """
+    Runs the benchmark cases on input_path.
+
+    Returns:
+        dict: Results with environment information, ready to be dumped as JSON.
+    """
+    work_dir = work_dir or tempfile.mkdtemp(prefix='kml_benchmark_')
+    extension = os.path.splitext(input_path)[1] or '.kml'
+    results = []
+    for case in cases:
+        output_path = os.path.join(work_dir, f"{case}{extension}")
+        result = _run_case_isolated(case, input_path, output_path, repeat)
+        results.append(result)
+        if result.get('error'):
+            print(f"{case:<16} 失败: {result['error']}")
+        else:
+            phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in result['seconds'].items())
+            peak = f"{result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else "未知"
+            print(f"{case:<16} {phases}, 峰值内存 {peak}")
+
+    return {
+        'input': os.path.abspath(input_path),
+        'input_bytes': os.path.getsize(input_path),
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'lxml': lxml.__version__,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+
+# --- 流式与整树输出一致性检查 ---
+# 流式模式的输出应与整树模式逐字节相同 (声明、空元素 <tag/>、结尾换行、根外的注释);
+# 除了输入文件外, 再检查一个包含这些边界情况的小文档
+EDGE_CASE_KML = f"""<?xml version="1.0" encoding="UTF-8"?>
+<!-- before root -->
+<kml xmlns="{KML_NAMESPACES['kml']}" xmlns:gx="{KML_NAMESPACES['gx']}">
+  <Document>
+    <name>edge cases</name>
+    <Folder/>
+    <Folder>
+    </Folder>
+    <!-- comment -->
+    <Placemark id="a&amp;&quot;é">
+      <name/>
+      <description xmlns:x="urn:x" x:a="1"/>
+      <Point><coordinates>118.01,24.41,0</coordinates></Point>
+      <LineString><coordinates></coordinates></LineString>
+      <gx:Track><gx:coord>118.01 24.41 3</gx:coord><gx:coord/></gx:Track>
+    </Placemark>
+    <Folder><Placemark><Point><coordinates/></Point></Placemark></Folder>
+  </Document>
+</kml>
+<!-- after root -->
+"""
+
+
+def _read_output(path):
+    """Returns the KML bytes of an output file (the document inside a KMZ)."""
+    with open_kml_source(path) as file:
+        return file.read()
+
+
+def check_streaming_output(input_path, work_dir):
+    """
+    Corrects input_path and a built-in edge-case document in tree and in
+    streaming mode, with and without minify, and compares the outputs.
+
+    Returns:
+        list: Messages for the combinations whose outputs differ.
+    """
+    edge_case_path = os.path.join(work_dir, 'edge_cases.kml')
+    with open(edge_case_path, 'w', encoding='utf-8') as file:
+        file.write(EDGE_CASE_KML)
+    transform = OffsetTransform(*BENCHMARK_DELTA)
+    mismatches = []
+    for path in (input_path, edge_case_path):
+        extension = os.path.splitext(path)[1] or '.kml'
+        for minify in (False, True):
+            outputs = []
+            for streaming in (False, True):
+                output_path = os.path.join(work_dir, f"check_{'stream' if streaming else 'tree'}{extension}")
+                correct_kml(path, output_path, transform, lambda message: None, streaming=streaming, minify=minify)
+                outputs.append(_read_output(output_path))
+            if outputs[0] != outputs[1]:
+                position = next((i for i, (a, b) in enumerate(zip(*outputs)) if a != b), min(map(len, outputs)))
+                mismatches.append(f"{os.path.basename(path)} ({'minify' if minify else '保留空白'}): "
+                                  f"第 {position} 字节起不同, 整树 {outputs[0][position:position + 40]!r}, "
+                                  f"流式 {outputs[1][position:position + 40]!r}")
+    return mismatches
+
+
+def compare_results(current, baseline, max_regression=0.25):
+    """
+    Compares the total time of every case with a baseline result file.
+
+    Returns:
+        list: Messages for cases that are more than max_regression slower.
+    """
+    baseline_totals = {result['case']: result['seconds']['total']
+                       for result in baseline['results'] if not result.get('error')}
+    regressions = []
+    for result in current['results']:
+        if result.get('error') or result['case'] not in baseline_totals:
+            continue
+        before, after = baseline_totals[result['case']], result['seconds']['total']
+        if before > 0 and (after - before) / before > max_regression:
+            regressions.append(f"{result['case']}: {before:.3f}s -> {after:.3f}s ({(after - before) / before:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KML 修正引擎基准测试 (解析/变换/序列化分阶段计时, 峰值内存)")
+    parser.add_argument('--input', help="使用已有的 KML/KMZ 文件, 不生成合成文件")
+    parser.add_argument('--generate-only', metavar='PATH', help="只生成合成 KML/KMZ 文件到 PATH, 不运行测试")
+    parser.add_argument('--placemarks', type=int, default=5000, help="Placemark 数量 (默认 5000)")
+    parser.add_argument('--vertices', type=int, default=50, help="每条 LineString/Polygon 的顶点数 (默认 50)")
+    parser.add_argument('--gx-share', type=float, default=0.1, help="gx:Track 所占比例 (默认 0.1)")
+    parser.add_argument('--polygon-share', type=float, default=0.3, help="其余 Placemark 中 Polygon 的比例 (默认 0.3)")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="格式错误坐标的比例 (默认 0)")
+    parser.add_argument('--kmz', action='store_true', help="生成 KMZ 而不是 KML")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES), help="要运行的用例 (默认全部)")
+    parser.add_argument('--repeat', type=int, default=3, help="每个用例重复次数, 取最快的一次 (默认 3)")
+    parser.add_argument('--json', metavar='PATH', help="把结果写入 JSON 文件")
+    parser.add_argument('--baseline', metavar='PATH', help="与之前的 JSON 结果比较, 变慢超过阈值时返回 1")
+    parser.add_argument('--max-regression', type=float, default=0.25, help="允许变慢的比例 (默认 0.25)")
+    parser.add_argument('--check-output', action='store_true',
+                        help="只检查流式模式与整树模式的输出是否逐字节相同, 不运行计时; 不同时返回 1")
+    args = parser.parse_args(argv)
+
+    generation = dict(placemarks=args.placemarks, vertices=args.vertices, gx_share=args.gx_share,
+                      polygon_share=args.polygon_share, malformed_rate=args.malformed_rate, seed=args.seed)
+    if args.generate_only:
+        size = generate_kml(args.generate_only, **generation)
+        print(f"已生成 '{args.generate_only}' ({size / 1e6:.2f} MB)")
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix='kml_benchmark_') as work_dir:
+        input_path = args.input
+        if not input_path:
+            input_path = os.path.join(work_dir, 'synthetic.kmz' if args.kmz else 'synthetic.kml')
+            size = generate_kml(input_path, **generation)
+            print(f"已生成合成文件 ({size / 1e6:.2f} MB): {generation}")
+        if args.check_output:
+            mismatches = check_streaming_output(input_path, work_dir)
+            for message in mismatches:
+                print(f"输出不一致: {message}")
+            print("流式与整树输出逐字节相同" if not mismatches else f"共 {len(mismatches)} 处不一致")
+            return 1 if mismatches else 0
+        report = run_benchmark(input_path, args.cases, args.repeat, work_dir)
+        report['generation'] = None if args.input else generation
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"结果已写入 '{args.json}'")
+
+    status = 1 if any(result.get('error') for result in report['results']) else 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare_results(report, json.load(file), args.max_regression)
+        for message in regressions:
+            print(f"性能回退: {message}")
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from itertools import repeat
+from lxml import etree
+import numpy as np
+from correct_kml_stream import GX_COORD_TAG, stream_correct_kml
+from correct_kml_kmz import open_kml_source, open_kml_target
+
+# Define KML and Google Extension (gx) namespaces
+KML_NAMESPACES = {
+    'kml': 'http://www.opengis.net/kml/2.2',
+    'gx': 'http://www.google.com/kml/ext/2.2' # Google Extension namespace
+}
+
+COMPACT_DECIMALS = 7 # 紧凑输出的默认小数位数, 约 1 厘米
+
+
+# --- 坐标变换 ---
+# 每个变换都是一个可调用对象: transform(points) -> corrected_points
+# points 是 (N, 2) 的 float64 数组 (经度, 纬度), 一次调用处理整批坐标点
+# 只使用逐元素运算 (不用矩阵乘法), 这样每个点的结果与批次大小无关,
+# 分块/并行/流式处理得到的输出与一次性处理逐字节相同
+class OffsetTransform:
+    """Constant offset: (lon + delta_lon, lat + delta_lat)."""
+
+    def __init__(self, delta_lon, delta_lat):
+        self.delta = np.array([delta_lon, delta_lat], dtype=np.float64)
+
+    def __call__(self, points):
+        return points + self.delta
+
+
+class ProjectiveTransform:
+    """
+    Projective (homography) transform given by a 3x3 homogeneous matrix.
+    matrix may be a plain array or any object with a .params attribute
+    (e.g. a skimage transform).
+    """
+
+    def __init__(self, matrix):
+        self.params = np.asarray(getattr(matrix, 'params', matrix), dtype=np.float64)
+        if self.params.shape != (3, 3):
+            raise ValueError(f"变换矩阵必须是 3x3, 实际为 {self.params.shape}")
+
+    def _apply_matrix(self, points, rows):
+        x = points[:, 0]
+        y = points[:, 1]
+        result = np.empty((points.shape[0], rows), dtype=np.float64)
+        for row in range(rows):
+            m0, m1, m2 = self.params[row]
+            result[:, row] = m0 * x + m1 * y + m2
+        return result
+
+    def __call__(self, points):
+        result = self._apply_matrix(points, 3)
+        # 与 skimage 相同: 避免除以 0
+        divisor = result[:, 2:3]
+        divisor = np.where(divisor == 0, np.finfo(np.float64).eps, divisor)
+        return result[:, :2] / divisor
+
+
+class AffineTransform(ProjectiveTransform):
+    """Affine transform given by a 3x3 homogeneous matrix (last row 0, 0, 1)."""
+
+    def __call__(self, points):
+        return self._apply_matrix(points, 2)
+
+
+class PolynomialTransform:
+    """
+    2nd-order polynomial transform:
+        lon' = a0 + a1*x + a2*y + a3*x^2 + a4*x*y + a5*y^2
+        lat' = b0 + b1*x + b2*y + b3*x^2 + b4*x*y + b5*y^2
+    params is a (2, 6) array [[a0..a5], [b0..b5]], the same layout as
+    skimage.transform.PolynomialTransform with order=2.
+    """
+
+    def __init__(self, params):
+        self.params = np.asarray(getattr(params, 'params', params), dtype=np.float64)
+        if self.params.shape != (2, 6):
+            raise ValueError(f"二次多项式参数必须是 2x6, 实际为 {self.params.shape}")
+
+    def __call__(self, points):
+        x = points[:, 0]
+        y = points[:, 1]
+        terms = (x, y, x * x, x * y, y * y)
+        result = np.empty_like(points, dtype=np.float64)
+        for row in range(2):
+            coefficients = self.params[row]
+            value = np.full_like(x, coefficients[0], dtype=np.float64)
+            for coefficient, term in zip(coefficients[1:], terms):
+                value += coefficient * term
+            result[:, row] = value
+        return result
+
+
+# --- <coordinates> 文本的批量解析与格式化 ---
+# 逐个坐标组 split(',') + float() 是 Python 层面的循环; 这里整段文本一次切分,
+# 由 numpy 在 C 层把所有数字转换成 float64 (与 float() 的解析规则相同)
+def _parse_coordinate_tuples(tuples_str):
+    """
+    Per-tuple fallback with exactly the rules of the original loop: a tuple
+    needs at least lon,lat; the third component is kept as the raw altitude
+    string and anything after it is dropped.
+    """
+    values = []
+    alt_tokens = []
+    skipped_count = 0
+    for coord_tuple_str in tuples_str:
+        coords = coord_tuple_str.split(',')
+        if len(coords) < 2: # Must have at least longitude and latitude
+            skipped_count += 1
+            continue
+        try:
+            lon = float(coords[0])
+            lat = float(coords[1])
+        except ValueError:
+            skipped_count += 1
+            continue
+        alt_token = coords[2] if len(coords) > 2 else None
+        try:
+            alt = float(alt_token) if alt_token is not None else np.nan
+        except ValueError:
+            alt = np.nan # 高度不是数字时原样保留文本, 数值记为 NaN
+        values.append((lon, lat, alt))
+        alt_tokens.append(alt_token)
+
+    coords_array = np.array(values, dtype=np.float64).reshape(-1, 3)
+    has_alt = np.array([alt_token is not None for alt_token in alt_tokens], dtype=bool)
+    if not has_alt.any():
+        alt_tokens = None
+    return coords_array, has_alt, alt_tokens, skipped_count
+
+
+def parse_coordinates(text):
+    """
+    Parses the text of a <coordinates> element ("lon,lat[,alt] ..." separated
+    by whitespace) in bulk.
+
+    Args:
+        text (str): The element text.
+
+    Returns:
+        tuple: (coords, has_alt, alt_tokens, skipped_count)
+            coords: (N, 3) float64 array of lon, lat, alt (alt is NaN when absent).
+            has_alt: (N,) bool array, True where the tuple had an altitude.
+            alt_tokens: None if no tuple had an altitude, otherwise a list of the
+                        original altitude strings (None where absent), so the
+                        altitude is written back unchanged.
+            skipped_count: Number of malformed tuples that were skipped.
+    """
+    tuples_str = text.split()
+    tuple_count = len(tuples_str)
+    if tuple_count == 0:
+        return np.empty((0, 3), dtype=np.float64), np.zeros(0, dtype=bool), None, 0
+
+    # 快速路径: 所有坐标组都是 lon,lat 或都是 lon,lat,alt
+    tokens = ",".join(tuples_str).split(',')
+    width = len(tokens) // tuple_count
+    if width in (2, 3) and len(tokens) == width * tuple_count \
+            and set(map(str.count, tuples_str, repeat(','))) == {width - 1}:
+        try:
+            values = np.array(tokens, dtype=np.float64).reshape(tuple_count, width)
+        except ValueError:
+            values = None # 有无法解析的数字, 交给逐个坐标组的路径处理 (计数与原逻辑一致)
+        if values is not None:
+            coords = np.full((tuple_count, 3), np.nan, dtype=np.float64)
+            coords[:, :width] = values
+            has_alt = np.full(tuple_count, width == 3, dtype=bool)
+            alt_tokens = tokens[2::3] if width == 3 else None
+            return coords, has_alt, alt_tokens, 0
+
+    return _parse_coordinate_tuples(tuples_str)
+
+
+def _pair_format(decimals, separator=","):
+    """Format string for one lon/lat pair: full repr precision, or fixed decimals."""
+    if decimals is None:
+        return "{}" + separator + "{}"
+    return f"{{:.{decimals}f}}{separator}{{:.{decimals}f}}"
+
+
+def format_coordinates(lons, lats, has_alt, alt_tokens, decimals=None):
+    """
+    Formats corrected points back into <coordinates> text. Longitude and
+    latitude use full repr precision, or a fixed number of decimals
+    (7 decimals is about 1 cm); altitudes are the original strings.
+    """
+    pair_format = _pair_format(decimals)
+    if alt_tokens is None:
+        return " ".join(map(pair_format.format, lons, lats))
+    if has_alt.all():
+        return " ".join(map((pair_format + ",{}").format, lons, lats, alt_tokens))
+    alt_parts = ["," + alt_token if alt_token is not None else "" for alt_token in alt_tokens]
+    return " ".join(map((pair_format + "{}").format, lons, lats, alt_parts))
+
+
+# --- 坐标元素的批量修正 ---
+# 先把所有点收集到一个连续的 float64 数组, 调用一次变换, 再按偏移量写回各元素
+def _collect_coordinate_points(texts, is_gx_flags, count_blank=True):
+    """
+    First pass: parses every <coordinates>/<gx:coord> text and gathers all
+    lon/lat pairs into one contiguous (N, 2) float64 array. If count_blank is
+    False, whitespace-only <coordinates> texts are left alone without being
+    counted as skipped.
+
+    Returns:
+        tuple: (points, records, skipped_element_count) where each record is
+               (index, start_offset, point_count, has_alt, alt_tokens).
+               For <gx:coord>, alt_tokens is the altitude string.
+    """
+    chunks = [] # (n, 2) 数组, 按顺序拼接后即为所有点
+    gx_points = [] # 连续的 <gx:coord> 点先放在列表里, 再作为一个块加入 chunks
+    records = []
+    point_count = 0
+    skipped_element_count = 0
+
+    for index, (original_text, is_gx) in enumerate(zip(texts, is_gx_flags)):
+        if original_text is None or not original_text.strip(): # Skip empty or whitespace-only elements
+            # correct_kml_simple 原来只把空元素计入跳过数, 只有空白的 <coordinates> 不计入
+            # (空文本 '' 来自并行模式, 对应空元素)
+            if count_blank or is_gx or not original_text:
+                skipped_element_count += 1
+            continue
+
+        if not is_gx:
+            # <coordinates> format: lon,lat[,alt] space-separated
+            coords, has_alt, alt_tokens, skipped_count = parse_coordinates(original_text)
+            skipped_element_count += skipped_count
+            if len(coords) == 0:
+                continue
+            if gx_points:
+                chunks.append(np.array(gx_points, dtype=np.float64))
+                gx_points = []
+            chunks.append(coords[:, :2])
+            records.append((index, point_count, len(coords), has_alt, alt_tokens))
+            point_count += len(coords)
+
+        else:
+            # <gx:coord> format: lon lat alt space-separated
+            parts = original_text.split()
+            if len(parts) != 3:
+                skipped_element_count += 1
+                continue
+            try:
+                lon = float(parts[0])
+                lat = float(parts[1])
+            except ValueError:
+                skipped_element_count += 1
+                continue
+            gx_points.append((lon, lat))
+            records.append((index, point_count, 1, None, parts[2])) # Keep altitude as string
+            point_count += 1
+
+    if gx_points:
+        chunks.append(np.array(gx_points, dtype=np.float64))
+    points = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.float64)
+    return points, records, skipped_element_count
+
+
+def correct_coordinate_texts(texts, is_gx_flags, transform, decimals=None, count_blank=True):
+    """
+    Corrects the texts of <coordinates> and <gx:coord> elements with one
+    batched call of transform. Works on plain strings so it can also run in
+    worker processes.
+
+    Args:
+        texts (list): Element texts (None for empty elements).
+        is_gx_flags (list): True where the text belongs to a <gx:coord> element.
+        transform (callable): Maps an (N, 2) lon/lat array to an (N, 2) array.
+        decimals (int, optional): Fixed number of decimals for lon/lat. Defaults to
+                                  None (full repr precision).
+        count_blank (bool, optional): If False, whitespace-only <coordinates> texts are
+                                      not counted as skipped. Defaults to True.
+
+    Returns:
+        tuple: (new_texts, corrected_point_count, skipped_element_count) where
+               new_texts[i] is None if text i has to stay unchanged.
+    """
+    new_texts = [None] * len(texts)
+    points, records, skipped_element_count = _collect_coordinate_points(texts, is_gx_flags, count_blank)
+    if len(points) == 0:
+        return new_texts, 0, skipped_element_count
+
+    corrected = np.asarray(transform(points), dtype=np.float64)
+    corrected_lons = corrected[:, 0].tolist()
+    corrected_lats = corrected[:, 1].tolist()
+
+    # 第二遍: 按偏移量生成修正后的文本
+    gx_format = _pair_format(decimals, " ") + " {}"
+    for index, start_offset, point_count, has_alt, alt_tokens in records:
+        if is_gx_flags[index]:
+            new_texts[index] = gx_format.format(corrected_lons[start_offset], corrected_lats[start_offset], alt_tokens)
+        else:
+            end_offset = start_offset + point_count
+            new_texts[index] = format_coordinates(corrected_lons[start_offset:end_offset],
+                                                  corrected_lats[start_offset:end_offset],
+                                                  has_alt, alt_tokens, decimals)
+
+    return new_texts, len(points), skipped_element_count
+
+
+def correct_coordinate_elements(coord_elements, transform, decimals=None, count_blank=True):
+    """
+    Corrects <coordinates> and <gx:coord> elements in place with one batched
+    call of transform. Empty elements, malformed tuples and malformed
+    <gx:coord> values are left untouched and counted as skipped.
+
+    Args:
+        coord_elements (list): The coordinate elements to correct.
+        transform (callable): Maps an (N, 2) lon/lat array to an (N, 2) array.
+        decimals (int, optional): Fixed number of decimals for lon/lat. Defaults to
+                                  None (full repr precision).
+        count_blank (bool, optional): If False, whitespace-only <coordinates> elements are
+                                      not counted as skipped. Defaults to True.
+
+    Returns:
+        tuple: (corrected_point_count, skipped_element_count)
+    """
+    texts = [element.text for element in coord_elements]
+    is_gx_flags = [element.tag == GX_COORD_TAG for element in coord_elements]
+    new_texts, corrected_point_count, skipped_element_count = correct_coordinate_texts(texts, is_gx_flags, transform, decimals,
+                                                                                        count_blank)
+    for element, new_text in zip(coord_elements, new_texts):
+        if new_text is not None:
+            element.text = new_text
+    return corrected_point_count, skipped_element_count
+
+
+def _report_output_size(update_status, input_kml_path, output_kml_path, write_seconds, stage="写出"):
+    """Reports the output size compared with the input and the write throughput."""
+    if not (isinstance(input_kml_path, str) and isinstance(output_kml_path, str)):
+        return
+    input_size = os.path.getsize(input_kml_path)
+    output_size = os.path.getsize(output_kml_path)
+    change = (output_size - input_size) / input_size * 100 if input_size else 0.0
+    throughput = output_size / write_seconds / 1e6 if write_seconds > 0 else 0.0
+    update_status(f"输出文件大小 {output_size / 1e6:.2f} MB (输入 {input_size / 1e6:.2f} MB, 变化 {change:+.1f}%), "
+                  f"{stage}耗时 {write_seconds:.2f}s, {throughput:.1f} MB/s")
+
+
+# --- 核心修正函数 ---
+# 读取文件, 应用变换, 保存文件; 不处理文件对话框, 异常直接抛给调用者
+def correct_kml(input_kml_path, output_kml_path, transform, status_callback=None, streaming=False, workers=1,
+                decimals=None, minify=False, count_blank=True):
+    """
+    Applies transform to all <coordinates> and <gx:coord> tags of a KML file
+    and saves the result to output_kml_path.
+
+    Args:
+        input_kml_path (str): Path to the input KML or KMZ file.
+        output_kml_path (str): Path to save the corrected output KML or KMZ file. When both
+                               are KMZ, the other archive entries are copied unchanged.
+        transform (callable): Batched transform, e.g. OffsetTransform, AffineTransform,
+                              ProjectiveTransform or PolynomialTransform.
+        status_callback (function, optional): A function to call with status messages.
+                                              Defaults to None (messages will be printed).
+        streaming (bool, optional): If True, the file is processed with iterparse and written
+                                    incrementally so memory stays flat for multi-GB files.
+        workers (int, optional): If greater than 1, the coordinate elements are split into
+                                 chunks and corrected on that many processes (output is
+                                 byte-identical). Not used in streaming mode.
+        decimals (int, optional): Fixed number of decimals for the corrected lon/lat
+                                  (7 is about 1 cm). Defaults to None (full repr precision).
+        minify (bool, optional): If True, whitespace-only text between tags is dropped and
+                                 the output is written without indentation.
+        count_blank (bool, optional): If False, whitespace-only <coordinates> elements are
+                                      not counted as skipped (as correct_kml_simple did).
+                                      Defaults to True.
+
+    Returns:
+        tuple: (coord_element_count, corrected_point_count, skipped_element_count)
+
+    Raises:
+        FileNotFoundError: If the input file is not found.
+        etree.XMLSyntaxError: If the input file is not valid XML/KML.
+    """
+    def update_status(message):
+        if status_callback:
+            status_callback(message)
+        else:
+            print(message)
+
+    if streaming:
+        update_status(f"使用流式模式处理, 边解析边写入 '{output_kml_path}'")
+        start_time = time.perf_counter()
+        # 先打开输出: 原地修正时输出在输入关闭之后才替换原文件
+        with open_kml_target(output_kml_path, input_kml_path) as output_file, \
+                open_kml_source(input_kml_path) as input_file:
+            coord_element_count, corrected_point_count, skipped_element_count = stream_correct_kml(
+                input_file, output_file,
+                lambda elements: correct_coordinate_elements(elements, transform, decimals, count_blank),
+                update_status, minify=minify)
+        update_status(f"修正处理完成。成功修正 {corrected_point_count} 个坐标点。跳过 {skipped_element_count} 个格式错误或无法解析的坐标元素/点。")
+        # 流式模式下解析和写出交替进行, 耗时为整个处理过程
+        _report_output_size(update_status, input_kml_path, output_kml_path, time.perf_counter() - start_time, "处理")
+        return coord_element_count, corrected_point_count, skipped_element_count
+
+    # recover=True helps in parsing slightly malformed XML if necessary
+    # remove_blank_text 丢弃标签之间只有空白的文本, 压缩输出时不保留原文件的缩进
+    parser = etree.XMLParser(ns_clean=True, recover=True, remove_blank_text=minify)
+    with open_kml_source(input_kml_path) as input_file:
+        tree = etree.parse(input_file, parser)
+    root = tree.getroot()
+
+    # Find all <coordinates> (standard KML) and <gx:coord> (Google Extension) elements
+    all_coord_elements = root.xpath('//kml:coordinates | //gx:coord', namespaces=KML_NAMESPACES)
+    update_status(f"找到 {len(all_coord_elements)} 个坐标元素 (<coordinates> 或 <gx:coord>)。")
+
+    if workers > 1:
+        # 延迟导入: correct_kml_parallel 依赖本模块
+        from correct_kml_parallel import parallel_correct_coordinate_elements
+        update_status(f"使用 {workers} 个进程并行修正坐标...")
+        corrected_point_count, skipped_element_count = parallel_correct_coordinate_elements(all_coord_elements, transform, workers,
+                                                                                         decimals=decimals,
+                                                                                         count_blank=count_blank)
+    else:
+        corrected_point_count, skipped_element_count = correct_coordinate_elements(all_coord_elements, transform, decimals,
+                                                                                   count_blank)
+    update_status(f"修正处理完成。成功修正 {corrected_point_count} 个坐标点。跳过 {skipped_element_count} 个格式错误或无法解析的坐标元素/点。")
+
+    update_status(f"正在保存文件到 '{output_kml_path}'")
+    start_time = time.perf_counter()
+    with open_kml_target(output_kml_path, input_kml_path) as output_file:
+        tree.write(output_file, pretty_print=not minify, encoding='utf-8', xml_declaration=True)
+    _report_output_size(update_status, input_kml_path, output_kml_path, time.perf_counter() - start_time)
+    return len(all_coord_elements), corrected_point_count, skipped_element_count
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import hashlib
+import json
+import os
+
+import numpy as np
+from skimage import transform
+from skimage.measure import ransac
+from correct_kml_core import AffineTransform, ProjectiveTransform, PolynomialTransform
+
+# --- 变换选择 ---
+# skimage 负责根据参考点估计变换参数, 实际修正交给 correct_kml_core 中的批量变换
+TRANSFORM_TYPES = {
+    # 名称: (skimage estimate_transform 参数, estimate 额外参数, 最少参考点数, 显示名称)
+    'affine': ('affine', {}, 3, "仿射变换"),
+    'projective': ('projective', {}, 4, "投影变换"),
+    'polynomial': ('polynomial', {'order': 2}, 6, "二次多项式变换"),
+}
+
+_SKIMAGE_CLASSES = {
+    'affine': transform.AffineTransform,
+    'projective': transform.ProjectiveTransform,
+    'polynomial': transform.PolynomialTransform,
+}
+
+_CORE_CLASSES = {
+    'affine': AffineTransform,
+    'projective': ProjectiveTransform,
+    'polynomial': PolynomialTransform,
+}
+
+METRES_PER_DEGREE = 111320.0 # 赤道上 1 度经度 / 任意位置 1 度纬度约等于的米数
+DEFAULT_RESIDUAL_THRESHOLD_M = 5.0
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transform_cache')
+
+
+def to_core_transform(tform):
+    """
+    Converts a fitted skimage transform to the matching batched transform of
+    correct_kml_core. Other callables are returned unchanged.
+    """
+    if isinstance(tform, transform.AffineTransform):
+        return AffineTransform(tform)
+    if isinstance(tform, transform.ProjectiveTransform):
+        return ProjectiveTransform(tform)
+    if isinstance(tform, transform.PolynomialTransform):
+        return PolynomialTransform(tform)
+    return tform
+
+
+def load_control_points(csv_path):
+    """
+    Reads control points from a CSV file with the columns
+    wrong_lon, wrong_lat, true_lon, true_lat. A header row is optional.
+
+    Returns:
+        tuple: (incorrect_points, correct_points) as (N, 2) arrays.
+    """
+    incorrect_points = []
+    correct_points = []
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        for row_number, row in enumerate(csv.reader(file), 1):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            try:
+                values = [float(cell) for cell in row[:4]]
+            except ValueError:
+                if row_number == 1:
+                    continue # Header row
+                raise ValueError(f"控制点文件第 {row_number} 行不是有效的数字: {row}")
+            if len(values) != 4:
+                raise ValueError(f"控制点文件第 {row_number} 行需要 4 列 (错误经度, 错误纬度, 正确经度, 正确纬度): {row}")
+            incorrect_points.append(values[:2])
+            correct_points.append(values[2:])
+    return np.array(incorrect_points).reshape(-1, 2), np.array(correct_points).reshape(-1, 2)
+
+
+# --- 稳健拟合 (RANSAC) 与残差 ---
+def residuals_in_metres(predicted_points, correct_points):
+    """
+    Distance in metres between predicted and true points (equirectangular
+    approximation, accurate enough for residuals of a few hundred metres).
+    """
+    delta = np.asarray(predicted_points) - np.asarray(correct_points)
+    lat_scale = np.cos(np.radians(np.asarray(correct_points)[:, 1]))
+    return np.hypot(delta[:, 0] * lat_scale, delta[:, 1]) * METRES_PER_DEGREE
+
+
+def _uncentre_params(kind, params, centre):
+    """
+    Converts params fitted on coordinates shifted by -centre (both input and
+    output) back to params for raw coordinates: raw(p) = fitted(p - centre) + centre.
+    """
+    cx, cy = centre
+    if kind != 'polynomial':
+        shift = np.array([[1.0, 0.0, cx], [0.0, 1.0, cy], [0.0, 0.0, 1.0]])
+        unshift = np.array([[1.0, 0.0, -cx], [0.0, 1.0, -cy], [0.0, 0.0, 1.0]])
+        return shift @ params @ unshift
+
+    # 二次多项式 [1, u, v, u², uv, v²] (u = x - cx, v = y - cy) 展开为 [1, x, y, x², xy, y²]
+    raw = np.array(params, dtype=np.float64)
+    for row, offset in zip(raw, centre):
+        a0, a1, a2, a3, a4, a5 = row
+        row[0] = a0 - a1 * cx - a2 * cy + a3 * cx * cx + a4 * cx * cy + a5 * cy * cy + offset
+        row[1] = a1 - 2 * a3 * cx - a4 * cy
+        row[2] = a2 - a4 * cx - 2 * a5 * cy
+    return raw
+
+
+def fit_transform(incorrect_points, correct_points, kind='affine', use_ransac=True,
+                  residual_threshold_m=DEFAULT_RESIDUAL_THRESHOLD_M, max_trials=1000):
+    """
+    Fits a transform that maps incorrect_points onto correct_points. With
+    use_ransac and more points than the minimum, RANSAC rejects outliers
+    (e.g. mistyped control points) whose residual exceeds residual_threshold_m.
+
+    Returns:
+        tuple: (core_transform, report) where report is a JSON-serializable dict
+               with the kind, params, inlier mask, per-point residuals in metres
+               and the RMS of the inlier residuals.
+
+    Raises:
+        ValueError: If there are too few points or the transform cannot be estimated.
+    """
+    estimate_name, estimate_kwargs, min_points, display_name = TRANSFORM_TYPES[kind]
+    incorrect_points = np.asarray(incorrect_points, dtype=np.float64)
+    correct_points = np.asarray(correct_points, dtype=np.float64)
+    if len(incorrect_points) < min_points:
+        raise ValueError(f"计算{display_name}至少需要 {min_points} 对控制点, 实际只有 {len(incorrect_points)} 对。")
+
+    # 经纬度数值大 (例如 118, 24), 直接拟合二次多项式时矩阵病态, 误差可达几十米;
+    # 先以控制点中心为原点拟合, 最后再换算回原始坐标的参数
+    centre = incorrect_points.mean(axis=0)
+    centred_incorrect = incorrect_points - centre
+    centred_correct = correct_points - centre
+
+    inliers = np.ones(len(incorrect_points), dtype=bool)
+    if use_ransac and len(incorrect_points) > min_points:
+        # RANSAC 的残差单位是度; 按纬度方向换算阈值 (经度方向会稍宽松)
+        model, ransac_inliers = ransac((centred_incorrect, centred_correct), _SKIMAGE_CLASSES[kind],
+                                       min_samples=min_points,
+                                       residual_threshold=residual_threshold_m / METRES_PER_DEGREE,
+                                       max_trials=max_trials, rng=0)
+        if model is not None and ransac_inliers is not None and ransac_inliers.sum() >= min_points:
+            inliers = np.asarray(ransac_inliers, dtype=bool)
+
+    # 用全部内点重新估计最终变换
+    fitted_transform = transform.estimate_transform(estimate_name, centred_incorrect[inliers],
+                                                    centred_correct[inliers], **estimate_kwargs)
+    if fitted_transform is None or not np.all(np.isfinite(fitted_transform.params)):
+        raise ValueError(f"无法计算{display_name}。请检查控制点是否共线或数据是否存在其他问题。")
+
+    params = _uncentre_params(kind, fitted_transform.params, centre)
+    core_transform = _CORE_CLASSES[kind](params)
+    residuals = residuals_in_metres(core_transform(incorrect_points), correct_points)
+    report = {
+        'kind': kind,
+        'params': params.tolist(),
+        'inliers': inliers.tolist(),
+        'residuals_m': residuals.tolist(),
+        'rms_m': float(np.sqrt(np.mean(residuals[inliers] ** 2))),
+    }
+    return core_transform, report
+
+
+def format_residual_report(report, incorrect_points):
+    """Returns the residual report as printable lines."""
+    residuals = report['residuals_m']
+    inliers = report['inliers']
+    lines = [f"{'#':>4} {'错误经度':>14} {'错误纬度':>14} {'残差(米)':>10}  状态"]
+    for index, ((lon, lat), residual, inlier) in enumerate(zip(incorrect_points, residuals, inliers), 1):
+        lines.append(f"{index:>4} {lon:>14.7f} {lat:>14.7f} {residual:>10.3f}  {'内点' if inlier else '剔除'}")
+    lines.append(f"内点 {sum(inliers)}/{len(inliers)}, 内点残差 RMS: {report['rms_m']:.3f} 米, "
+                 f"最大: {max(r for r, inlier in zip(residuals, inliers) if inlier):.3f} 米")
+    return lines
+
+
+# --- 变换缓存 ---
+# 以控制点和拟合参数的哈希值作为文件名, 保存拟合好的矩阵; 后续批处理直接加载, 无需重新估计
+def control_points_key(incorrect_points, correct_points, kind, use_ransac, residual_threshold_m):
+    digest = hashlib.sha256()
+    digest.update(f"{kind}|{use_ransac}|{residual_threshold_m!r}|".encode('utf-8'))
+    digest.update(np.ascontiguousarray(incorrect_points, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(correct_points, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def load_cached_fit(cache_dir, key):
+    """Returns (core_transform, report) from the cache, or None if not cached."""
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, encoding='utf-8') as file:
+        report = json.load(file)
+    return _CORE_CLASSES[report['kind']](np.array(report['params'])), report
+
+
+def save_cached_fit(cache_dir, key, report):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, f"{key}.json"), 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=1)
+
+
+def fit_transform_cached(incorrect_points, correct_points, kind='affine', use_ransac=True,
+                         residual_threshold_m=DEFAULT_RESIDUAL_THRESHOLD_M, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Like fit_transform, but loads the result from cache_dir when the same
+    control points were fitted before, and saves new fits there.
+
+    Returns:
+        tuple: (core_transform, report, from_cache)
+    """
+    key = control_points_key(incorrect_points, correct_points, kind, use_ransac, residual_threshold_m)
+    cached = load_cached_fit(cache_dir, key) if cache_dir else None
+    if cached is not None:
+        return cached[0], cached[1], True
+
+    core_transform, report = fit_transform(incorrect_points, correct_points, kind, use_ransac, residual_threshold_m)
+    if cache_dir:
+        save_cached_fit(cache_dir, key, report)
+    return core_transform, report, False
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import os
+import struct
+import zipfile
+from contextlib import contextmanager
+
+DEFAULT_KML_NAME = 'doc.kml'
+_LOCAL_HEADER_SIZE = 30 # ZIP 本地文件头的固定部分长度
+_DATA_DESCRIPTOR_FLAG = 0x08
+_ZIP64_EXTRA_ID = 0x0001
+# _copy_entry_raw 直接使用的 ZipFile 内部属性 (与 ZipFile.write 写入条目时相同), 在 CPython 3.11 上核对过;
+# 其他版本缺少这些属性时退回解压后用 writestr 重新压缩写入
+_ZIPFILE_INTERNALS = ('fp', 'filelist', 'NameToInfo', 'start_dir')
+
+
+# --- KMZ (zip 压缩的 KML) 读写 ---
+# 不解压到临时目录: 主 KML 直接以流的方式从 zip 中读出交给解析器, 修正结果直接写进新的 zip;
+# 其余条目 (图标、叠加图片等) 按原始压缩字节复制, 不解压也不重新压缩
+def is_kmz(path):
+    return isinstance(path, str) and path.lower().endswith('.kmz')
+
+
+def find_main_kml(kmz_file):
+    """
+    Returns the name of the main KML document inside an open ZipFile: the
+    first .kml entry, as defined by the KMZ specification.
+    """
+    for name in kmz_file.namelist():
+        if name.lower().endswith('.kml'):
+            return name
+    raise ValueError("KMZ 文件中没有找到 .kml 文档")
+
+
+@contextmanager
+def open_kml_source(input_path):
+    """
+    Opens the KML document for reading as a binary stream. For a .kmz file
+    the main KML entry is read straight out of the archive.
+    """
+    if not is_kmz(input_path):
+        with open(input_path, 'rb') as input_file:
+            yield input_file
+        return
+
+    with zipfile.ZipFile(input_path) as kmz_file:
+        with kmz_file.open(find_main_kml(kmz_file)) as input_file:
+            yield input_file
+
+
+def _strip_zip64_extra(extra):
+    """
+    Removes zip64 records (header id 0x0001) from an extra field.
+    ZipInfo.FileHeader() appends its own zip64 record when one is needed, so
+    a copied one would be duplicated.
+    """
+    records = []
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack('<HH', extra[position:position + 4])
+        if header_id != _ZIP64_EXTRA_ID:
+            records.append(extra[position:position + 4 + size])
+        position += 4 + size
+    return b''.join(records) + extra[position:]
+
+
+def _copy_entry_raw(source_file, info, target_zip, source_zip=None):
+    """
+    Copies one entry's compressed bytes unchanged into target_zip.
+    zipfile has no public API for this, so the local header is written the
+    same way ZipFile itself does it (fp / filelist / NameToInfo / start_dir,
+    checked against CPython 3.11). Without these internals the entry is
+    decompressed from source_zip and written again with writestr.
+    """
+    if not all(hasattr(target_zip, name) for name in _ZIPFILE_INTERNALS):
+        target_zip.writestr(copy.copy(info), source_zip.read(info))
+        return
+
+    source_file.seek(info.header_offset)
+    local_header = source_file.read(_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+    source_file.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    target_info = copy.copy(info)
+    target_info.flag_bits &= ~_DATA_DESCRIPTOR_FLAG # 大小和 CRC 已知, 不再需要数据描述符
+    target_info.extra = _strip_zip64_extra(info.extra)
+    target_info.header_offset = target_zip.fp.tell()
+    target_zip.fp.write(target_info.FileHeader())
+
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source_file.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise ValueError(f"KMZ 条目 '{info.filename}' 数据不完整")
+        target_zip.fp.write(chunk)
+        remaining -= len(chunk)
+
+    target_zip.filelist.append(target_info)
+    target_zip.NameToInfo[target_info.filename] = target_info
+    target_zip.start_dir = target_zip.fp.tell()
+
+
+def _is_same_path(path, other_path):
+    return isinstance(path, str) and isinstance(other_path, str) and \
+        os.path.normcase(os.path.realpath(path)) == os.path.normcase(os.path.realpath(other_path))
+
+
+@contextmanager
+def _in_place_target(output_path, input_path):
+    """
+    Yields the path to write the output to. Normally this is output_path
+    itself; when the output is the input (in-place correction) it is a
+    temporary file next to it that replaces the input once writing succeeded,
+    because the input is still being read while the output is written.
+    """
+    if not _is_same_path(output_path, input_path):
+        yield output_path
+        return
+
+    directory, name = os.path.split(os.path.abspath(output_path))
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def open_kml_target(output_path, input_path=None):
+    """
+    Opens the corrected KML document for writing as a binary stream. For a
+    .kmz output the document is compressed straight into the archive and,
+    if input_path is a .kmz too, every other entry of the input (icons,
+    overlays, ...) is copied over without recompression.
+    When output_path is input_path, the input is only replaced after the
+    output is complete; callers must close the input before this context
+    exits (needed on Windows).
+    """
+    if not is_kmz(output_path):
+        # 流式模式边读边写, 原地修正时直接打开 output_path 会清空还没读完的输入
+        with _in_place_target(output_path, input_path) as target_path, open(target_path, 'wb') as output_file:
+            yield output_file
+        return
+
+    kml_name = DEFAULT_KML_NAME
+    source_entries = []
+    source_size = 0
+    if is_kmz(input_path):
+        with zipfile.ZipFile(input_path) as kmz_file:
+            kml_name = find_main_kml(kmz_file)
+            source_size = kmz_file.getinfo(kml_name).file_size
+            source_entries = [info for info in kmz_file.infolist() if info.filename != kml_name]
+    elif input_path is not None:
+        source_size = os.path.getsize(input_path)
+
+    # 输出与输入是同一个文件时, ZipFile(output_path, 'w') 会先清空输入, 其余条目就无法再复制
+    with _in_place_target(output_path, input_path) as target_path, \
+            zipfile.ZipFile(target_path, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+        # 主 KML 必须是第一个条目; 大文件预先使用 zip64, 否则超过 2 GB 时 zipfile 会报错
+        force_zip64 = source_size > zipfile.ZIP64_LIMIT // 2
+        with target_zip.open(kml_name, 'w', force_zip64=force_zip64) as output_file:
+            yield output_file
+
+        if source_entries:
+            with open(input_path, 'rb') as source_file, zipfile.ZipFile(input_path) as source_zip:
+                for info in source_entries:
+                    _copy_entry_raw(source_file, info, target_zip, source_zip)
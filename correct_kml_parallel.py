@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from correct_kml_stream import GX_COORD_TAG
+from correct_kml_core import correct_coordinate_texts
+
+
+# --- 单个大文件的多进程修正 ---
+# 所有坐标元素的文本 (UTF-8) 拼接后放进共享内存, 各工作进程按元素区间读取、解析、变换、格式化,
+# 只把修正后的文本返回; 赋值给元素和序列化仍在主进程完成。
+# 变换只使用逐元素运算, 所以输出与单进程处理逐字节相同
+def _create_shared_array(array):
+    """Copies array into a new shared memory block and returns the block."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+
+def _correct_chunk(shm_names, element_count, start, end, transform, decimals=None, count_blank=True):
+    """
+    Worker: corrects the elements [start, end) whose texts live in shared memory.
+
+    Returns:
+        tuple: (start, new_texts, corrected_point_count, skipped_element_count)
+    """
+    blocks = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    try:
+        text_buffer = blocks[0].buf
+        offsets = np.ndarray((element_count + 1,), dtype=np.int64, buffer=blocks[1].buf)
+        is_gx_flags = np.ndarray((element_count,), dtype=np.bool_, buffer=blocks[2].buf)
+
+        bounds = offsets[start:end + 1].tolist()
+        texts = [bytes(text_buffer[bounds[i]:bounds[i + 1]]).decode('utf-8') for i in range(end - start)]
+        flags = is_gx_flags[start:end].tolist()
+        del text_buffer, offsets, is_gx_flags # 关闭共享内存前必须释放所有视图
+    finally:
+        for block in blocks:
+            block.close()
+
+    new_texts, corrected_point_count, skipped_element_count = correct_coordinate_texts(texts, flags, transform, decimals,
+                                                                                        count_blank)
+    return start, new_texts, corrected_point_count, skipped_element_count
+
+
+def _chunk_bounds(offsets, chunk_count):
+    """Splits the elements into chunk_count ranges of roughly equal text size."""
+    element_count = len(offsets) - 1
+    targets = np.linspace(0, offsets[-1], chunk_count + 1)[1:-1]
+    cuts = np.searchsorted(offsets, targets).tolist()
+    bounds = [0] + [min(max(cut, 0), element_count) for cut in cuts] + [element_count]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def parallel_correct_coordinate_elements(coord_elements, transform, workers=None, chunks_per_worker=4, decimals=None,
+                                         count_blank=True):
+    """
+    Same result as correct_kml_core.correct_coordinate_elements, but tokenizing,
+    transforming and formatting run on a process pool.
+
+    Args:
+        coord_elements (list): The coordinate elements to correct.
+        transform (callable): Batched transform (must be picklable).
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        chunks_per_worker (int, optional): Chunks per worker, for load balancing.
+        decimals (int, optional): Fixed number of decimals for lon/lat. Defaults to
+                                  None (full repr precision).
+        count_blank (bool, optional): If False, whitespace-only <coordinates> elements are
+                                      not counted as skipped. Defaults to True.
+
+    Returns:
+        tuple: (corrected_point_count, skipped_element_count)
+    """
+    workers = workers or os.cpu_count() or 1
+    element_count = len(coord_elements)
+    if element_count == 0:
+        return 0, 0
+
+    encoded_texts = [(element.text or '').encode('utf-8') for element in coord_elements]
+    offsets = np.zeros(element_count + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded_texts], out=offsets[1:])
+    is_gx_flags = np.array([element.tag == GX_COORD_TAG for element in coord_elements], dtype=np.bool_)
+
+    blocks = []
+    try:
+        text_block = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]), 1))
+        blocks.append(text_block)
+        text_block.buf[:offsets[-1]] = b''.join(encoded_texts)
+        del encoded_texts
+        blocks.append(_create_shared_array(offsets))
+        blocks.append(_create_shared_array(is_gx_flags))
+        shm_names = tuple(block.name for block in blocks)
+
+        corrected_point_count = 0
+        skipped_element_count = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_correct_chunk, shm_names, element_count, start, end, transform, decimals, count_blank)
+                for start, end in _chunk_bounds(offsets, workers * chunks_per_worker)
+            ]
+            # 按提交顺序取结果并在主进程中赋值
+            for future in futures:
+                start, new_texts, corrected, skipped = future.result()
+                corrected_point_count += corrected
+                skipped_element_count += skipped
+                for element, new_text in zip(coord_elements[start:start + len(new_texts)], new_texts):
+                    if new_text is not None:
+                        element.text = new_text
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return corrected_point_count, skipped_element_count
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+from lxml import etree
+from correct_kml_kmz import open_kml_target
+
+KML_COORDINATES_TAG = '{http://www.opengis.net/kml/2.2}coordinates'
+GX_COORD_TAG = '{http://www.google.com/kml/ext/2.2}coord'
+
+# 只有这些容器元素会保持打开状态 (写出开始标签, 结束时再写结束标签)
+# 容器下的其他子元素 (Placemark, Style, name ...) 都作为完整子树处理: 修正、写出、释放
+CONTAINER_LOCAL_NAMES = ('kml', 'Document', 'Folder')
+
+# 空元素开始标签中的命名空间声明 (etree.tostring 会把祖先的声明全部重复一遍)
+_START_TAG_PATTERN = re.compile(rb'<([^\s/>]+)((?:\s+xmlns(?::[^\s=]+)?="[^"]*")*)')
+_NAMESPACE_DECLARATION_PATTERN = re.compile(rb'\s+xmlns(?::([^\s=]+))?="([^"]*)"')
+
+
+# --- 流式修正 (iterparse + xmlfile) ---
+# etree.parse 需要把整个文件读进内存, 对几个 GB 的 GPS 轨迹导出文件不可行
+# 这里边解析边写出: 每个容器下的子树结束时立即修正其中的坐标元素、写到输出文件并释放,
+# 所以峰值内存只取决于最大的单个子树 (通常是一个 Placemark), 与文件大小无关
+def _new_namespaces(element):
+    """Returns the namespace declarations introduced by element itself."""
+    parent = element.getparent()
+    inherited = parent.nsmap if parent is not None else {}
+    return {prefix: uri for prefix, uri in element.nsmap.items() if inherited.get(prefix) != uri}
+
+
+def _is_container(element):
+    return etree.QName(element).localname in CONTAINER_LOCAL_NAMES
+
+
+def _unescape_attribute(value):
+    return value.replace('&quot;', '"').replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+
+
+def _write_empty_element(xf, output_file, element):
+    """
+    Writes an element without text or children as <tag/>, like the tree
+    serializer does; xf.element() always writes <tag></tag>. The element is
+    rendered by etree.tostring, minus the xmlns declarations it inherits.
+    """
+    data = etree.tostring(element, encoding='utf-8', xml_declaration=False, with_tail=False)
+    match = _START_TAG_PATTERN.match(data)
+    new_namespaces = _new_namespaces(element)
+    declarations = b''.join(
+        declaration.group(0) for declaration in _NAMESPACE_DECLARATION_PATTERN.finditer(match.group(2))
+        if new_namespaces.get(declaration.group(1) and declaration.group(1).decode('utf-8'), 0)
+        == _unescape_attribute(declaration.group(2).decode('utf-8')))
+    xf.flush()
+    output_file.write(b'<' + match.group(1) + declarations + data[match.end():])
+
+
+def _write_subtree(xf, output_file, element):
+    """
+    Writes a finished subtree through the incremental writer.
+    xf.write(element) would repeat every inherited xmlns declaration on each
+    subtree, so elements are opened through xf.element() instead.
+    """
+    if element.text is None and len(element) == 0:
+        _write_empty_element(xf, output_file, element)
+        return
+    with xf.element(element.tag, dict(element.attrib), nsmap=_new_namespaces(element)):
+        if element.text:
+            xf.write(element.text)
+        for child in element:
+            if isinstance(child.tag, str):
+                _write_subtree(xf, output_file, child)
+            else:
+                xf.write(child, with_tail=False) # Comments / processing instructions
+            if child.tail:
+                xf.write(child.tail)
+
+
+def _open_container(xf, container_state):
+    """
+    Writes the start tag of a container on first use, so that a container
+    that turns out to be empty can still be written as <tag/>.
+    """
+    if container_state[1] is None:
+        container = container_state[0]
+        context = xf.element(container.tag, dict(container.attrib), nsmap=_new_namespaces(container))
+        context.__enter__()
+        container_state[1] = context
+
+
+def _write_pending_text(xf, container_state):
+    """
+    Writes the text that precedes the next node of an open container: the
+    container's own text before its first child, otherwise the tail of the
+    previous child. The previous child is then removed from the tree.
+    """
+    _open_container(xf, container_state)
+    container, pending = container_state[0], container_state[2]
+    if pending is container:
+        if container.text:
+            xf.write(container.text)
+    elif pending is not None:
+        if pending.tail:
+            xf.write(pending.tail)
+        container.remove(pending) # 释放已写出的子树
+    container_state[2] = None
+
+
+def stream_correct_kml(input_kml_path, output_kml_path, correct_elements, status_callback=None, minify=False):
+    """
+    Corrects a KML file with bounded memory using lxml.etree.iterparse and the
+    incremental writer etree.xmlfile. The output is byte-identical to
+    ElementTree.write(encoding='utf-8', xml_declaration=True) of the corrected
+    tree, as long as the tree serializer does not re-indent (minify=True, or
+    input that already has whitespace between its tags).
+
+    Args:
+        input_kml_path (str): Path to the input KML file, or a binary file object.
+        output_kml_path (str): Path to save the corrected output KML file, or a binary file object.
+        correct_elements (function): Called with the list of <coordinates>/<gx:coord>
+                                     elements of every finished subtree. Must correct
+                                     them in place and return
+                                     (corrected_point_count, skipped_element_count).
+        status_callback (function, optional): A function to call with status messages.
+                                              Defaults to None (messages will be printed).
+        minify (bool, optional): If True, whitespace-only text between tags is dropped
+                                 instead of being copied from the input.
+
+    Returns:
+        tuple: (coord_element_count, corrected_point_count, skipped_element_count)
+
+    Raises:
+        FileNotFoundError: If the input file is not found.
+        etree.XMLSyntaxError: If the input file is not valid XML/KML.
+    """
+    def update_status(message):
+        if status_callback:
+            status_callback(message)
+        else:
+            print(message)
+
+    coord_element_count = 0
+    corrected_point_count = 0
+    skipped_element_count = 0
+
+    if isinstance(output_kml_path, str):
+        # 通过 open_kml_target 打开, 输出就是输入时先写临时文件 (必须在输入关闭之后才替换)
+        with open_kml_target(output_kml_path, input_kml_path if isinstance(input_kml_path, str) else None) as output_file:
+            if isinstance(input_kml_path, str):
+                with open(input_kml_path, 'rb') as input_file:
+                    return stream_correct_kml(input_file, output_file, correct_elements, status_callback, minify)
+            return stream_correct_kml(input_kml_path, output_file, correct_elements, status_callback, minify)
+    output_file = output_kml_path
+
+    # 每个打开的容器: [element, xf.element 上下文 (写出开始标签前为 None), 待写出文本的节点]
+    open_containers = []
+    leaf_depth = 0 # > 0 表示当前位于某个待整体写出的子树内部
+
+    # 与 tree.write 相同: 声明中的编码写作 'UTF-8'; 不压缩时 (pretty_print) 文档级节点 (根元素、根外的注释)
+    # 后各有一个换行, xmlfile 不允许在根元素外写文本, 这些换行在 flush 之后直接写入输出文件
+    document_separator = b'' if minify else b'\n'
+    with etree.xmlfile(output_file, encoding='UTF-8') as xf:
+        xf.write_declaration()
+
+        events = etree.iterparse(input_kml_path, events=('start', 'end', 'comment', 'pi'),
+                                 recover=True, huge_tree=True, remove_blank_text=minify)
+        for event, node in events:
+            if leaf_depth:
+                if event == 'start':
+                    leaf_depth += 1
+                elif event == 'end':
+                    leaf_depth -= 1
+                    if leaf_depth == 0:
+                        # 子树结束: 修正其中的坐标, 写出, 然后释放子元素
+                        coord_elements = list(node.iter(KML_COORDINATES_TAG, GX_COORD_TAG))
+                        if coord_elements:
+                            coord_element_count += len(coord_elements)
+                            corrected, skipped = correct_elements(coord_elements)
+                            corrected_point_count += corrected
+                            skipped_element_count += skipped
+                        _write_subtree(xf, output_file, node)
+                        node.clear(keep_tail=True)
+                        open_containers[-1][2] = node
+                continue
+
+            if event == 'start':
+                if open_containers:
+                    _write_pending_text(xf, open_containers[-1])
+                if not open_containers or _is_container(node):
+                    open_containers.append([node, None, node])
+                else:
+                    leaf_depth = 1
+
+            elif event == 'end':
+                # 只有容器的 end 事件会到达这里
+                container_state = open_containers.pop()
+                if container_state[1] is None and node.text is None:
+                    # 没有任何内容的容器; 根元素没有继承的命名空间声明, 可以直接写出
+                    if open_containers:
+                        _write_empty_element(xf, output_file, node)
+                    else:
+                        xf.write(node, with_tail=False)
+                else:
+                    _write_pending_text(xf, container_state)
+                    container_state[1].__exit__(None, None, None)
+                if open_containers:
+                    open_containers[-1][2] = node
+                else:
+                    xf.flush()
+                    output_file.write(document_separator)
+
+            else:
+                # 容器中 (或根元素之外) 的注释 / 处理指令
+                if open_containers:
+                    _write_pending_text(xf, open_containers[-1])
+                    open_containers[-1][2] = node
+                    xf.write(node, with_tail=False)
+                else:
+                    # xmlfile 不允许在根元素结束后再写节点, 文档级的注释直接写入输出文件
+                    xf.flush()
+                    output_file.write(etree.tostring(node, encoding='utf-8', with_tail=False) + document_separator)
+
+    update_status(f"流式处理完成。共处理 {coord_element_count} 个坐标元素 (<coordinates> 或 <gx:coord>)。")
+    return coord_element_count, corrected_point_count, skipped_element_count
@@ -6,83 +6,535 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
+from concurrent.futures import ThreadPoolExecutor
+from lxml import html
+import urllib3
+import argparse
 import csv
 import datetime
+import hashlib
+import json
 import os
+import queue
+import threading
+import time
 
-# 设置 Chrome 选项
-chrome_options = Options()
-chrome_options.add_argument("--headless")  # 无头模式
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-
-# 设置 ChromeDriver 路径
-service = Service(ChromeDriverManager().install())
-driver = webdriver.Chrome(service=service, options=chrome_options)
-
-# 打开目标网站
-driver.get("https://www.streetviewfun.com/top-100/")
-
-# 等待页面加载完成
-WebDriverWait(driver, 10).until(
-    EC.presence_of_element_located((By.CLASS_NAME, "gdrts-grid-item"))
-)
-
-# 提取所有 <td class="gdrts-grid-item"> 中的链接
-links = []
-td_elements = driver.find_elements(By.CLASS_NAME, "gdrts-grid-item")
-for td in td_elements:
-    try:
-        # 等待 <a> 标签加载完成
-        a_tag = WebDriverWait(td, 5).until(
-            EC.presence_of_element_located((By.TAG_NAME, "a"))
-        )
-        link = a_tag.get_attribute("href")
-        links.append(link)
-    except TimeoutException:
-        print(f"未找到 <a> 标签：{td.text}")
+START_URL = "https://www.streetviewfun.com/top-100/"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+STREET_VIEW_XPATH = '//a[contains(@href, "goo.gl/maps")]'
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crawl_cache')
+CHECKPOINT_PATH = os.path.join(OUTPUT_DIR, 'street_view_checkpoint.jsonl')
+DEFAULT_CACHE_TTL_HOURS = 24
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def create_driver():
+    """创建一个无头 Chrome (ChromeDriver 只下载/查找一次, 多个浏览器共用)"""
+    global _driver_path
+    # 设置 Chrome 选项
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # 无头模式
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument(f"user-agent={USER_AGENT}")
+
+    # 设置 ChromeDriver 路径
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+    return webdriver.Chrome(service=Service(_driver_path), options=chrome_options)
+
+
+def collect_links(driver, start_url=START_URL):
+    """打开 top-100 页面, 返回所有 <td class="gdrts-grid-item"> 中的详情页链接"""
+    driver.get(start_url)
 
-# 遍历每个链接，进入详情页并提取街景链接
-street_view_links = []
-for link in links:
-    driver.get(link)
+    # 等待页面加载完成
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.CLASS_NAME, "gdrts-grid-item"))
+    )
+
+    # 提取所有 <td class="gdrts-grid-item"> 中的链接
+    links = []
+    td_elements = driver.find_elements(By.CLASS_NAME, "gdrts-grid-item")
+    for td in td_elements:
+        try:
+            # 等待 <a> 标签加载完成
+            a_tag = WebDriverWait(td, 5).until(
+                EC.presence_of_element_located((By.TAG_NAME, "a"))
+            )
+            link = a_tag.get_attribute("href")
+            links.append(link)
+        except TimeoutException:
+            print(f"未找到 <a> 标签：{td.text}")
+    return links
+
+
+def fetch_street_view_link(driver, link):
+    """进入详情页并提取街景链接, 返回 {"link", "description"}; 失败时打印原因并返回 None"""
     try:
+        driver.get(link)
         # 使用显式等待替代 sleep
         WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, '//a[contains(@href, "goo.gl/maps")]'))
+            EC.presence_of_element_located((By.XPATH, STREET_VIEW_XPATH))
         )
-        a_tag = driver.find_element(By.XPATH, '//a[contains(@href, "goo.gl/maps")]')
+        a_tag = driver.find_element(By.XPATH, STREET_VIEW_XPATH)
         street_view_link = a_tag.get_attribute("href")
         # 获取标题作为描述
         title = driver.title
-        street_view_links.append({"link": street_view_link, "description": title})
         print(f"成功获取街景链接：{street_view_link}")
+        return {"link": street_view_link, "description": title}
     except TimeoutException:
         print(f"页面加载超时：{link}")
     except NoSuchElementException:
         print(f"页面中未找到街景链接：{link}")
     except Exception as e:
         print(f"发生未知错误：{link}，错误类型：{type(e).__name__}，错误信息：{str(e)}")
+    return None
+
+
+def crawl_sequential(driver, links, checkpoint=None):
+    """原来的方式: 一个浏览器依次打开每个详情页"""
+    street_view_links = []
+    for link in links:
+        result = fetch_street_view_link(driver, link)
+        if result is not None:
+            street_view_links.append(result)
+            if checkpoint is not None:
+                checkpoint.record(link, result)
+    return street_view_links
+
+
+# --- 并发抓取 ---
+# 每个详情页的大部分时间都花在网络和页面加载等待上, 一个浏览器依次打开 100 个页面时 CPU 几乎空闲;
+# 这里用最多 workers 个浏览器同时打开不同的详情页, 耗时大约按浏览器数量成比例缩短
+class DriverPool:
+    """最多 size 个浏览器, 线程通过 acquire / release 借用, 不够时才新建"""
+
+    def __init__(self, size, driver_factory=None, drivers=()):
+        self.size = max(size, len(drivers))
+        self.driver_factory = driver_factory or create_driver
+        self._idle = queue.Queue()
+        self._drivers = list(drivers)
+        self._lock = threading.Lock()
+        for driver in drivers:
+            self._idle.put(driver)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            slot = None
+            if len(self._drivers) < self.size:
+                self._drivers.append(None) # 先占位, 浏览器在锁外启动
+                slot = len(self._drivers) - 1
+        if slot is not None:
+            try:
+                driver = self.driver_factory()
+            except Exception as e:
+                print(f"浏览器启动失败 ({type(e).__name__}: {e}), 少用一个浏览器")
+                with self._lock:
+                    self._drivers[slot] = False # 启动失败的位置不再重试
+            else:
+                with self._lock:
+                    self._drivers[slot] = driver
+                return driver
+        # 等待其他任务归还浏览器; 正在启动的浏览器也可能全部失败, 所以定期检查是否还有可用的
+        while True:
+            with self._lock:
+                if not any(driver is None or driver for driver in self._drivers):
+                    raise RuntimeError("没有可用的浏览器")
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                pass
 
-# 关闭浏览器
-driver.quit()
+    def release(self, driver):
+        self._idle.put(driver)
+
+    def close(self):
+        for driver in self._drivers:
+            if driver:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+        self._drivers = []
+
+
+def crawl_concurrent(links, workers, driver_factory=None, drivers=(), keep_failed=False, checkpoint=None):
+    """
+    用最多 workers 个浏览器并发抓取详情页, 结果按 links 的顺序返回 (失败的页面不包含在内)
+    drivers: 已经打开的浏览器 (例如打开 top-100 页面用的那个), 放入池中复用
+    keep_failed: 为 True 时返回与 links 一一对应的列表, 失败的页面为 None
+    checkpoint: Checkpoint, 每抓到一个页面立即追加记录
+    """
+    results = [None] * len(links)
+    pool = DriverPool(workers, driver_factory, drivers)
+    done = 0
+    lock = threading.Lock()
+
+    def fetch(index, link):
+        nonlocal done
+        driver = pool.acquire()
+        try:
+            results[index] = fetch_street_view_link(driver, link) # 每个位置只由一个任务写入
+        finally:
+            pool.release(driver)
+        if checkpoint is not None and results[index] is not None:
+            checkpoint.record(link, results[index])
+        with lock:
+            done += 1
+            if done % 10 == 0 or done == len(links):
+                print(f"已完成 {done}/{len(links)} 个详情页")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(fetch, index, link) for index, link in enumerate(links)]:
+                future.result()
+    finally:
+        pool.close()
+    return results if keep_failed else [result for result in results if result is not None]
+
+
+# --- 无浏览器抓取 (HTTP + lxml) ---
+# top-100 页面的 <td class="gdrts-grid-item"> 链接和详情页的 goo.gl/maps 链接都在服务器返回的 HTML 中, 不需要执行 JavaScript;
+# 直接用保持连接的 HTTP 连接池下载页面, 用 lxml 按相同的 class / XPath 查找, 每页只要几毫秒, 也不用启动 Chrome。
+# 静态 HTML 中找不到街景链接的页面 (可能需要渲染) 再交给浏览器抓取
+NEEDS_BROWSER = 'needs_browser' # fetch_street_view_link_http 的返回值: 这个页面需要用浏览器重新抓取
+
+
+def create_http_pool(workers=1):
+    """保持连接的 HTTP 连接池 (线程安全), 使用与 Chrome 相同的 User-Agent"""
+    return urllib3.PoolManager(maxsize=max(workers, 1), block=False, headers={'User-Agent': USER_AGENT},
+                               timeout=urllib3.Timeout(connect=5, read=10), retries=urllib3.Retry(2, backoff_factor=0.5))
+
+
+def fetch_document(http, url, cache=None, revalidate=False):
+    """
+    下载页面并解析为 lxml 文档, 链接转换为绝对地址 (与 selenium get_attribute("href") 相同)
+    cache: PageCache, 未过期的页面不再请求, 过期的页面带 ETag / Last-Modified 条件请求
+    revalidate: 即使缓存未过期也发送条件请求 (用于内容会变化的列表页)
+    """
+    entry = cache.load(url) if cache is not None else None
+    if entry is not None and not revalidate and cache.is_fresh(entry):
+        body = cache.body(url, 'fresh')
+    else:
+        headers = dict(http.headers, **cache.validators(entry)) if entry is not None else http.headers
+        response = http.request('GET', url, headers=headers)
+        if response.status == 304 and entry is not None:
+            body = cache.body(url, 'revalidated')
+            # 304 响应可能带新的 ETag / Last-Modified / Cache-Control, 没有的沿用旧值
+            cache.save(url, body, {key: response.headers.get(name) or entry.get(key)
+                                   for key, name in PageCache.VALIDATOR_HEADERS})
+        elif response.status != 200:
+            raise urllib3.exceptions.HTTPError(f"HTTP {response.status}")
+        else:
+            body = response.data
+            if cache is not None:
+                cache.save(url, body, response.headers, 'downloaded')
+    document = html.fromstring(body, base_url=url)
+    document.make_links_absolute(url)
+    return document
+
+
+def collect_links_http(http, start_url=START_URL, cache=None):
+    """与 collect_links 相同, 但不用浏览器; 页面中没有 gdrts-grid-item 时返回 None (需要浏览器)"""
+    # 列表页会随排名变化, 每次都条件请求 (未修改时只有一个 304), 详情页才按缓存有效期直接使用
+    td_elements = fetch_document(http, start_url, cache, revalidate=True).find_class("gdrts-grid-item")
+    if not td_elements:
+        return None
+    links = []
+    for td in td_elements:
+        a_tags = [a for a in td.iter('a') if a.get('href')]
+        if a_tags:
+            links.append(a_tags[0].get('href'))
+        else:
+            print(f"未找到 <a> 标签：{td.text_content().strip()}")
+    return links
+
+
+def fetch_street_view_link_http(http, link, cache=None):
+    """
+    与 fetch_street_view_link 相同, 但不用浏览器
+    返回 {"link", "description"}; 下载失败时返回 None; 静态 HTML 中没有街景链接时返回 NEEDS_BROWSER
+    """
+    try:
+        document = fetch_document(http, link, cache)
+    except Exception as e:
+        print(f"发生未知错误：{link}，错误类型：{type(e).__name__}，错误信息：{str(e)}")
+        return None
+    a_tags = document.xpath(STREET_VIEW_XPATH)
+    if not a_tags:
+        return NEEDS_BROWSER
+    street_view_link = a_tags[0].get('href')
+    # 获取标题作为描述 (与浏览器的 document.title 一样合并空白)
+    title = " ".join((document.findtext('.//title') or '').split())
+    print(f"成功获取街景链接：{street_view_link}")
+    return {"link": street_view_link, "description": title}
+
+
+def crawl_http(links, workers, http=None, cache=None, checkpoint=None):
+    """
+    用 workers 个线程共享一个 HTTP 连接池抓取详情页
+    返回 (与 links 一一对应的结果列表, 需要浏览器的页面序号列表)
+    """
+    http = http or create_http_pool(workers)
+
+    def fetch(link):
+        result = fetch_street_view_link_http(http, link, cache)
+        if checkpoint is not None and result is not None and result != NEEDS_BROWSER:
+            checkpoint.record(link, result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = list(executor.map(fetch, links))
+    needs_browser = [index for index, result in enumerate(results) if result == NEEDS_BROWSER]
+    for index in needs_browser:
+        results[index] = None
+    return results, needs_browser
+
+
+# --- 页面缓存与断点续抓 ---
+# PageCache: 按 URL 把 HTTP 下载的页面保存在 crawl_cache/ 中, ttl 内再次运行直接使用, 过期后带
+# If-None-Match / If-Modified-Since 请求, 服务器返回 304 时继续使用缓存; 只有新页面和修改过的页面才重新下载
+# Checkpoint: 每抓到一个详情页立即追加一行到 JSONL 文件, 中断后再次运行跳过已经抓到的页面; 正常结束后删除
+class PageCache:
+    """页面缓存, 文件名为 URL 的 sha256 前 16 位 (.html 为页面, .json 为 URL、ETag、Last-Modified、Cache-Control 和下载时间)"""
+
+    # 元数据键 -> 响应头
+    VALIDATOR_HEADERS = (('etag', 'ETag'), ('last_modified', 'Last-Modified'), ('cache_control', 'Cache-Control'))
+
+    def __init__(self, directory=CACHE_DIR, ttl=DEFAULT_CACHE_TTL_HOURS * 3600):
+        self.directory = directory
+        self.ttl = ttl
+        self.counts = {'fresh': 0, 'revalidated': 0, 'downloaded': 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, extension):
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest()[:16] + extension)
+
+    def load(self, url):
+        """返回缓存的元数据, 没有缓存 (或缓存属于其他 URL / 页面文件缺失) 时返回 None"""
+        try:
+            with open(self._path(url, '.json'), encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url or not os.path.exists(self._path(url, '.html')):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        """下载 (或上次 304) 之后未超过 ttl; 服务器的 Cache-Control max-age 更短时以它为准"""
+        ttl = self.ttl
+        max_age = self.max_age(entry.get('cache_control'))
+        if max_age is not None:
+            ttl = min(ttl, max_age)
+        return time.time() - entry.get('fetched_at', 0) < ttl
+
+    @staticmethod
+    def max_age(cache_control):
+        """Cache-Control 中的 max-age 秒数, no-cache / no-store 为 0, 没有时返回 None"""
+        max_age = None
+        for directive in (cache_control or '').lower().split(','):
+            name, _, value = directive.strip().partition('=')
+            if name in ('no-cache', 'no-store'):
+                return 0
+            if name == 'max-age':
+                try:
+                    max_age = max(0, int(value.strip().strip('"')))
+                except ValueError:
+                    pass
+        return max_age
+
+    @staticmethod
+    def validators(entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body(self, url, outcome):
+        with open(self._path(url, '.html'), 'rb') as file:
+            body = file.read()
+        self._count(outcome)
+        return body
+
+    def save(self, url, body, headers, outcome=None):
+        """保存页面和校验信息 (headers 为响应头或元数据), 同时把下载时间更新为现在"""
+        entry = {'url': url, 'fetched_at': time.time()}
+        for key, name in self.VALIDATOR_HEADERS:
+            entry[key] = headers.get(name) or headers.get(key)
+        suffix = f".{threading.get_ident()}.tmp" # 先写临时文件再替换, 中断时不会留下半个页面
+        for extension, data, mode in (('.html', body, 'wb'), ('.json', json.dumps(entry), 'w')):
+            with open(self._path(url, extension) + suffix, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as file:
+                file.write(data)
+            os.replace(self._path(url, extension) + suffix, self._path(url, extension))
+        if outcome:
+            self._count(outcome)
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def describe(self):
+        return (f"页面缓存: 直接使用 {self.counts['fresh']} 个, 未修改 (304) {self.counts['revalidated']} 个, "
+                f"下载 {self.counts['downloaded']} 个")
+
+
+class Checkpoint:
+    """线程安全的断点文件, 每行一个 {"page", "link", "description"}"""
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self.done = {} # 详情页地址 -> {"link", "description"}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # 中断时写了一半的最后一行
+                    self.done[entry['page']] = {"link": entry['link'], "description": entry['description']}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, page, result):
+        line = json.dumps({"page": page, **result}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.done[page] = result
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self, remove=False):
+        self._file.close()
+        if remove:
+            os.remove(self.path)
+
+
+def save_results(street_view_links, output_dir=OUTPUT_DIR):
+    """写入带时间戳的 CSV 文件, 返回文件路径"""
+    # 创建输出目录
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 生成带时间戳的文件名
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"street_view_links_{timestamp}.csv"
+    filepath = os.path.join(output_dir, filename)
+
+    # 写入CSV文件
+    with open(filepath, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['link', 'description'])
+        writer.writeheader()
+        writer.writerows(street_view_links)
+    return filepath
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="抓取 streetviewfun.com top-100 详情页中的街景链接")
+    parser.add_argument('--backend', choices=('http', 'selenium'), default='http',
+                        help="http: 直接下载 HTML 用 lxml 解析, 只有找不到链接的页面才启动浏览器 (默认); "
+                             "selenium: 全部用浏览器打开 (原来的方式)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="同时抓取的详情页数量 (浏览器数量); 默认 http 为 8, selenium 为 1 (即原来的逐个抓取)")
+    parser.add_argument('--no-fallback', action='store_true', help="http 模式下找不到链接的页面不再用浏览器重试")
+    parser.add_argument('--start-url', default=START_URL,
+                        help=f"top-100 页面地址 (默认 {START_URL}; 可指向本地保存页面的测试服务器)")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help="CSV 输出目录 (默认 output/)")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="http 模式的页面缓存目录 (默认 crawl_cache/)")
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_CACHE_TTL_HOURS,
+                        help=f"缓存多少小时内直接使用, 过期后条件请求 (默认 {DEFAULT_CACHE_TTL_HOURS}; 0 表示每次都条件请求)")
+    parser.add_argument('--no-cache', action='store_true', help="不使用页面缓存")
+    parser.add_argument('--fresh', action='store_true', help="忽略上次中断留下的断点, 重新抓取所有详情页")
+    args = parser.parse_args(argv)
+    workers = args.workers or (8 if args.backend == 'http' else 1)
+    cache = None if args.no_cache else PageCache(args.cache_dir, args.cache_ttl * 3600)
+    checkpoint_path = os.path.join(args.output_dir, os.path.basename(CHECKPOINT_PATH))
+    if args.fresh and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    start_time = time.perf_counter()
+    links = None
+    driver = None
+    if args.backend == 'http':
+        http = create_http_pool(workers)
+        links = collect_links_http(http, args.start_url, cache)
+        if links is None:
+            print("top-100 页面的静态 HTML 中没有链接, 改用浏览器")
+            args.backend = 'selenium'
+            workers = args.workers or 1 # 与直接指定 --backend selenium 相同, 默认逐个抓取
+    if args.backend == 'selenium':
+        driver = create_driver()
+        try:
+            # 打开目标网站
+            links = collect_links(driver, args.start_url)
+        except Exception:
+            driver.quit()
+            raise
+
+    # 已经抓到的详情页 (上次中断前) 直接跳过; 每抓到一个页面立即追加到断点文件
+    checkpoint = Checkpoint(checkpoint_path)
+    pending = [link for link in links if link not in checkpoint.done]
+    if len(pending) < len(links):
+        print(f"从断点继续: 已抓取 {len(links) - len(pending)} 个详情页, 剩余 {len(pending)} 个")
+
+    # 遍历每个链接，进入详情页并提取街景链接
+    try:
+        if args.backend == 'http':
+            print(f"共 {len(pending)} 个详情页, 使用 HTTP + lxml 抓取 ({workers} 个线程)")
+            results, needs_browser = crawl_http(pending, workers, http, cache, checkpoint)
+            if needs_browser and not args.no_fallback:
+                print(f"{len(needs_browser)} 个详情页的静态 HTML 中没有街景链接, 用浏览器重新抓取")
+                fallback = [pending[index] for index in needs_browser]
+                try:
+                    crawl_concurrent(fallback, min(workers, len(fallback)), checkpoint=checkpoint)
+                except Exception as e:
+                    # 浏览器无法启动等: 这些页面按未找到处理, HTTP 已抓到的结果照常写出
+                    print(f"浏览器重新抓取失败 ({type(e).__name__}: {e})")
+                    for link in fallback:
+                        if link not in checkpoint.done:
+                            print(f"页面中未找到街景链接：{link}")
+            elif needs_browser:
+                for index in needs_browser:
+                    print(f"页面中未找到街景链接：{pending[index]}")
+        elif workers > 1:
+            print(f"共 {len(pending)} 个详情页, 使用 {workers} 个浏览器并发抓取")
+            crawl_concurrent(pending, workers, drivers=[driver], checkpoint=checkpoint)
+        else:
+            try:
+                crawl_sequential(driver, pending, checkpoint)
+            finally:
+                # 关闭浏览器
+                driver.quit()
+    except BaseException:
+        checkpoint.close()
+        print(f"抓取中断, 已抓到的 {len(checkpoint.done)} 个详情页保存在断点文件中: {checkpoint_path}")
+        raise
+    elapsed = time.perf_counter() - start_time
 
-# 创建输出目录
-output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
-os.makedirs(output_dir, exist_ok=True)
+    street_view_links = [checkpoint.done[link] for link in links if link in checkpoint.done]
+    filepath = save_results(street_view_links, args.output_dir)
+    checkpoint.close(remove=True) # 结果已完整写出, 下次运行重新检查所有页面 (未修改的页面由缓存提供)
 
-# 生成带时间戳的文件名
-timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-filename = f"street_view_links_{timestamp}.csv"
-filepath = os.path.join(output_dir, filename)
+    # 输出结果
+    print(f"\n共找到 {len(street_view_links)} 个街景链接")
+    print(f"详情页 {len(links)} 个 (本次抓取 {len(pending)} 个), 耗时 {elapsed:.1f}s, "
+          f"{len(pending) / elapsed if elapsed > 0 else 0:.2f} 页/秒")
+    if cache is not None and args.backend == 'http':
+        print(cache.describe())
+    print(f"结果已保存到文件：{filepath}")
 
-# 写入CSV文件
-with open(filepath, 'w', newline='', encoding='utf-8') as file:
-    writer = csv.DictWriter(file, fieldnames=['link', 'description'])
-    writer.writeheader()
-    writer.writerows(street_view_links)
 
-# 输出结果
-print(f"\n共找到 {len(street_view_links)} 个街景链接")
-print(f"结果已保存到文件：{filepath}")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
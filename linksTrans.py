@@ -1,18 +1,45 @@
 import re
 import csv
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
+# 预编译的匹配模式, 避免每个 URL 都经过 re 模块的模式缓存查找
+STREET_VIEW_ID_PATTERN = re.compile(r'1s([A-Za-z0-9_-]+)')
+# 旋转角/俯仰角原来用 r'([0-9.-]+)h,' 和 r'([0-9.-]+)t' 匹配; 这两个模式以字符类开头, re 只能在每个位置逐一尝试,
+# 占了大部分耗时。value_before 先用 str.find 找 'h,' / 't', 再取它前面连续的数字字符, 结果与原模式完全相同
+VALUE_CHARS = '0123456789.-'
+YAW_MARKER = 'h,'
+PITCH_MARKER = 't'
+CSV_FIELDS = ['url', '街景ID', '旋转角', '俯仰角']
+ERROR_VALUE = '处理出错'
+
+def value_before(url, marker):
+    """返回第一个紧挨在 marker 前面的 [0-9.-]+ 串 (等同于 re.search(r'([0-9.-]+)' + marker, url)), 没有时返回 None"""
+    index = url.find(marker)
+    while index != -1:
+        head = url[:index]
+        value = head[len(head.rstrip(VALUE_CHARS)):]
+        if value:
+            return value
+        index = url.find(marker, index + 1)
+    return None
+
 def extract_street_view_info(url):
     # Extract Street View ID
-    street_view_id_match = re.search(r'1s([A-Za-z0-9_-]+)', url)
+    street_view_id_match = STREET_VIEW_ID_PATTERN.search(url)
     street_view_id = street_view_id_match.group(1) if street_view_id_match else None
 
     # Extract yaw and pitch using 'h' for yaw and 't' for pitch
-    yaw_match = re.search(r'([0-9.-]+)h,', url)  # Match the value before 'h,'
-    yaw = yaw_match.group(1) if yaw_match else None
+    yaw = value_before(url, YAW_MARKER)  # Match the value before 'h,'
 
-    pitch_match = re.search(r'([0-9.-]+)t', url)  # Match the value before 't'
-    pitch = pitch_match.group(1) if pitch_match else None
+    pitch = value_before(url, PITCH_MARKER)  # Match the value before 't'
 
     return street_view_id, yaw, pitch
 
@@ -40,7 +67,7 @@ def process_batch_urls():
     
     # 写入CSV文件
     with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['url', '街景ID', '旋转角', '俯仰角']
+        fieldnames = CSV_FIELDS
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
         
@@ -75,7 +102,222 @@ def process_batch_urls():
     
     print(f"\n数据已保存到文件: {csv_filename}")
 
+# --- 非交互的流式批处理 ---
+# 从文件或标准输入逐行读取 URL (可以是几百万行的导出列表), 边读边写 CSV, 内存占用与行数无关
+def convert_rows(urls):
+    """
+    逐个转换 URL, 生成 (CSV 行, 是否出错, 是否未找到街景ID); 空行跳过
+    与 extract_street_view_info 的结果相同, 循环内只用局部名字查找
+    """
+    search_id = STREET_VIEW_ID_PATTERN.search
+    for line in urls:
+        # 输入以 newline='\n' 打开 (与按字节分片一样只在 \n 处分行, 不转换换行符), 行尾的 \r\n 在这里去掉
+        url = line.rstrip('\r\n').strip()
+        if not url:
+            continue
+        try:
+            id_match = search_id(url)
+            street_view_id = id_match.group(1) if id_match else None
+            yield ([url, street_view_id, value_before(url, YAW_MARKER), value_before(url, PITCH_MARKER)],
+                   False, street_view_id is None)
+        except Exception:
+            yield [url, ERROR_VALUE, ERROR_VALUE, ERROR_VALUE], True, False
+
+def process_stream(input_file, output_file, chunk_size=10000, progress_every=1000000, log=sys.stdout):
+    """
+    把 input_file 中的 URL 转换为 CSV 写入 output_file, 每 chunk_size 行写出一次
+    返回 {'urls', 'errors', 'unmatched', 'seconds'}
+    """
+    writer = csv.writer(output_file)
+    writer.writerow(CSV_FIELDS)
+    stats = {'urls': 0, 'errors': 0, 'unmatched': 0, 'seconds': 0.0}
+    start_time = time.perf_counter()
+    rows = []
+    for row, error, unmatched in convert_rows(input_file):
+        rows.append(row)
+        stats['errors'] += error
+        stats['unmatched'] += unmatched
+        if len(rows) >= chunk_size:
+            writer.writerows(rows)
+            stats['urls'] += len(rows)
+            rows = []
+            if progress_every and stats['urls'] % progress_every < chunk_size:
+                print(f"已处理 {stats['urls']} 个链接", file=log)
+    writer.writerows(rows)
+    stats['urls'] += len(rows)
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
+
+def print_stream_stats(stats, log=sys.stdout):
+    rate = stats['urls'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    print(f"共处理 {stats['urls']} 个链接, 出错 {stats['errors']} 个, 未找到街景ID {stats['unmatched']} 个, "
+          f"耗时 {stats['seconds']:.2f}s, {rate:,.0f} 个/秒", file=log)
+
+# --- 多进程分片处理 ---
+# 单核每秒约几万个链接, 夜间任务的几千万行要按字节范围切成分片, 由进程池并行解析。
+# 每个分片写到自己的临时 CSV 片段 (不经过进程间传输结果), 最后按输入顺序 (或完成顺序) 拼接到输出文件
+SHARDS_PER_WORKER = 4 # 分片数 = 进程数 × 4, 分片大小不均时也能让各进程的负载接近
+
+def split_shards(path, shards):
+    """把文件按字节大致均分为 shards 段, 边界对齐到行首; 返回 [(start, end), ...]"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as file:
+        for k in range(1, shards):
+            target = size * k // shards
+            if target <= bounds[-1]:
+                continue
+            # 从 target 前一个字节读到行尾, 恰好落在 target 处或之后的第一个行首
+            file.seek(target - 1)
+            file.readline()
+            position = file.tell()
+            if bounds[-1] < position < size:
+                bounds.append(position)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def read_shard_lines(path, start, end, buffer_size=1 << 20):
+    """逐行读取 [start, end) 字节范围内的行 (start 是行首), 按 UTF-8 解码"""
+    with open(path, 'rb', buffering=buffer_size) as file:
+        file.seek(start)
+        remaining = end - start
+        for raw in file:
+            yield raw.decode('utf-8', 'replace')
+            remaining -= len(raw)
+            if remaining <= 0:
+                break
+
+def convert_shard(path, start, end, part_path):
+    """子进程: 转换一个分片, 行写入 part_path (不含表头), 返回 (part_path, 统计)"""
+    stats = {'urls': 0, 'errors': 0, 'unmatched': 0}
+    with open(part_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as part:
+        writer = csv.writer(part)
+        rows = []
+        for row, error, unmatched in convert_rows(read_shard_lines(path, start, end)):
+            rows.append(row)
+            stats['errors'] += error
+            stats['unmatched'] += unmatched
+            if len(rows) >= 10000:
+                writer.writerows(rows)
+                stats['urls'] += len(rows)
+                rows = []
+        writer.writerows(rows)
+        stats['urls'] += len(rows)
+    return part_path, stats
+
+def process_parallel(path, output_path, workers, ordered=True, shards=None, log=sys.stdout):
+    """
+    多进程转换 path 中的 URL 写入 output_path; ordered=False 时分片按完成顺序拼接 (分片内部仍保持输入顺序)
+    返回与 process_stream 相同的统计字典
+    """
+    start_time = time.perf_counter()
+    ranges = split_shards(path, shards or workers * SHARDS_PER_WORKER)
+    stats = {'urls': 0, 'errors': 0, 'unmatched': 0, 'seconds': 0.0}
+    part_dir = tempfile.mkdtemp(prefix='linksTrans_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with open(output_path, 'w', newline='', encoding='utf-8') as output_file, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            csv.writer(output_file).writerow(CSV_FIELDS)
+            output_file.flush()
+            futures = [executor.submit(convert_shard, path, start, end, os.path.join(part_dir, f'{index:06d}.csv'))
+                       for index, (start, end) in enumerate(ranges)]
+            # 有序时按提交顺序等待, 前面的分片一完成就写出, 不必等全部分片结束
+            for done, future in enumerate(futures if ordered else as_completed(futures), 1):
+                part_path, part_stats = future.result()
+                with open(part_path, 'rb') as part:
+                    shutil.copyfileobj(part, output_file.buffer, 1 << 20)
+                os.remove(part_path)
+                for key in part_stats:
+                    stats[key] += part_stats[key]
+                print(f"分片 {done}/{len(ranges)} 完成, 已处理 {stats['urls']} 个链接", file=log)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
+
+def run_benchmark(path, max_workers, ordered=True, log=sys.stdout):
+    """分别用单进程流式处理和 1..max_workers 个进程处理同一文件, 打印耗时、速度和加速比, 并检查输出一致"""
+    work_dir = tempfile.mkdtemp(prefix='linksTrans_bench_')
+    try:
+        baseline_path = os.path.join(work_dir, 'stream.csv')
+        with open(path, encoding='utf-8', errors='replace', newline='\n', buffering=1 << 20) as input_file, \
+                open(baseline_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as output_file:
+            baseline = process_stream(input_file, output_file, progress_every=0, log=log)
+        results = [('流式单进程', baseline, True)]
+        with open(os.devnull, 'w') as quiet:
+            for workers in range(1, max_workers + 1):
+                output_path = os.path.join(work_dir, f'workers_{workers}.csv')
+                stats = process_parallel(path, output_path, workers, ordered=ordered, log=quiet)
+                if ordered:
+                    same = filecmp.cmp(baseline_path, output_path, shallow=False)
+                else:
+                    same = stats['urls'] == baseline['urls']
+                os.remove(output_path)
+                results.append((f'{workers} 个进程', stats, same))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'方式':<12}{'耗时(s)':>10}{'个/秒':>14}{'加速比':>8}  输出一致", file=log)
+    for label, stats, same in results:
+        rate = stats['urls'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        print(f"{label:<12}{stats['seconds']:>10.2f}{rate:>14,.0f}{baseline['seconds'] / stats['seconds']:>8.2f}  "
+              f"{'是' if same else '否'}", file=log)
+    print(f"(本机 CPU 核数: {os.cpu_count()})", file=log)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从文件或标准输入批量提取 Google 街景链接中的街景ID、旋转角和俯仰角")
+    parser.add_argument('input', help="URL 列表文件 (每行一个), '-' 表示标准输入")
+    parser.add_argument('-o', '--output', help="输出 CSV 文件, '-' 表示标准输出 (默认 street_view_data_<时间>.csv)")
+    parser.add_argument('--buffer-size', type=int, default=1 << 20, help="读写缓冲区字节数 (默认 1MB)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="并行进程数 (默认 1 为单进程流式处理; 大于 1 时按字节范围分片, 只支持文件输入)")
+    parser.add_argument('--unordered', action='store_true', help="多进程时分片按完成顺序写出, 不保持输入顺序")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="比较单进程流式和 1..N 个进程处理输入文件的速度, 不保留输出")
+    args = parser.parse_args(argv)
+
+    if (args.workers > 1 or args.benchmark) and args.input == '-':
+        parser.error("多进程分片和基准测试需要文件输入, 不支持标准输入")
+    if args.workers > 1 and args.output == '-':
+        parser.error("多进程分片需要输出到文件")
+    if args.benchmark:
+        run_benchmark(args.input, args.benchmark, ordered=not args.unordered)
+        return 0
+
+    output = args.output or f'street_view_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    log = sys.stderr if output == '-' else sys.stdout # CSV 写到标准输出时, 提示信息改写到标准错误
+    if args.workers > 1:
+        stats = process_parallel(args.input, output, args.workers, ordered=not args.unordered, log=log)
+        print_stream_stats(stats, log)
+        print(f"数据已保存到文件: {output}", file=log)
+        return 0
+
+    # newline='\n': 只在 \n 处分行 (newline='' 仍会在单独的 \r 处分行), 行内的 \r 不再把一行拆成两行,
+    # 结果与多进程按字节分片一致
+    if args.input == '-':
+        sys.stdin.reconfigure(encoding='utf-8', errors='replace', newline='\n')
+        input_file = sys.stdin
+    else:
+        input_file = open(args.input, encoding='utf-8', errors='replace', newline='\n', buffering=args.buffer_size)
+    output_file = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8', buffering=args.buffer_size)
+    try:
+        stats = process_stream(input_file, output_file, log=log)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+        else:
+            output_file.flush()
+    print_stream_stats(stats, log)
+    if output != '-':
+        print(f"数据已保存到文件: {output}", file=log)
+    return 0
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # 带参数运行: 非交互的流式批处理, 例如 python linksTrans.py urls.txt -o result.csv
+        sys.exit(main())
     while True:
         print("\n1. 批量处理URLs并保存到CSV")
         print("2. 退出程序")
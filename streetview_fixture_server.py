@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import email.utils
+import functools
+import hashlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+# --- 本地测试服务器 (findStreetView) ---
+# 把保存下来的 top-100 页面和详情页放在一个目录中 (路径与网站相同, 例如 top-100/index.html、
+# <详情页路径>/index.html), 由本服务器提供, 页面中的 https://www.streetviewfun.com 自动换成本服务器地址;
+# 也可以用 --generate 生成合成页面。--delay-ms 模拟网络和页面加载延迟, 用于比较逐个抓取和并发抓取
+#
+#   python streetview_fixture_server.py fixtures/streetview --generate 100 --delay-ms 300
+#   python findStreetView.py --start-url http://127.0.0.1:8765/top-100/ --workers 8
+SITE_ORIGIN = "https://www.streetviewfun.com"
+
+_TOP_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Top 100 Street Views</title></head>
+<body><table class="gdrts-grid">
+{rows}
+</table></body></html>
+"""
+_TOP_ROW = '<tr><td class="gdrts-grid-item"><a href="{origin}/view/{number}/">Street view #{number}</a></td></tr>'
+_DETAIL_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Street view #{number} - StreetViewFun</title></head>
+<body><article><h1>Street view #{number}</h1>
+<p>Coordinates {lat:.6f}, {lon:.6f}</p>
+{link}
+</article></body></html>
+"""
+
+
+def generate_pages(directory, pages, missing_rate=0.05, seed=0):
+    """
+    生成合成的 top-100 页面和 pages 个详情页; 约 missing_rate 的详情页没有街景链接 (测试找不到链接的情况)
+    链接写成网站原地址, 与保存的真实页面一样由服务器改写
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(directory, 'top-100'), exist_ok=True)
+    rows = "\n".join(_TOP_ROW.format(origin=SITE_ORIGIN, number=number) for number in range(1, pages + 1))
+    with open(os.path.join(directory, 'top-100', 'index.html'), 'w', encoding='utf-8') as file:
+        file.write(_TOP_PAGE.format(rows=rows))
+    for number in range(1, pages + 1):
+        page_dir = os.path.join(directory, 'view', str(number))
+        os.makedirs(page_dir, exist_ok=True)
+        link = "" if rng.random() < missing_rate else \
+            f'<p><a href="https://goo.gl/maps/fixture{number:04d}">Open in Google Maps</a></p>'
+        with open(os.path.join(page_dir, 'index.html'), 'w', encoding='utf-8') as file:
+            file.write(_DETAIL_PAGE.format(number=number, lat=rng.uniform(-60, 60), lon=rng.uniform(-180, 180), link=link))
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """提供目录中的页面; HTML 中的网站地址换成本服务器地址, 每个请求先等待 delay 秒"""
+
+    delay = 0.0
+    jitter = 0.0
+    stats = None
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        if self.delay or self.jitter:
+            time.sleep(self.delay + random.uniform(0, self.jitter))
+        with self.stats_lock:
+            self.stats['requests'] += 1
+
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split('?', 1)[0].endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not path.endswith(('.html', '.htm')) or not os.path.isfile(path):
+            return super().send_head()
+
+        # HTML 页面: 把网站地址换成本服务器地址, 页面中的链接才会指回测试服务器
+        with open(path, 'rb') as file:
+            content = file.read()
+        origin = f"http://{self.headers.get('Host') or '%s:%s' % self.server.server_address[:2]}"
+        content = content.replace(SITE_ORIGIN.encode('ascii'), origin.encode('ascii'))
+
+        # 与一般的网站服务器一样提供 ETag / Last-Modified, 页面没有修改时对条件请求返回 304
+        etag = f'"{hashlib.sha1(content).hexdigest()[:16]}"'
+        modified = int(os.path.getmtime(path))
+        if_none_match = self.headers.get('If-None-Match')
+        if_modified_since = self.headers.get('If-Modified-Since')
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(',')] if if_none_match else False
+        if if_none_match is None and if_modified_since:
+            try:
+                not_modified = modified <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                pass
+        if not_modified:
+            with self.stats_lock:
+                self.stats['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.date_time_string(modified))
+        self.end_headers()
+        return io.BytesIO(content)
+
+
+def make_server(directory, host='127.0.0.1', port=8765, delay_ms=0.0, jitter_ms=0.0):
+    """返回 (server, stats); port=0 时自动选择端口"""
+    stats = {'requests': 0, 'not_modified': 0}
+    handler = type('Handler', (FixtureHandler,), {'delay': delay_ms / 1000, 'jitter': jitter_ms / 1000, 'stats': stats})
+    server = ThreadingHTTPServer((host, port), functools.partial(handler, directory=directory))
+    server.daemon_threads = True
+    return server, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="为 findStreetView 提供本地保存页面的测试服务器")
+    parser.add_argument('directory', help="保存页面的目录 (top-100/index.html 和各详情页)")
+    parser.add_argument('--generate', type=int, metavar='N', help="先在目录中生成 N 个合成详情页和对应的 top-100 页面")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址 (默认 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口 (默认 8765)")
+    parser.add_argument('--delay-ms', type=float, default=0.0, help="每个请求的人为延迟毫秒数 (默认 0)")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="在延迟之上再加 0~N 毫秒的随机抖动 (默认 0)")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        generate_pages(args.directory, args.generate)
+        print(f"已生成 {args.generate} 个详情页: {args.directory}")
+    server, stats = make_server(args.directory, args.host, args.port, args.delay_ms, args.jitter_ms)
+    host, port = server.server_address[:2]
+    print(f"测试服务器已启动: http://{host}:{port}/top-100/ , Ctrl+C 停止")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"手动停止, 共处理 {stats['requests']} 个请求 (未修改 304: {stats['not_modified']} 个)")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,898 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from appium import webdriver
+from appium.options.android import UiAutomator2Options
+
+APPIUM_SERVER = 'http://localhost:4723'
+APP_PACKAGE = "com.earth.bdspace"
+APP_ACTIVITY = "com.earth.bdspace.ui.activity.HomeActivity"
+DEFAULT_SYSTEM_PORT = 8200 # UiAutomator2 默认 systemPort; 同一台电脑连多台手机时每台必须不同
+SESSION_STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'appium_sessions.json')
+
+# 两个脚本使用的缩放参数: 缩放比例、速度、缩小/放大时的操作区域、每次手势后的等待秒数、每轮次数
+PINCH_PROFILES = {
+    'simple': {'percent': 0.7, 'speed': 1500, 'close_ratio': 0.4, 'open_ratio': 0.4, 'pause': 1, 'repeats': 10},
+    'time': {'percent': 0.6, 'speed': 1200, 'close_ratio': 0.4, 'open_ratio': 0.8, 'pause': 3, 'repeats': 15},
+}
+
+
+def build_options(device_name, platform_version, system_port=None, udid=None,
+                  app_package=APP_PACKAGE, app_activity=APP_ACTIVITY):
+    """创建一台设备的 UiAutomator2Options (与脚本中的设置相同)"""
+    options = UiAutomator2Options()
+    options.platform_name = "Android"
+    options.platform_version = platform_version
+    options.device_name = device_name
+    options.udid = udid or device_name # 连接多台设备时 Appium 按 udid 选择设备
+    options.app_package = app_package
+    options.app_activity = app_activity
+    options.automation_name = "UiAutomator2"
+    options.set_capability("ignoreHiddenApiPolicyError", True)
+    options.set_capability("noReset", True)
+    if system_port:
+        options.system_port = system_port
+    return options
+
+
+# --- 屏幕几何缓存 ---
+# get_window_size 每次都是一次到 Appium 服务器的 HTTP 请求, 而每个手势都要计算一次操作区域;
+# 这里按会话缓存窗口大小和算好的操作区域, 只在屏幕方向改变或主动刷新时才重新请求
+class ScreenGeometry:
+    """缓存一个会话的窗口大小和手势操作区域"""
+
+    def __init__(self, driver, orientation_check_interval=0):
+        """
+        orientation_check_interval: 每隔多少次取区域检查一次屏幕方向 (driver.orientation 也是一次请求),
+        0 表示不检查, 只在 set_orientation / refresh 时更新
+        """
+        self.driver = driver
+        self.orientation_check_interval = orientation_check_interval
+        self.orientation = None
+        self.round_trips = 0 # 实际发出的 get_window_size 请求数
+        self.saved_round_trips = 0 # 由缓存直接返回的次数, 即节省的请求数
+        self._window_size = None
+        self._areas = {}
+        self._lookups_since_check = 0
+
+    def refresh(self):
+        """丢弃缓存, 下次使用时重新获取窗口大小"""
+        self._window_size = None
+        self._areas.clear()
+
+    def set_orientation(self, orientation):
+        """旋转屏幕 ('PORTRAIT' / 'LANDSCAPE') 并刷新缓存"""
+        self.driver.orientation = orientation
+        self.orientation = orientation
+        self.refresh()
+
+    def _check_orientation(self):
+        if not self.orientation_check_interval:
+            return
+        self._lookups_since_check += 1
+        if self._lookups_since_check < self.orientation_check_interval:
+            return
+        self._lookups_since_check = 0
+        orientation = self.driver.orientation
+        if orientation != self.orientation:
+            if self.orientation is not None:
+                print(f"屏幕方向已改变: {self.orientation} -> {orientation}, 刷新屏幕尺寸")
+            self.orientation = orientation
+            self.refresh()
+
+    def window_size(self):
+        """返回 {'width': ..., 'height': ...}, 优先使用缓存"""
+        self._check_orientation()
+        if self._window_size is None:
+            self._window_size = self.driver.get_window_size()
+            self.round_trips += 1
+        else:
+            self.saved_round_trips += 1
+        return self._window_size
+
+    def central_area(self, ratio):
+        """计算屏幕中央区域, 宽高为屏幕的 ratio 倍"""
+        window_size = self.window_size()
+        area = self._areas.get(ratio)
+        if area is None:
+            area_width = int(window_size['width'] * ratio)
+            area_height = int(window_size['height'] * ratio)
+            left = (window_size['width'] - area_width) // 2
+            top = (window_size['height'] - area_height) // 2
+            area = {
+                'width': area_width,
+                'height': area_height,
+                'left': max(0, left),
+                'top': max(0, top)
+            }
+            self._areas[ratio] = area
+        return dict(area)
+
+
+_geometry_by_session = {}
+
+
+def get_screen_geometry(driver, orientation_check_interval=0):
+    """返回 driver 当前会话的 ScreenGeometry; 新会话 (session_id 不同) 会得到新的缓存"""
+    session_id = getattr(driver, 'session_id', None) or id(driver)
+    geometry = _geometry_by_session.get(session_id)
+    if geometry is None or geometry.driver is not driver:
+        geometry = ScreenGeometry(driver, orientation_check_interval)
+        _geometry_by_session[session_id] = geometry
+    return geometry
+
+
+def forget_screen_geometry(driver):
+    """会话结束时删除其缓存, 返回被删除的 ScreenGeometry (没有则返回 None)"""
+    session_id = getattr(driver, 'session_id', None) or id(driver)
+    return _geometry_by_session.pop(session_id, None)
+
+
+def print_geometry_stats(driver):
+    """打印并清除会话的几何缓存统计"""
+    geometry = forget_screen_geometry(driver)
+    if geometry is not None:
+        print(f"get_window_size 请求 {geometry.round_trips} 次, "
+              f"缓存节省 {geometry.saved_round_trips} 次 HTTP 请求")
+
+
+# --- 缩放手势 ---
+def perform_pinch(driver, gesture, percent, ratio, speed, recorder=None):
+    """
+    在屏幕中央 ratio 倍的区域执行一次缩放手势, gesture 为 'close' (缩小) 或 'open' (放大)
+    recorder (GestureRecorder) 不为 None 时记录这次请求
+    返回手势请求的耗时 (秒)
+    """
+    area = get_screen_geometry(driver).central_area(ratio)
+    script = f'mobile: pinch{gesture.capitalize()}Gesture'
+    args = {
+        'percent': percent,
+        'left': area['left'],
+        'top': area['top'],
+        'width': area['width'],
+        'height': area['height'],
+        'speed': speed
+    }
+    start_time = time.perf_counter()
+    if recorder is not None:
+        recorder.execute_script(driver, script, args)
+    else:
+        driver.execute_script(script, args)
+    return time.perf_counter() - start_time
+
+
+# --- 手势之间的等待策略 ---
+# 固定等待 (time.sleep) 在大部分时间里都是空等; IdlePacing 在每次手势后连续截图,
+# 画面不再变化 (地图渲染完成) 就立即继续, 最多等待 timeout 秒
+class FixedPacing:
+    """固定等待 seconds 秒 (原来的 time.sleep 方式)"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.waits = 0
+        self.total_seconds = 0.0
+
+    def wait(self, driver, stop_event=None):
+        """等待并返回实际等待的秒数; 设置 stop_event 可以提前结束等待"""
+        start_time = time.perf_counter()
+        if stop_event is not None:
+            stop_event.wait(self.seconds)
+        else:
+            time.sleep(self.seconds)
+        return self._record(time.perf_counter() - start_time)
+
+    def _record(self, seconds):
+        self.waits += 1
+        self.total_seconds += seconds
+        return seconds
+
+    def describe(self):
+        return f"固定等待 {self.seconds}s"
+
+
+class IdlePacing(FixedPacing):
+    """
+    截图对比等待: 连续 stable_frames 张截图完全相同时认为地图已静止
+    有动画 (例如闪烁的定位点) 时画面不会完全静止, 此时最多等待 timeout 秒
+    """
+
+    def __init__(self, timeout=3.0, poll_interval=0.2, stable_frames=2, min_wait=0.0):
+        super().__init__(timeout)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stable_frames = stable_frames
+        self.min_wait = min_wait
+        self.timeouts = 0
+
+    def wait(self, driver, stop_event=None):
+        start_time = time.perf_counter()
+        if self.min_wait:
+            (stop_event.wait if stop_event is not None else time.sleep)(self.min_wait)
+        previous_digest = None
+        same_frames = 1
+        while not (stop_event is not None and stop_event.is_set()):
+            digest = hashlib.blake2b(driver.get_screenshot_as_png(), digest_size=16).digest()
+            same_frames = same_frames + 1 if digest == previous_digest else 1
+            previous_digest = digest
+            if same_frames >= self.stable_frames:
+                break
+            remaining = self.timeout - (time.perf_counter() - start_time)
+            if remaining <= 0:
+                self.timeouts += 1
+                break
+            (stop_event.wait if stop_event is not None else time.sleep)(min(self.poll_interval, remaining))
+        return self._record(time.perf_counter() - start_time)
+
+    def describe(self):
+        return f"截图对比等待 (最多 {self.timeout}s, 超时 {self.timeouts} 次)"
+
+
+PACING_MODES = ('fixed', 'idle')
+
+
+def make_pacing(mode, fixed_seconds, idle_timeout=None):
+    """mode 为 PACING_MODES 之一 ('fixed' 或 'idle'); idle 模式默认最多等待 fixed_seconds 秒"""
+    if mode == 'fixed':
+        return FixedPacing(fixed_seconds)
+    if mode == 'idle':
+        return IdlePacing(timeout=idle_timeout or fixed_seconds)
+    raise ValueError(f"未知的等待方式: {mode}")
+
+
+def print_pacing_stats(pacing, gesture_count, elapsed_seconds):
+    """打印实际达到的手势速率和平均等待时间"""
+    average_wait = pacing.total_seconds / pacing.waits if pacing.waits else 0.0
+    rate = gesture_count / elapsed_seconds if elapsed_seconds > 0 else 0.0
+    print(f"{pacing.describe()}: 手势 {gesture_count} 次, 平均等待 {average_wait:.2f}s, "
+          f"实际速率 {rate:.2f} 次/秒 ({rate * 60:.1f} 次/分钟)")
+
+
+# --- 批量 W3C Actions 手势序列 ---
+# 每次 execute_script('mobile: pinch...Gesture') 都是一次 客户端→服务器→设备 的往返;
+# GestureSequence 把一整轮缩放、滑动和停顿编译成一个双指 W3C Actions 请求 (POST /actions)
+# W3C Actions 按 "tick" 执行: 两根手指的第 i 个动作同时进行, 所以两根手指的动作列表始终保持等长
+W3C_ACTIONS_COMMAND = 'actions' # selenium Command.W3C_ACTIONS
+
+
+class GestureSequence:
+    """缩放 / 滑动 / 停顿的序列, 一次请求发送给设备"""
+
+    def __init__(self):
+        self.fingers = ([], [])
+        self.gesture_count = 0
+
+    def _tick(self, first, second):
+        self.fingers[0].append(first)
+        self.fingers[1].append(second)
+
+    @staticmethod
+    def _move(x, y, duration_ms=0):
+        return {'type': 'pointerMove', 'duration': int(duration_ms), 'x': int(x), 'y': int(y), 'origin': 'viewport'}
+
+    @staticmethod
+    def _pause(duration_ms=0):
+        return {'type': 'pause', 'duration': int(duration_ms)}
+
+    def pinch(self, gesture, area, percent, speed):
+        """
+        与 mobile: pinchClose/OpenGesture 相同的水平双指缩放: 'close' 两指从区域左右边缘向中心移动 percent,
+        'open' 反过来; speed 为每秒移动的像素数
+        """
+        centre_x = area['left'] + area['width'] / 2
+        centre_y = area['top'] + area['height'] / 2
+        outer = area['width'] / 2
+        inner = outer * (1 - percent)
+        start, end = (outer, inner) if gesture == 'close' else (inner, outer)
+        duration_ms = abs(outer - inner) / speed * 1000
+        self._tick(self._move(centre_x - start, centre_y), self._move(centre_x + start, centre_y))
+        self._tick({'type': 'pointerDown', 'button': 0}, {'type': 'pointerDown', 'button': 0})
+        self._tick(self._move(centre_x - end, centre_y, duration_ms), self._move(centre_x + end, centre_y, duration_ms))
+        self._tick({'type': 'pointerUp', 'button': 0}, {'type': 'pointerUp', 'button': 0})
+        self.gesture_count += 1
+        return self
+
+    def swipe(self, start, end, duration_ms):
+        """单指从 start (x, y) 滑动到 end (x, y), 第二根手指同时停顿"""
+        self._tick(self._move(*start), self._pause())
+        self._tick({'type': 'pointerDown', 'button': 0}, self._pause())
+        self._tick(self._move(*end, duration_ms), self._pause(duration_ms))
+        self._tick({'type': 'pointerUp', 'button': 0}, self._pause())
+        self.gesture_count += 1
+        return self
+
+    def pause(self, duration_ms):
+        self._tick(self._pause(duration_ms), self._pause(duration_ms))
+        return self
+
+    def build(self):
+        """返回 W3C Actions 请求体"""
+        return {'actions': [
+            {'type': 'pointer', 'id': f'finger{index + 1}', 'parameters': {'pointerType': 'touch'}, 'actions': actions}
+            for index, actions in enumerate(self.fingers)
+        ]}
+
+    def perform(self, driver, recorder=None):
+        """一次请求执行整个序列, 返回请求耗时 (秒); recorder 不为 None 时记录这次请求"""
+        start_time = time.perf_counter()
+        error = None
+        try:
+            driver.execute(W3C_ACTIONS_COMMAND, self.build())
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            latency = time.perf_counter() - start_time
+            if recorder is not None:
+                recorder.record(_device_name(driver), 'w3c: actions', {'gestures': self.gesture_count}, latency, error)
+        return latency
+
+
+def build_pinch_cycle(driver, profile, pause_ms):
+    """把一整轮 (repeats 次缩小 + repeats 次放大) 编译成一个 GestureSequence, 手势之间停顿 pause_ms 毫秒"""
+    geometry = get_screen_geometry(driver)
+    sequence = GestureSequence()
+    for gesture, ratio in (('close', profile['close_ratio']), ('open', profile['open_ratio'])):
+        area = geometry.central_area(ratio)
+        for _ in range(profile['repeats']):
+            sequence.pinch(gesture, area, profile['percent'], profile['speed']).pause(pause_ms)
+    return sequence
+
+
+# --- 手势延迟记录 ---
+# 记录每次 execute_script / W3C Actions 请求的时间、手势类型、参数和往返延迟;
+# 最近的记录保存在环形缓冲区中用于计算分位数, 新记录定期追加写入 CSV 或 JSONL (按扩展名)
+LATENCY_FIELDS = ('timestamp', 'device', 'gesture', 'latency_ms', 'error', 'params')
+
+
+def latency_percentiles(latencies_ms, percents=(50, 95, 99)):
+    """最近秩法计算分位数, 返回 {50: ..., 95: ..., 99: ...}; 没有数据时返回空字典"""
+    values = sorted(latencies_ms)
+    if not values:
+        return {}
+    return {percent: values[max(0, -(-percent * len(values) // 100) - 1)] for percent in percents}
+
+
+def format_percentiles(latencies_ms):
+    percentiles = latency_percentiles(latencies_ms)
+    if not percentiles:
+        return "无数据"
+    return ", ".join(f"p{percent} {value:.0f}ms" for percent, value in percentiles.items())
+
+
+class GestureRecorder:
+    """线程安全的手势延迟记录器"""
+
+    def __init__(self, output_path=None, capacity=10000, flush_interval=30.0):
+        """
+        output_path: .csv 或 .jsonl 文件, None 表示只在内存中保存
+        capacity: 环形缓冲区保存的最近记录数
+        flush_interval: 每隔多少秒把新记录追加写入文件
+        """
+        self.output_path = output_path
+        self.flush_interval = flush_interval
+        self.records = deque(maxlen=capacity)
+        self.total = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._cycle_start = 0
+        if output_path and os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    def record(self, device, gesture, params, latency, error=None):
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'device': device,
+            'gesture': gesture,
+            'latency_ms': round(latency * 1000, 3),
+            'error': error,
+            'params': params,
+        }
+        with self._lock:
+            self.records.append(entry)
+            self.total += 1
+            if self.output_path:
+                self._pending.append(entry)
+                if len(self._pending) >= self.records.maxlen or time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush_locked()
+        return entry
+
+    def snapshot(self, since=0):
+        """
+        返回 (total, 第 since 条之后新增的记录副本), 可在其他线程中调用;
+        已被环形缓冲区丢弃的旧记录不再返回
+        """
+        with self._lock:
+            new = self.total - since
+            start = max(len(self.records) - new, 0)
+            recent = [self.records[index] for index in range(start, len(self.records))] if new > 0 else []
+            return self.total, recent
+
+    def execute_script(self, driver, script, args):
+        """调用 driver.execute_script 并记录延迟; 出错时同样记录后再抛出"""
+        start_time = time.perf_counter()
+        try:
+            result = driver.execute_script(script, args)
+        except Exception as e:
+            self.record(_device_name(driver), script, args, time.perf_counter() - start_time, f"{type(e).__name__}: {e}")
+            raise
+        self.record(_device_name(driver), script, args, time.perf_counter() - start_time)
+        return result
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending or not self.output_path:
+            return
+        new_file = not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0
+        with open(self.output_path, 'a', newline='', encoding='utf-8') as file:
+            if self.output_path.lower().endswith('.csv'):
+                writer = csv.DictWriter(file, fieldnames=LATENCY_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                for entry in self._pending:
+                    writer.writerow(dict(entry, params=json.dumps(entry['params'], ensure_ascii=False)))
+            else:
+                for entry in self._pending:
+                    file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._pending = []
+
+    def latencies_ms(self, device=None, since=0):
+        """环形缓冲区中 (第 since 条记录之后) 的延迟, 可按设备过滤"""
+        with self._lock:
+            skip = max(0, len(self.records) - (self.total - since))
+            return [entry['latency_ms'] for index, entry in enumerate(self.records)
+                    if index >= skip and (device is None or entry['device'] == device)]
+
+    def cycle_summary(self, device=None):
+        """返回上次调用以来 (一轮) 的手势数和 p50/p95/p99"""
+        latencies = self.latencies_ms(device, self._cycle_start)
+        self._cycle_start = self.total
+        return f"本轮 {len(latencies)} 次请求, 延迟 {format_percentiles(latencies)}"
+
+    def close(self):
+        self.flush()
+
+
+def _device_name(driver):
+    capabilities = getattr(driver, 'capabilities', None) or {}
+    return capabilities.get('udid') or capabilities.get('deviceName') or getattr(driver, 'session_id', None)
+
+
+# --- 会话复用 / 热启动 ---
+# 新建 webdriver.Remote 会话要安装/启动 UiAutomator2 服务并初始化设备, 通常要十几秒;
+# 热启动模式下脚本结束时不关闭会话, 把会话 ID 保存到 SESSION_STATE_PATH, 下次直接重新连接;
+# 无法重新连接时再新建会话, 已经初始化过的设备会自动跳过服务安装和设备初始化
+WARM_START_CAPABILITIES = {
+    'skipServerInstallation': True,
+    'skipDeviceInitialization': True,
+    'disableWindowAnimation': True,
+}
+WARM_COMMAND_TIMEOUT = 3600 # 热启动时会话空闲多久 (秒) 后才被服务器关闭, 必须长于两次运行的间隔
+
+
+def _attached_remote_class(session_id):
+    """返回一个不新建会话、直接使用 session_id 的 webdriver.Remote 子类"""
+    class AttachedRemote(webdriver.Remote):
+        def start_session(self, capabilities, *args, **kwargs):
+            self.session_id = session_id
+            self.caps = {key.split(':', 1)[-1]: value for key, value in capabilities.items()}
+    return AttachedRemote
+
+
+def _options_device_key(options):
+    return getattr(options, 'udid', None) or options.device_name
+
+
+class SessionManager:
+    """打开 / 复用 Appium 会话, 并记录冷启动和热启动到第一个手势的耗时"""
+
+    def __init__(self, server=APPIUM_SERVER, warm=False, state_path=SESSION_STATE_PATH, history=20):
+        self.server = server
+        self.warm = warm
+        self.state_path = state_path
+        self.history = history
+        self._lock = threading.Lock()
+        self._starts = {} # session_id -> (设备, 启动方式, 开始时间)
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _update_device(self, device_key, update):
+        with self._lock:
+            state = self._load_state()
+            update(state.setdefault(device_key, {}))
+            with open(self.state_path, 'w', encoding='utf-8') as file:
+                json.dump(state, file, ensure_ascii=False, indent=1)
+
+    def open(self, options, server=None, recovery=False):
+        """
+        返回一个可用的 driver: 热启动时先尝试重新连接保存的会话, 否则新建会话
+        启动方式记为 'reattached' (复用会话), 'warm' (新会话但跳过初始化) 或 'cold';
+        recovery=True (会话崩溃后重建) 时记为 'recovered-<方式>', 不计入正常启动的冷/热比较
+        """
+        server = server or self.server
+        device_key = _options_device_key(options)
+        start_time = time.perf_counter()
+        device_state = self._load_state().get(device_key, {})
+
+        driver = None
+        mode = 'cold'
+        if self.warm and device_state.get('session_id') and device_state.get('server') == server:
+            try:
+                driver = _attached_remote_class(device_state['session_id'])(server, options=options)
+                get_screen_geometry(driver).window_size() # 一次请求验证会话仍然有效, 同时填充几何缓存
+                mode = 'reattached'
+            except Exception as e:
+                print(f"[{device_key}] 无法复用会话 {device_state['session_id']}: {type(e).__name__}, 新建会话")
+                if driver is not None:
+                    forget_screen_geometry(driver)
+                driver = None
+
+        if driver is None:
+            if self.warm:
+                options.set_capability('newCommandTimeout', WARM_COMMAND_TIMEOUT)
+                if device_state.get('provisioned'):
+                    for name, value in WARM_START_CAPABILITIES.items():
+                        options.set_capability(name, value)
+                    mode = 'warm'
+            driver = webdriver.Remote(server, options=options)
+        if recovery:
+            mode = f'recovered-{mode}'
+
+        def remember(entry):
+            entry['provisioned'] = True
+            entry['session_id'] = driver.session_id if self.warm else None
+            entry['server'] = server
+        self._update_device(device_key, remember)
+        self._starts[driver.session_id] = (device_key, mode, start_time)
+        print(f"[{device_key}] 会话已就绪 ({mode}), 耗时 {time.perf_counter() - start_time:.1f}s")
+        return driver
+
+    def first_gesture_done(self, driver):
+        """第一个手势完成后调用 (之后再调用不起作用), 记录启动到第一个手势的耗时"""
+        start = self._starts.pop(driver.session_id, None)
+        if start is None:
+            return None
+        device_key, mode, start_time = start
+        seconds = time.perf_counter() - start_time
+
+        def add_timing(entry):
+            timings = entry.setdefault('time_to_first_gesture', [])
+            timings.append({'mode': mode, 'seconds': round(seconds, 3), 'at': datetime.now().isoformat(timespec='seconds')})
+            del timings[:-self.history]
+        self._update_device(device_key, add_timing)
+        print(f"[{device_key}] 启动到第一个手势: {seconds:.1f}s ({mode})")
+        return seconds
+
+    def release(self, driver):
+        """热启动模式下保留会话供下次复用, 否则关闭会话"""
+        self._starts.pop(driver.session_id, None)
+        forget_screen_geometry(driver)
+        if self.warm:
+            print(f"保留会话 {driver.session_id} 供下次热启动")
+            return
+        driver.quit()
+
+    def report(self):
+        """按启动方式打印各设备的平均启动到第一个手势耗时"""
+        for device_key, entry in self._load_state().items():
+            by_mode = {}
+            for timing in entry.get('time_to_first_gesture', []):
+                by_mode.setdefault(timing['mode'], []).append(timing['seconds'])
+            summary = ", ".join(f"{mode} 平均 {sum(values) / len(values):.1f}s ({len(values)} 次)"
+                                for mode, values in sorted(by_mode.items()))
+            print(f"[{device_key}] 启动到第一个手势: {summary or '无记录'}")
+
+
+# --- 会话恢复 (无人值守长时间运行) ---
+# UiAutomator2 服务崩溃、会话超时或 Appium 重启后, 之后的每个请求都会报错, 原来的脚本就此结束;
+# SessionSupervisor 在请求出错且会话已经失效时重建会话 (指数退避重试), 并从出错的步骤继续
+class SessionSupervisor:
+    """包装 SessionManager.open, 会话失效时自动重建, 统计恢复次数和停机时间"""
+
+    def __init__(self, sessions, options, server=None, initial_backoff=1.0, max_backoff=60.0, max_attempts=None):
+        self.sessions = sessions
+        self.options = options
+        self.server = server
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts # 连续重建失败多少次后放弃, None 表示一直重试
+        self.driver = None
+        self.position = 0 # run() 中下一个要执行的步骤序号
+        self.recoveries = 0
+        self.downtime_seconds = 0.0
+        self.failures = [] # (时间, 出错的步骤序号, 错误)
+
+    def connect(self):
+        self.driver = self.sessions.open(self.options, self.server)
+        return self.driver
+
+    def session_alive(self):
+        """直接请求一次窗口大小 (不走几何缓存) 检查会话是否仍然有效"""
+        try:
+            self.driver.get_window_size()
+            return True
+        except Exception:
+            return False
+
+    def recover(self, error, step_index=None):
+        """丢弃失效的会话并重建, 重建失败时按 initial_backoff 起翻倍等待后重试; 返回新的 driver"""
+        down_since = time.perf_counter()
+        self.failures.append((datetime.now().isoformat(timespec='seconds'), step_index, f"{type(error).__name__}: {error}"))
+        device_key = _options_device_key(self.options)
+        print(f"[{device_key}] 会话失效 ({type(error).__name__}: {error}), 正在重建会话...")
+        forget_screen_geometry(self.driver)
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+        backoff = self.initial_backoff
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.driver = self.sessions.open(self.options, self.server, recovery=True)
+                break
+            except Exception as e:
+                if self.max_attempts and attempt >= self.max_attempts:
+                    raise
+                print(f"[{device_key}] 第 {attempt} 次重建失败 ({type(e).__name__}: {e}), {backoff:.0f}s 后重试")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        downtime = time.perf_counter() - down_since
+        self.recoveries += 1
+        self.downtime_seconds += downtime
+        print(f"[{device_key}] 会话已恢复 (第 {self.recoveries} 次, 停机 {downtime:.1f}s)"
+              + (f", 从第 {step_index + 1} 步继续" if step_index is not None else ""))
+        return self.driver
+
+    def call(self, step, step_index=None):
+        """
+        执行 step(driver); 出错且会话已失效时重建会话后重新执行这一步
+        会话仍然有效的错误 (例如参数错误) 照常抛出
+        """
+        while True:
+            try:
+                return step(self.driver)
+            except Exception as e:
+                if self.session_alive():
+                    raise
+                self.recover(e, step_index)
+
+    def run(self, steps, on_step=None):
+        """
+        依次执行 steps[self.position:] (每一步为 step(driver)), 会话失效时从出错的步骤继续;
+        每完成一步调用 on_step(序号)。全部完成后 position 归零, 返回本次完成的步骤数
+        """
+        completed = 0
+        while self.position < len(steps):
+            self.call(steps[self.position], self.position)
+            if on_step is not None:
+                on_step(self.position)
+            self.position += 1
+            completed += 1
+        self.position = 0
+        return completed
+
+    def report(self):
+        print(f"会话恢复 {self.recoveries} 次, 累计停机 {self.downtime_seconds:.1f}s")
+        for at, step_index, error in self.failures:
+            print(f"  {at} " + (f"第 {step_index + 1} 步 " if step_index is not None else "") + error)
+
+
+# --- 设备性能采样 ---
+# 缩放循环的目的是给地图渲染加压, 但原来不采集设备上的任何性能数据;
+# DeviceSampler 在后台线程按固定间隔通过 Appium 读取目标应用的 CPU、PSS 内存和帧耗时,
+# 每条采样记下当时已完成的手势数和这段时间内执行的手势, 便于对照是哪些手势造成卡顿或内存增长
+# 帧耗时来自 'dumpsys gfxinfo <包名> reset' (每次读取后清零, 因此每条采样只统计这一段时间),
+# 需要 Appium 服务器以 --allow-insecure=adb_shell 启动; 没有开启时只采集 CPU 和内存
+PERF_FIELDS = ('timestamp', 'device', 'gesture_index', 'gestures', 'gesture_types', 'cpu_user', 'cpu_kernel',
+               'total_pss_kb', 'frames', 'janky_frames', 'janky_percent',
+               'frame_p50_ms', 'frame_p90_ms', 'frame_p95_ms', 'frame_p99_ms')
+
+_GFXINFO_PATTERNS = {
+    'frames': re.compile(r'Total frames rendered:\s*(\d+)'),
+    'janky_frames': re.compile(r'Janky frames:\s*(\d+)'),
+    'janky_percent': re.compile(r'Janky frames:\s*\d+\s*\(([\d.]+)%\)'),
+    'frame_p50_ms': re.compile(r'50th percentile:\s*([\d.]+)ms'),
+    'frame_p90_ms': re.compile(r'90th percentile:\s*([\d.]+)ms'),
+    'frame_p95_ms': re.compile(r'95th percentile:\s*([\d.]+)ms'),
+    'frame_p99_ms': re.compile(r'99th percentile:\s*([\d.]+)ms'),
+}
+
+
+def parse_gfxinfo(output):
+    """从 dumpsys gfxinfo 的输出中提取帧数、卡顿帧和帧耗时分位数 (只取第一段, 即应用自身的统计)"""
+    values = {}
+    for field, pattern in _GFXINFO_PATTERNS.items():
+        match = pattern.search(output or '')
+        if match:
+            values[field] = int(match.group(1)) if field in ('frames', 'janky_frames') else float(match.group(1))
+    return values
+
+
+def _performance_table(data):
+    """mobile: getPerformanceData 返回 [表头, 数值行...], 转换为 {表头: 最后一行的数值}"""
+    if not data or len(data) < 2:
+        return {}
+    return {name: value for name, value in zip(data[0], data[-1])}
+
+
+class DeviceSampler:
+    """后台采集目标应用的 CPU / PSS 内存 / 帧耗时, 写入 CSV 或 JSONL 并与手势记录对齐"""
+
+    METRICS = ('cpu', 'memory', 'frames')
+
+    def __init__(self, driver, package=APP_PACKAGE, interval=5.0, output_path=None, recorder=None, metrics=METRICS):
+        """
+        driver: webdriver, 或返回当前 driver 的函数 (会话恢复后 driver 会变, 例如 lambda: supervisor.driver)
+        interval: 采样间隔秒数
+        output_path: .csv 或 .jsonl 文件, None 表示只在内存中保存
+        recorder: GestureRecorder, 用于记下每条采样时已完成的手势
+        """
+        self._driver = driver
+        self.package = package
+        self.interval = interval
+        self.output_path = output_path
+        self.recorder = recorder
+        self.metrics = [metric for metric in metrics if metric in self.METRICS]
+        self.samples = []
+        self.errors = {} # 各指标累计出错次数
+        self._failures = {} # 各指标连续出错次数 (不含会话失效引起的错误), 成功后清零
+        self._succeeded = set()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._gesture_index = 0
+        if output_path and os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    @property
+    def driver(self):
+        return self._driver() if callable(self._driver) else self._driver
+
+    def _read(self, driver, metric):
+        if metric == 'cpu':
+            table = _performance_table(driver.execute_script(
+                'mobile: getPerformanceData', {'packageName': self.package, 'dataType': 'cpuinfo'}))
+            return {'cpu_user': float(table['user']), 'cpu_kernel': float(table['kernel'])}
+        if metric == 'memory':
+            table = _performance_table(driver.execute_script(
+                'mobile: getPerformanceData', {'packageName': self.package, 'dataType': 'memoryinfo'}))
+            return {'total_pss_kb': int(float(table['totalPss']))}
+        output = driver.execute_script('mobile: shell', {'command': 'dumpsys', 'args': ['gfxinfo', self.package, 'reset']})
+        return parse_gfxinfo(output)
+
+    def _session_lost(self, driver):
+        """采样出错后判断是否因为会话失效: driver 已被替换 (正在或已经恢复), 或会话不再响应"""
+        if driver is not self.driver:
+            return True
+        try:
+            driver.get_window_size()
+            return False
+        except Exception:
+            return True
+
+    def _read_metric(self, metric):
+        """
+        读取一项指标; 出错时返回空字典。从未成功过的指标连续失败 3 次后不再采集,
+        会话失效 / 恢复期间的错误不计入 (由 SessionSupervisor 处理)
+        """
+        driver = self.driver
+        try:
+            values = self._read(driver, metric)
+        except Exception as e:
+            if self._session_lost(driver):
+                return {}
+            self.errors[metric] = self.errors.get(metric, 0) + 1
+            count = self._failures.get(metric, 0) + 1
+            self._failures[metric] = count
+            if self.errors[metric] == 1:
+                print(f"性能采样 {metric} 出错: {type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}")
+            if metric not in self._succeeded and count >= 3:
+                print(f"性能采样 {metric} 不可用, 停止采集这一项")
+                self.metrics.remove(metric)
+            return {}
+        self._failures[metric] = 0
+        self._succeeded.add(metric)
+        return values
+
+    def _interval_gestures(self):
+        """上次采样以来完成的手势数和各类手势次数"""
+        if self.recorder is None:
+            return self._gesture_index, 0, ''
+        total, recent = self.recorder.snapshot(self._gesture_index)
+        new = total - self._gesture_index
+        counts = {}
+        for entry in recent:
+            name = str(entry['gesture']).replace('mobile: ', '')
+            counts[name] = counts.get(name, 0) + 1
+        self._gesture_index = total
+        return total, new, " ".join(f"{name}:{count}" for name, count in counts.items())
+
+    def sample(self):
+        """采集一条样本并写入文件, 返回样本字典"""
+        entry = dict.fromkeys(PERF_FIELDS)
+        entry['timestamp'] = datetime.now().isoformat(timespec='milliseconds')
+        for metric in list(self.metrics):
+            entry.update(self._read_metric(metric))
+        entry['device'] = _device_name(self.driver)
+        entry['gesture_index'], entry['gestures'], entry['gesture_types'] = self._interval_gestures()
+        self.samples.append(entry)
+        if self.output_path:
+            new_file = not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0
+            with open(self.output_path, 'a', newline='', encoding='utf-8') as file:
+                if self.output_path.lower().endswith('.csv'):
+                    writer = csv.DictWriter(file, fieldnames=PERF_FIELDS)
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerow(entry)
+                else:
+                    file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        """清零帧统计并开始后台采样"""
+        if 'frames' in self.metrics:
+            self._read_metric('frames')
+        self._gesture_index = self.recorder.total if self.recorder is not None else 0
+        self._thread = threading.Thread(target=self._run, name='device-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止采样 (会再采最后一条, 覆盖最后一段时间)"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            self.sample()
+        except Exception:
+            pass
+
+    def summary(self, worst=3):
+        """返回可打印的汇总: CPU、内存增长、总体卡顿率和卡顿最严重的几段采样"""
+        if not self.samples:
+            return ["性能采样: 无数据"]
+        lines = []
+        cpu = [sample['cpu_user'] + sample['cpu_kernel'] for sample in self.samples if sample['cpu_user'] is not None]
+        if cpu:
+            lines.append(f"应用 CPU: 平均 {sum(cpu) / len(cpu):.1f}%, 最大 {max(cpu):.1f}%")
+        pss = [sample['total_pss_kb'] for sample in self.samples if sample['total_pss_kb'] is not None]
+        if pss:
+            lines.append(f"PSS 内存: {pss[0] / 1024:.1f}MB -> {pss[-1] / 1024:.1f}MB "
+                         f"(增长 {(pss[-1] - pss[0]) / 1024:+.1f}MB, 最大 {max(pss) / 1024:.1f}MB)")
+        framed = [sample for sample in self.samples if sample['frames']]
+        if framed:
+            frames = sum(sample['frames'] for sample in framed)
+            janky = sum(sample['janky_frames'] or 0 for sample in framed)
+            lines.append(f"帧: {frames} 帧, 卡顿 {janky} 帧 ({janky / frames * 100:.1f}%)")
+            for sample in sorted(framed, key=lambda sample: sample['janky_percent'] or 0, reverse=True)[:worst]:
+                lines.append(f"  {sample['timestamp']} 第 {sample['gesture_index']} 个手势前后: 卡顿 {sample['janky_percent']}%, "
+                             f"p99 {sample['frame_p99_ms']}ms, 手势 {sample['gesture_types'] or '无'}")
+        return lines
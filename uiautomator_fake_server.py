@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import base64
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# --- 本地模拟 Appium 服务器 ---
+# 测试脚本的吞吐量、等待策略和会话恢复原来都需要真机和 Appium 服务器;
+# 这里实现脚本用到的 WebDriver 接口 (新建/删除会话、窗口大小、屏幕方向、截图、
+# execute 'mobile: pinchOpenGesture' / 'mobile: pinchCloseGesture' 和 W3C Actions,
+# 以及性能采样用到的 'mobile: getPerformanceData' 和 'mobile: shell' dumpsys gfxinfo),
+# 可以设置人为延迟, 并注入手势错误、UiAutomator2 崩溃 (会话失效) 和会话创建失败
+#
+#   python uiautomator_fake_server.py --port 4723 --latency-ms 30 --crash-every 200
+#   python uiautomator_farm.py devices.csv --server http://127.0.0.1:4723
+GESTURE_SCRIPTS = ('mobile: pinchOpenGesture', 'mobile: pinchCloseGesture')
+MEMORY_FIELDS = ['totalPrivateDirty', 'nativePrivateDirty', 'dalvikPrivateDirty', 'eglPrivateDirty', 'glPrivateDirty',
+                 'totalPss', 'nativePss', 'dalvikPss', 'eglPss', 'glPss', 'nativeHeapAllocatedSize', 'nativeHeapSize']
+GFXINFO_TEMPLATE = """Applications Graphics Acceleration Info:
+** Graphics info for pid 4242 [{package}] **
+
+Stats since: {since}ns
+Total frames rendered: {frames}
+Janky frames: {janky} ({janky_percent:.2f}%)
+50th percentile: {p50}ms
+90th percentile: {p90}ms
+95th percentile: {p95}ms
+99th percentile: {p99}ms
+"""
+CRASH_MESSAGE = ("An unknown server-side error occurred while processing the command. Original error: "
+                 "cannot be proxied to UiAutomator2 server because the instrumentation process is not running (probably crashed)")
+
+
+class WebDriverError(Exception):
+    """以 W3C 错误格式返回给客户端的错误"""
+
+    def __init__(self, status, error, message):
+        super().__init__(message)
+        self.status = status
+        self.error = error
+        self.message = message
+
+
+def actions_duration(actions):
+    """
+    W3C Actions 请求在设备上执行的时间 (秒): 按 tick 执行, 每个 tick 取所有手指中最长的 duration
+    """
+    ticks = [source.get('actions', []) for source in actions]
+    seconds = 0.0
+    for tick in zip(*ticks) if ticks else ():
+        seconds += max(action.get('duration', 0) or 0 for action in tick) / 1000
+    return seconds
+
+
+def pinch_duration(args, window_size):
+    """pinch 手势的执行时间 (秒): 手指移动 percent * 操作区域半宽 (像素), 速度 speed 像素/秒"""
+    width = args.get('width') or window_size[0]
+    height = args.get('height') or window_size[1]
+    distance = args.get('percent', 0.5) * max(width, height) / 2
+    return distance / max(args.get('speed', 2500), 1)
+
+
+class FakeAppiumServer:
+    """
+    模拟 Appium 服务器, 可以在后台线程运行 (start / stop), 也可以直接 serve_forever
+
+    latency_ms / jitter_ms: 每个请求的人为延迟 (毫秒) 和随机抖动上限
+    gesture_time: 手势请求按手势本身的执行时间阻塞 (与真机相同), 否则立即返回
+    error_rate: 手势请求失败 (会话仍然有效) 的概率
+    crash_every: 每 N 个手势请求模拟一次 UiAutomator2 崩溃, 该会话随之失效; 0 表示不模拟
+    recovery_failures: 每次崩溃之后, 接下来的多少次新建会话请求失败 (模拟服务重启)
+    render_frames: 每个手势之后截图还会变化的次数 (模拟地图渲染), 之后截图保持不变
+    allow_adb_shell: False 时 'mobile: shell' 与没有 --allow-insecure=adb_shell 的真实服务器一样报错
+    模拟的性能数据随手势变化: 手势越密集 CPU 和卡顿率越高, 每个手势 PSS 增长约 50KB
+    """
+
+    def __init__(self, host='127.0.0.1', port=4723, latency_ms=0.0, jitter_ms=0.0, gesture_time=False,
+                 error_rate=0.0, crash_every=0, recovery_failures=0, window_size=(1080, 2340), render_frames=2,
+                 seed=None, allow_adb_shell=True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.gesture_time = gesture_time
+        self.error_rate = error_rate
+        self.crash_every = crash_every
+        self.recovery_failures = recovery_failures
+        self.window_size = window_size
+        self.render_frames = render_frames
+        self.allow_adb_shell = allow_adb_shell
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sessions = {} # session_id -> {'capabilities', 'frames_left', 'frame', 性能数据计数}
+        self._pending_create_failures = 0
+        self._gestures_since_crash = 0
+        self._stats = {'commands': {}, 'sessions_created': 0, 'sessions_deleted': 0, 'gestures': 0,
+                       'injected_errors': 0, 'crashes': 0, 'failed_session_creations': 0}
+        self._thread = None
+        handler = type('FakeAppiumHandler', (_FakeAppiumHandler,), {'fake': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程运行, 返回 self (port=0 时自动选择端口, 见 url)"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, commands=dict(self._stats['commands']), active_sessions=len(self._sessions))
+
+    # --- 命令处理 ---
+    def _count(self, command):
+        with self._lock:
+            self._stats['commands'][command] = self._stats['commands'].get(command, 0) + 1
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise WebDriverError(404, 'invalid session id',
+                                 'A session is either terminated or not started')
+        return session
+
+    def _delay(self):
+        if self.latency_ms or self.jitter_ms:
+            time.sleep((self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000)
+
+    def new_session(self, body):
+        with self._lock:
+            if self._pending_create_failures > 0:
+                self._pending_create_failures -= 1
+                self._stats['failed_session_creations'] += 1
+                raise WebDriverError(500, 'session not created',
+                                     'Could not start a new session. UiAutomator2 server is restarting')
+            capabilities = {name.split(':', 1)[-1]: value # 与 Appium 相同, 返回的能力去掉 appium: 前缀
+                            for name, value in body.get('capabilities', {}).get('alwaysMatch', {}).items()}
+            session_id = str(uuid.uuid4())
+            now = time.monotonic()
+            self._sessions[session_id] = {'capabilities': capabilities, 'frames_left': 0, 'frame': 0, 'gestures': 0,
+                                          'cpu_read': (now, 0), 'gfx_reset': (now, 0)}
+            self._stats['sessions_created'] += 1
+        capabilities.update({'platformName': capabilities.get('platformName', 'Android'),
+                             'deviceScreenSize': f"{self.window_size[0]}x{self.window_size[1]}"})
+        return {'sessionId': session_id, 'capabilities': capabilities}
+
+    def delete_session(self, session_id, body=None):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._stats['sessions_deleted'] += 1
+        return None
+
+    def _gesture(self, session_id, seconds):
+        """一个手势请求: 按概率注入错误或崩溃, 否则按执行时间阻塞, 之后截图开始变化"""
+        with self._lock:
+            session = self._session(session_id)
+            self._stats['gestures'] += 1
+            self._gestures_since_crash += 1
+            if self.crash_every and self._gestures_since_crash >= self.crash_every:
+                self._gestures_since_crash = 0
+                self._sessions.pop(session_id, None)
+                self._pending_create_failures = self.recovery_failures
+                self._stats['crashes'] += 1
+                raise WebDriverError(500, 'unknown error', CRASH_MESSAGE)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self._stats['injected_errors'] += 1
+                raise WebDriverError(500, 'unknown error', 'Injected gesture failure')
+        if self.gesture_time:
+            time.sleep(seconds)
+        with self._lock:
+            session['frames_left'] = self.render_frames
+            session['gestures'] += 1
+        return None
+
+    def execute_script(self, session_id, body):
+        script = body.get('script')
+        args = (body.get('args') or [{}])[0] or {}
+        if script == 'mobile: getPerformanceData':
+            return self.performance_data(session_id, args)
+        if script == 'mobile: shell':
+            return self.shell(session_id, args)
+        if script not in GESTURE_SCRIPTS:
+            self._session(session_id)
+            raise WebDriverError(404, 'unknown command', f"Unsupported execute method '{script}'")
+        return self._gesture(session_id, pinch_duration(args, self.window_size))
+
+    def _gesture_rate(self, session, key):
+        """上次读取 key 以来每秒的手势数, 并把读取点移到现在"""
+        now = time.monotonic()
+        since, gestures = session[key]
+        session[key] = (now, session['gestures'])
+        return (session['gestures'] - gestures) / max(now - since, 1e-3), now - since, session['gestures'] - gestures
+
+    def performance_data(self, session_id, args):
+        with self._lock:
+            session = self._session(session_id)
+            if args.get('dataType') == 'cpuinfo':
+                rate, _, _ = self._gesture_rate(session, 'cpu_read')
+                user = min(70.0, 4.0 + rate * 12 + self._random.uniform(0, 2))
+                return [['user', 'kernel'], [f"{user:.1f}", f"{user / 3:.1f}"]]
+            if args.get('dataType') == 'memoryinfo':
+                pss = 180000 + session['gestures'] * 50 + self._random.randint(0, 500)
+                values = [pss // 2, pss // 4, pss // 8, 0, 0, pss, pss // 3, pss // 6, 0, 0, pss * 4, pss * 5]
+                return [MEMORY_FIELDS, [str(value) for value in values]]
+        raise WebDriverError(400, 'invalid argument', f"Unsupported data type '{args.get('dataType')}'")
+
+    def shell(self, session_id, args):
+        if not self.allow_adb_shell:
+            self._session(session_id)
+            raise WebDriverError(500, 'unknown error', "Potentially insecure feature 'adb_shell' has not been enabled. "
+                                                       "If you want to enable this feature and accept the security "
+                                                       "ramifications, please do so by following the documented instructions")
+        command = [args.get('command', '')] + list(args.get('args', []))
+        if command[:2] != ['dumpsys', 'gfxinfo']:
+            return ''
+        with self._lock:
+            session = self._session(session_id)
+            reset_point = session['gfx_reset']
+            rate, seconds, _ = self._gesture_rate(session, 'gfx_reset')
+            if 'reset' not in command:
+                session['gfx_reset'] = reset_point # 不带 reset 时统计继续累计
+        frames = int(seconds * 60)
+        janky_percent = min(60.0, rate * 8 + self._random.uniform(0, 1)) if frames else 0.0
+        p50 = 8 + int(rate * 2)
+        return GFXINFO_TEMPLATE.format(package=command[2] if len(command) > 2 else '', since=time.monotonic_ns(),
+                                       frames=frames, janky=int(frames * janky_percent / 100), janky_percent=janky_percent,
+                                       p50=p50, p90=p50 * 2, p95=p50 * 3, p99=p50 * 5)
+
+    def perform_actions(self, session_id, body):
+        return self._gesture(session_id, actions_duration(body.get('actions', [])))
+
+    def release_actions(self, session_id, body):
+        self._session(session_id)
+        return None
+
+    def window_rect(self, session_id, body=None):
+        self._session(session_id)
+        return {'x': 0, 'y': 0, 'width': self.window_size[0], 'height': self.window_size[1]}
+
+    def window_size_legacy(self, session_id, body=None):
+        self._session(session_id)
+        return {'width': self.window_size[0], 'height': self.window_size[1]}
+
+    def orientation(self, session_id, body=None):
+        self._session(session_id)
+        return 'PORTRAIT'
+
+    def screenshot(self, session_id, body=None):
+        """手势之后的 render_frames 张截图各不相同, 之后不再变化 (截图对比等待据此判断地图静止)"""
+        with self._lock:
+            session = self._session(session_id)
+            if session['frames_left'] > 0:
+                session['frames_left'] -= 1
+                session['frame'] += 1
+            frame = session['frame']
+        return base64.b64encode(f"fake screenshot frame {frame}".encode('ascii')).decode('ascii')
+
+    def status(self, body=None):
+        return {'ready': True, 'message': 'fake appium server', 'build': {'version': 'fake'}}
+
+
+_SESSION = r'/session/(?P<session_id>[^/]+)'
+_ROUTES = [
+    ('GET', re.compile(r'/status$'), 'status'),
+    ('POST', re.compile(r'/session$'), 'new_session'),
+    ('DELETE', re.compile(_SESSION + r'$'), 'delete_session'),
+    ('POST', re.compile(_SESSION + r'/execute/sync$'), 'execute_script'),
+    ('POST', re.compile(_SESSION + r'/actions$'), 'perform_actions'),
+    ('DELETE', re.compile(_SESSION + r'/actions$'), 'release_actions'),
+    ('GET', re.compile(_SESSION + r'/window/rect$'), 'window_rect'),
+    ('GET', re.compile(_SESSION + r'/window/(?:current/)?size$'), 'window_size_legacy'),
+    ('GET', re.compile(_SESSION + r'/orientation$'), 'orientation'),
+    ('GET', re.compile(_SESSION + r'/screenshot$'), 'screenshot'),
+]
+
+
+class _FakeAppiumHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # 与 selenium 的连接池一样保持连接
+    disable_nagle_algorithm = True # 响应头和响应体分两次写出, 否则保持连接时每个请求多等约 40ms (延迟确认)
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, value):
+        payload = json.dumps({'value': value}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/wd/hub'):
+            path = path[len('/wd/hub'):]
+        if method == 'GET' and path == '/fake/stats':
+            self._reply(200, self.fake.stats())
+            return
+
+        for route_method, pattern, name in _ROUTES:
+            match = pattern.match(path)
+            if route_method != method or match is None:
+                continue
+            self.fake._count(name)
+            self.fake._delay()
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+                value = getattr(self.fake, name)(*match.groups(), body)
+            except WebDriverError as e:
+                self._reply(e.status, {'error': e.error, 'message': e.message, 'stacktrace': ''})
+            except ValueError as e:
+                self._reply(400, {'error': 'invalid argument', 'message': str(e), 'stacktrace': ''})
+            except Exception as e:
+                self._reply(500, {'error': 'unknown error', 'message': f"{type(e).__name__}: {e}", 'stacktrace': ''})
+            else:
+                self._reply(200, value)
+            return
+        self._reply(404, {'error': 'unknown command', 'message': f"{method} {path} 未实现", 'stacktrace': ''})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟 Appium 服务器, 无需手机即可测试手势脚本的吞吐量、等待和会话恢复")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址 (默认 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=4723, help="监听端口 (默认 4723, 与 APPIUM_SERVER 相同)")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="每个请求的人为延迟毫秒数 (默认 0)")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="在延迟之上再加 0~N 毫秒的随机抖动 (默认 0)")
+    parser.add_argument('--gesture-time', action='store_true', help="手势请求按手势本身的执行时间阻塞 (与真机相同)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="手势请求失败 (会话仍然有效) 的概率 (默认 0)")
+    parser.add_argument('--crash-every', type=int, default=0, help="每 N 个手势请求模拟一次 UiAutomator2 崩溃 (默认 0, 不模拟)")
+    parser.add_argument('--recovery-failures', type=int, default=0, help="每次崩溃后接下来多少次新建会话失败 (默认 0)")
+    parser.add_argument('--window-size', default='1080x2340', help="屏幕尺寸 宽x高 (默认 1080x2340)")
+    parser.add_argument('--render-frames', type=int, default=2, help="每个手势之后截图还会变化的次数 (默认 2)")
+    parser.add_argument('--seed', type=int, help="随机数种子 (抖动和错误注入可重复)")
+    parser.add_argument('--deny-adb-shell', action='store_true',
+                        help="'mobile: shell' 报错, 与没有 --allow-insecure=adb_shell 的真实服务器相同")
+    args = parser.parse_args(argv)
+
+    width, height = (int(value) for value in args.window_size.lower().split('x'))
+    server = FakeAppiumServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.gesture_time, args.error_rate,
+                              args.crash_every, args.recovery_failures, (width, height), args.render_frames, args.seed,
+                              not args.deny_adb_shell)
+    print(f"模拟 Appium 服务器已启动: {server.url} (统计: {server.url}/fake/stats), Ctrl+C 停止")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("手动停止")
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats(), ensure_ascii=False, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
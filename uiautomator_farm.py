@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import csv
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from uiautomator_core import (APPIUM_SERVER, DEFAULT_SYSTEM_PORT, PINCH_PROFILES, build_options,
+                              GestureRecorder, SessionManager, build_pinch_cycle, forget_screen_geometry, format_percentiles,
+                              make_pacing, perform_pinch)
+
+
+# --- 多设备并行压力测试 ---
+# 每台手机原来需要一份单独的脚本 (设备号和系统版本写死在 options 里);
+# 这里从设备清单读取所有设备, 每台设备一个线程、一个 Appium 会话和独立的 systemPort, 同时执行缩放循环
+def load_inventory(path):
+    """
+    读取设备清单, 支持 JSON (对象列表) 和 CSV (带表头)
+    字段: device_name, platform_version, 可选 system_port / udid / server
+    没有指定 system_port 的设备从 DEFAULT_SYSTEM_PORT 开始依次分配
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.lower().endswith('.json'):
+            devices = json.load(file)
+        else:
+            devices = [row for row in csv.DictReader(file) if any((value or '').strip() for value in row.values())]
+
+    used_ports = {int(device['system_port']) for device in devices if device.get('system_port')}
+    next_port = DEFAULT_SYSTEM_PORT
+    inventory = []
+    for device in devices:
+        if not device.get('device_name') or not device.get('platform_version'):
+            raise ValueError(f"设备清单中缺少 device_name 或 platform_version: {device}")
+        system_port = int(device['system_port']) if device.get('system_port') else None
+        if system_port is None:
+            while next_port in used_ports:
+                next_port += 1
+            system_port = next_port
+            used_ports.add(system_port)
+        inventory.append({
+            'device_name': str(device['device_name']),
+            'platform_version': str(device['platform_version']),
+            'system_port': system_port,
+            'udid': device.get('udid') or None,
+            'server': device.get('server') or None,
+        })
+    return inventory
+
+
+def _run_cycle(driver, profile, stats, pacing, stop_event, recorder=None, sessions=None):
+    """一轮缩小/放大, 每个手势一次请求"""
+    for gesture, ratio in (('close', profile['close_ratio']), ('open', profile['open_ratio'])):
+        for _ in range(profile['repeats']):
+            if stop_event.is_set():
+                return
+            latency = perform_pinch(driver, gesture, profile['percent'], ratio, profile['speed'], recorder)
+            stats['requests'] += 1
+            stats['gestures'][gesture] += 1
+            stats['latencies'][gesture].append(latency)
+            if sessions is not None:
+                sessions.first_gesture_done(driver)
+            pacing.wait(driver, stop_event)
+
+
+def _run_batched_cycle(driver, cycle, profile, stats, pacing, stop_event, recorder=None, sessions=None):
+    """一轮缩小/放大, 整轮只发一个 W3C Actions 请求"""
+    latency = cycle.perform(driver, recorder)
+    stats['requests'] += 1
+    for gesture in ('close', 'open'):
+        stats['gestures'][gesture] += profile['repeats']
+        stats['latencies'][gesture].extend([latency / cycle.gesture_count] * profile['repeats'])
+    if sessions is not None:
+        sessions.first_gesture_done(driver)
+    pacing.wait(driver, stop_event)
+
+
+def run_device(device, profile, duration, stop_event, server=APPIUM_SERVER, pacing_mode='idle', batch_pause_ms=None,
+               recorder=None, sessions=None):
+    """
+    工作线程: 为一台设备打开会话并循环执行缩小/放大, 直到超时或 stop_event 被设置
+    pacing_mode: 'idle' 截图不再变化就继续 (最多等 profile['pause'] 秒), 'fixed' 固定等待
+    batch_pause_ms: 不为 None 时每一轮手势编译成一个 W3C Actions 请求, 手势之间在设备上停顿这么多毫秒;
+                    此时延迟为整轮请求耗时平摊到每个手势
+    recorder: 共享的 GestureRecorder, 记录每次请求
+    sessions: 共享的 SessionManager, 默认每次新建并在结束时关闭会话 (冷启动)
+    错误不抛出, 记录在返回的统计中
+    """
+    name = device['device_name']
+    stats = {
+        'device': name,
+        'system_port': device['system_port'],
+        'gestures': {'close': 0, 'open': 0},
+        'latencies': {'close': [], 'open': []},
+        'requests': 0,
+        'error': None,
+        'seconds': 0.0,
+        'wait_seconds': 0.0,
+    }
+    pacing = make_pacing(pacing_mode, profile['pause'])
+    sessions = sessions or SessionManager(server, warm=False)
+    start_time = time.time()
+    driver = None
+    try:
+        options = build_options(name, device['platform_version'], device['system_port'], device['udid'])
+        driver = sessions.open(options, device['server'] or server)
+        print(f"[{name}] 连接成功 (systemPort {device['system_port']})")
+        make_pacing(pacing_mode, 5).wait(driver, stop_event)
+
+        cycle = build_pinch_cycle(driver, profile, batch_pause_ms) if batch_pause_ms is not None else None
+        while not stop_event.is_set() and (not duration or time.time() - start_time < duration):
+            cycle_start = {gesture: len(latencies) for gesture, latencies in stats['latencies'].items()}
+            if cycle is not None:
+                _run_batched_cycle(driver, cycle, profile, stats, pacing, stop_event, recorder, sessions)
+            else:
+                _run_cycle(driver, profile, stats, pacing, stop_event, recorder, sessions)
+            cycle_latencies = [latency * 1000 for gesture, latencies in stats['latencies'].items()
+                               for latency in latencies[cycle_start[gesture]:]]
+            print(f"[{name}] 缩小 {stats['gestures']['close']} 次, 放大 {stats['gestures']['open']} 次, "
+                  f"持续运行时间: {int(time.time() - start_time)}秒, 本轮延迟 {format_percentiles(cycle_latencies)}")
+    except Exception as e:
+        stats['error'] = f"{type(e).__name__}: {e}"
+        print(f"[{name}] 出错: {stats['error']}")
+    finally:
+        if driver is not None:
+            geometry = forget_screen_geometry(driver)
+            if geometry is not None:
+                stats['saved_round_trips'] = geometry.saved_round_trips
+            try:
+                sessions.release(driver)
+            except Exception:
+                pass
+            print(f"[{name}] 驱动关闭")
+        stats['seconds'] = time.time() - start_time
+        stats['wait_seconds'] = pacing.total_seconds
+    return stats
+
+
+def run_farm(inventory, profile, duration=600, server=APPIUM_SERVER, pacing_mode='idle', batch_pause_ms=None,
+             recorder=None, warm=False):
+    """
+    在清单中的所有设备上同时运行缩放循环, Ctrl+C 会让所有设备停止
+
+    Returns:
+        list: 每台设备的统计, 顺序与清单相同
+    """
+    stop_event = threading.Event()
+    sessions = SessionManager(server, warm=warm)
+    with ThreadPoolExecutor(max_workers=len(inventory)) as executor:
+        futures = [executor.submit(run_device, device, profile, duration, stop_event, server, pacing_mode,
+                                   batch_pause_ms, recorder, sessions)
+                   for device in inventory]
+        try:
+            while not all(future.done() for future in futures):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            print("手动停止, 等待所有设备结束当前手势...")
+            stop_event.set()
+        results = [future.result() for future in futures]
+    sessions.report()
+    return results
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return "-"
+    return f"平均 {sum(latencies) / len(latencies) * 1000:.0f}ms / 最大 {max(latencies) * 1000:.0f}ms"
+
+
+def print_report(results):
+    """打印每台设备的手势次数和延迟, 以及总计"""
+    print("\n" + "-" * 96)
+    print(f"{'设备':<18}{'端口':>6}{'缩小':>7}{'放大':>7}{'请求':>7}   {'缩小延迟':<26}{'放大延迟':<26}{'次/秒':>7}  状态")
+    print("-" * 96)
+    for result in results:
+        status = f"失败: {result['error']}" if result['error'] else "完成"
+        gestures = result['gestures']['close'] + result['gestures']['open']
+        rate = gestures / result['seconds'] if result['seconds'] > 0 else 0.0
+        print(f"{result['device']:<18}{result['system_port']:>6}{result['gestures']['close']:>7}{result['gestures']['open']:>7}{result['requests']:>7}   "
+              f"{_latency_summary(result['latencies']['close']):<26}{_latency_summary(result['latencies']['open']):<26}{rate:>7.2f}  {status}")
+    print("-" * 96)
+    all_latencies = [latency for result in results for values in result['latencies'].values() for latency in values]
+    total_gestures = len(all_latencies)
+    longest = max((result['seconds'] for result in results), default=0.0)
+    print(f"设备 {len(results)} 台, 失败 {sum(1 for result in results if result['error'])} 台, "
+          f"总手势 {total_gestures} 次, 请求 {sum(result['requests'] for result in results)} 次, 延迟 {_latency_summary(all_latencies)}, "
+          f"{total_gestures / longest if longest > 0 else 0:.2f} 次/秒")
+    print(f"延迟分位数: {format_percentiles([latency * 1000 for latency in all_latencies])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多设备并行缩放压力测试")
+    parser.add_argument('inventory', help="设备清单 (JSON 或 CSV): device_name, platform_version[, system_port, udid, server]")
+    parser.add_argument('--profile', choices=sorted(PINCH_PROFILES), default='time',
+                        help="缩放参数, 与 uiautomator_simple / uiautomator_time 相同 (默认 time)")
+    parser.add_argument('--duration', type=float, default=600, help="运行秒数, 0 表示一直运行直到 Ctrl+C (默认 600)")
+    parser.add_argument('--pacing', choices=('idle', 'fixed'), default='idle',
+                        help="手势之后的等待方式: idle 截图不再变化就继续, fixed 固定等待 (默认 idle)")
+    parser.add_argument('--batch', action='store_true', help="每一轮手势编译成一个 W3C Actions 请求 (对比逐个手势请求的吞吐量)")
+    parser.add_argument('--batch-pause-ms', type=int, default=500, help="批量模式下手势之间在设备上的停顿毫秒数 (默认 500)")
+    parser.add_argument('--warm', action='store_true',
+                        help="热启动: 复用上次保留的会话, 或跳过已初始化设备的服务安装; 结束时保留会话")
+    parser.add_argument('--latency-log', metavar='PATH', help="把每次请求的延迟定期追加写入 CSV 或 JSONL 文件")
+    parser.add_argument('--server', default=APPIUM_SERVER, help=f"Appium 服务器地址 (默认 {APPIUM_SERVER})")
+    args = parser.parse_args(argv)
+
+    inventory = load_inventory(args.inventory)
+    if not inventory:
+        print("设备清单为空。")
+        return 1
+    print(f"共 {len(inventory)} 台设备, 参数 '{args.profile}', 等待方式 '{args.pacing}', 服务器 {args.server}")
+    recorder = GestureRecorder(args.latency_log) if args.latency_log else None
+    try:
+        results = run_farm(inventory, PINCH_PROFILES[args.profile], args.duration, args.server, args.pacing,
+                           args.batch_pause_ms if args.batch else None, recorder, args.warm)
+    finally:
+        if recorder is not None:
+            recorder.close()
+            print(f"请求延迟记录已保存到: {args.latency_log}")
+    print_report(results)
+    return 1 if any(result['error'] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
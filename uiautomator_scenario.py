@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from uiautomator_core import (APP_PACKAGE, APPIUM_SERVER, PACING_MODES, DeviceSampler, GestureRecorder, GestureSequence,
+                              SessionManager, SessionSupervisor, build_options, format_percentiles, get_screen_geometry, make_pacing,
+                              print_geometry_stats, print_pacing_stats)
+
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios')
+
+
+# --- 声明式手势场景 ---
+# uiautomator_time.py 和 uiautomator_simple.py 只在设备参数、缩放比例/速度、等待时间和循环次数上不同;
+# 这里把这些写进 YAML/JSON 场景文件 (例如 scenarios/time.yaml), 新的压力测试只需要新的场景文件。
+# 场景只编译一次: 展开 repeat、检查参数, 会话建立后再把操作区域换算成像素并生成每一步的请求参数,
+# 执行时循环只是依次发送预先生成好的请求
+#
+# 场景文件格式:
+#   name: time
+#   server: http://localhost:4723
+#   device: {device_name: "2a36f8ac", platform_version: "11", capabilities: {...}}
+#   warm_start: false           # true 时复用会话 (见 uiautomator_core.SessionManager), 默认 false
+#   pacing: idle                # 手势之后的等待方式: idle / fixed
+#   startup_wait: 5             # 连接后等待秒数
+#   time_budget: 600            # 总运行秒数, 省略表示一直运行直到 Ctrl+C
+#   batch: false                # true 时连续的手势编译成一个 W3C Actions 请求
+#   latency_log: latency_logs/time.csv
+#   sampling: {interval: 5, output: latency_logs/time_perf.csv}  # 设备性能采样 (见 uiautomator_core.DeviceSampler)
+#   cycle:                      # 每一轮依次执行的步骤
+#     - repeat: 15
+#       steps:
+#         - pinch: {gesture: close, percent: 0.6, area: 0.4, speed: 1200, pause: 3}
+#     - swipe: {from: [0.5, 0.7], to: [0.5, 0.3], duration_ms: 400, pause: 1}
+#     - wait: 10
+def load_scenario(path):
+    """读取 YAML (.yaml / .yml) 或 JSON 场景文件"""
+    with open(path, encoding='utf-8') as file:
+        if path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml # 仅 YAML 场景需要 PyYAML
+            except ImportError:
+                raise ImportError("读取 YAML 场景需要 PyYAML (pip install pyyaml), 或改用 JSON 场景文件")
+            scenario = yaml.safe_load(file)
+        else:
+            scenario = json.load(file)
+    if not isinstance(scenario, dict):
+        raise ValueError(f"场景文件 '{path}' 的内容必须是一个对象")
+    return scenario
+
+
+def _number(step, key, default=None, minimum=0.0, where=""):
+    value = step.get(key, default)
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ValueError(f"{where}: '{key}' 必须是不小于 {minimum} 的数字, 实际为 {value!r}")
+    return value
+
+
+def _fraction(step, key, default=None, where=""):
+    """屏幕比例参数 (缩放比例、操作区域): 0 < value <= 1"""
+    value = _number(step, key, default, where=where)
+    if not 0 < value <= 1:
+        raise ValueError(f"{where}: '{key}' 必须大于 0 且不大于 1, 实际为 {value!r}")
+    return value
+
+
+def _compile_steps(steps, where):
+    """展开 repeat 并检查每一步, 返回扁平的步骤列表"""
+    if not isinstance(steps, list) or not steps:
+        raise ValueError(f"{where}: 步骤列表不能为空")
+    compiled = []
+    for index, step in enumerate(steps, 1):
+        step_where = f"{where} 第 {index} 步"
+        if not isinstance(step, dict) or len(step) != (2 if 'repeat' in step else 1):
+            raise ValueError(f"{step_where}: 每一步只能是 pinch / swipe / wait 之一, 或 repeat + steps")
+        if 'repeat' in step:
+            count = step['repeat']
+            if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+                raise ValueError(f"{step_where}: repeat 必须是正整数")
+            compiled.extend(_compile_steps(step.get('steps'), step_where) * count)
+            continue
+
+        kind, params = next(iter(step.items()))
+        if kind in ('pinch', 'swipe') and not isinstance(params, dict):
+            raise ValueError(f"{step_where}: {kind} 的参数必须是一个对象, 实际为 {params!r}")
+        if kind == 'pinch':
+            if params.get('gesture') not in ('close', 'open'):
+                raise ValueError(f"{step_where}: pinch 的 gesture 必须是 close 或 open")
+            compiled.append(('pinch', params['gesture'],
+                             _fraction(params, 'percent', where=step_where),
+                             _fraction(params, 'area', 0.4, where=step_where),
+                             _number(params, 'speed', 1500, minimum=1, where=step_where),
+                             _number(params, 'pause', 0, where=step_where)))
+        elif kind == 'swipe':
+            points = [params.get('from'), params.get('to')]
+            if not all(isinstance(point, list) and len(point) == 2 and all(0 <= value <= 1 for value in point)
+                       for point in points):
+                raise ValueError(f"{step_where}: swipe 的 from / to 必须是 [x, y] 屏幕比例 (0~1)")
+            compiled.append(('swipe', tuple(points[0]), tuple(points[1]),
+                             _number(params, 'duration_ms', 300, where=step_where),
+                             _number(params, 'pause', 0, where=step_where)))
+        elif kind == 'wait':
+            seconds = params if not isinstance(params, dict) else params.get('seconds')
+            mode = params.get('mode') if isinstance(params, dict) else None
+            if mode is not None and mode not in PACING_MODES:
+                raise ValueError(f"{step_where}: wait 的 mode 必须是 {' 或 '.join(PACING_MODES)}, 实际为 {mode!r}")
+            compiled.append(('wait', _number({'seconds': seconds}, 'seconds', where=step_where), mode))
+        else:
+            raise ValueError(f"{step_where}: 未知的步骤类型 '{kind}'")
+    return compiled
+
+
+class ScenarioPlan:
+    """编译后的场景: 检查过的设置和展开后的步骤"""
+
+    def __init__(self, scenario, source=None):
+        name = scenario.get('name') or os.path.splitext(os.path.basename(source or 'scenario'))[0]
+        device = scenario.get('device') or {}
+        if not device.get('device_name') or not device.get('platform_version'):
+            raise ValueError(f"场景 '{name}': device 需要 device_name 和 platform_version")
+        pacing = scenario.get('pacing', 'idle')
+        if pacing not in PACING_MODES:
+            raise ValueError(f"场景 '{name}': pacing 必须是 {' 或 '.join(PACING_MODES)}")
+
+        self.name = name
+        self.server = scenario.get('server') or APPIUM_SERVER
+        self.device = device
+        self.warm_start = bool(scenario.get('warm_start', False))
+        self.pacing = pacing
+        self.startup_wait = _number(scenario, 'startup_wait', 5, where=f"场景 '{name}'")
+        self.time_budget = scenario.get('time_budget')
+        if self.time_budget is not None:
+            self.time_budget = _number(scenario, 'time_budget', where=f"场景 '{name}'")
+        self.batch = bool(scenario.get('batch', False))
+        self.latency_log = scenario.get('latency_log')
+        self.sampling = scenario.get('sampling')
+        if self.sampling is not None:
+            self.sampling = dict(self.sampling)
+            _number(self.sampling, 'interval', 5, minimum=0.1, where=f"场景 '{name}' sampling")
+        self.steps = _compile_steps(scenario.get('cycle'), f"场景 '{name}' cycle")
+
+    def build_options(self):
+        options = build_options(str(self.device['device_name']), str(self.device['platform_version']),
+                                self.device.get('system_port'), self.device.get('udid'),
+                                **{key: self.device[key] for key in ('app_package', 'app_activity') if key in self.device})
+        for name, value in (self.device.get('capabilities') or {}).items():
+            options.set_capability(name, value)
+        return options
+
+    def bind(self, driver):
+        """
+        会话建立后把步骤换算成可以直接发送的操作 (只做一次):
+        ('script', 脚本名, 参数, 等待) / ('actions', GestureSequence, 等待) / ('wait', 等待)
+        batch 模式下连续的手势合并成一个 GestureSequence, 手势之间的 pause 变成设备上的固定停顿
+        """
+        geometry = get_screen_geometry(driver)
+        window_size = geometry.window_size()
+        pacings = {}
+
+        def pacing_for(seconds, mode=None):
+            if seconds == 0:
+                return None # pause: 0 表示不等待 (idle 模式也不截图)
+            key = (mode or self.pacing, seconds)
+            if key not in pacings:
+                pacings[key] = make_pacing(key[0], seconds)
+            return pacings[key]
+
+        operations = []
+        batch = None # 当前正在合并的 GestureSequence (batch 模式)
+        for step in self.steps:
+            kind = step[0]
+            if kind == 'wait':
+                batch = None
+                operations.append(('wait', pacing_for(step[1], step[2])))
+                continue
+
+            if self.batch:
+                if batch is None:
+                    batch = GestureSequence()
+                    operations.append(('actions', batch, None))
+                sequence = batch
+            else:
+                sequence = GestureSequence() if kind == 'swipe' else None
+
+            if kind == 'pinch':
+                _, gesture, percent, ratio, speed, pause = step
+                area = geometry.central_area(ratio)
+                if sequence is None:
+                    script = f'mobile: pinch{gesture.capitalize()}Gesture'
+                    operations.append(('script', script, dict(area, percent=percent, speed=speed), pacing_for(pause)))
+                    continue
+                sequence.pinch(gesture, area, percent, speed)
+            else:
+                _, start, end, duration_ms, pause = step
+                sequence.swipe((start[0] * window_size['width'], start[1] * window_size['height']),
+                               (end[0] * window_size['width'], end[1] * window_size['height']), duration_ms)
+                if not self.batch:
+                    operations.append(('actions', sequence, pacing_for(pause)))
+                    continue
+            if pause:
+                sequence.pause(pause * 1000)
+        return operations, list(pacings.values())
+
+
+def run_operation(driver, operation, recorder, sessions=None):
+    """执行一个绑定后的操作, 返回手势数"""
+    gesture_count = 0
+    if operation[0] == 'script':
+        _, script, args, pacing = operation
+        recorder.execute_script(driver, script, args)
+        gesture_count = 1
+    elif operation[0] == 'actions':
+        _, sequence, pacing = operation
+        sequence.perform(driver, recorder)
+        gesture_count = sequence.gesture_count
+    else:
+        _, pacing = operation
+    if sessions is not None and gesture_count:
+        sessions.first_gesture_done(driver)
+    if pacing is not None:
+        pacing.wait(driver)
+    return gesture_count
+
+
+def run_scenario(plan, time_budget=None):
+    """打开会话并按场景循环执行, 直到用完时间预算或 Ctrl+C"""
+    time_budget = plan.time_budget if time_budget is None else time_budget
+    latency_log = plan.latency_log or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'latency_logs',
+        f"{plan.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    recorder = GestureRecorder(latency_log)
+    sessions = SessionManager(plan.server, warm=plan.warm_start)
+    supervisor = SessionSupervisor(sessions, plan.build_options(), plan.server) # 会话失效时重建并从出错的步骤继续
+    pacings = []
+    sampler = None
+    gesture_count = 0
+    start_time = time.time()
+    try:
+        driver = supervisor.connect()
+        start_time = time.time() # 与原脚本相同, 时间预算从连接成功开始计算
+        print(f"场景 '{plan.name}': 每轮 {len(plan.steps)} 步, 时间预算 {time_budget or '无限制'} 秒")
+        make_pacing(plan.pacing, plan.startup_wait).wait(driver)
+        operations, pacings = plan.bind(driver)
+        if plan.sampling is not None:
+            sampler = DeviceSampler(lambda: supervisor.driver, plan.device.get('app_package') or APP_PACKAGE,
+                                    plan.sampling.get('interval', 5), plan.sampling.get('output'), recorder).start()
+        steps = [lambda driver, operation=operation: run_operation(driver, operation, recorder, sessions)
+                 for operation in operations]
+        step_gestures = [1 if operation[0] == 'script' else operation[1].gesture_count if operation[0] == 'actions' else 0
+                         for operation in operations]
+
+        def count_gestures(index):
+            nonlocal gesture_count
+            gesture_count += step_gestures[index]
+
+        cycle = 0
+        while not time_budget or time.time() - start_time < time_budget:
+            cycle += 1
+            supervisor.run(steps, count_gestures)
+            print(f"第 {cycle} 轮完成, 持续运行时间: {int(time.time() - start_time)}秒, {recorder.cycle_summary()}")
+    except KeyboardInterrupt:
+        print("手动停止")
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            for line in sampler.summary():
+                print(line)
+        recorder.close()
+        print(f"手势延迟记录已保存到: {latency_log}")
+        for pacing in pacings:
+            print_pacing_stats(pacing, gesture_count, time.time() - start_time)
+        print(f"总手势 {gesture_count} 次, 延迟 {format_percentiles(recorder.latencies_ms())}")
+        supervisor.report()
+        if supervisor.driver is not None:
+            print_geometry_stats(supervisor.driver)
+            sessions.release(supervisor.driver)
+            sessions.report()
+    return gesture_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按 YAML/JSON 场景文件执行手势压力测试")
+    parser.add_argument('scenario', help=f"场景文件, 或 {SCENARIO_DIR} 中的场景名 (例如 time / simple)")
+    parser.add_argument('--device', help="覆盖场景中的 device_name")
+    parser.add_argument('--platform-version', help="覆盖场景中的 platform_version")
+    parser.add_argument('--duration', type=float, help="覆盖场景中的 time_budget (秒)")
+    parser.add_argument('--check', action='store_true', help="只编译检查场景文件, 不连接设备")
+    args = parser.parse_args(argv)
+
+    path = args.scenario
+    if not os.path.exists(path):
+        for extension in ('.yaml', '.yml', '.json'):
+            candidate = os.path.join(SCENARIO_DIR, path + extension)
+            if os.path.exists(candidate):
+                path = candidate
+                break
+    scenario = load_scenario(path)
+    if args.device:
+        scenario.setdefault('device', {})['device_name'] = args.device
+    if args.platform_version:
+        scenario.setdefault('device', {})['platform_version'] = args.platform_version
+    plan = ScenarioPlan(scenario, path)
+
+    if args.check:
+        gestures = sum(1 for step in plan.steps if step[0] != 'wait')
+        print(f"场景 '{plan.name}' 检查通过: 每轮 {len(plan.steps)} 步 ({gestures} 个手势), "
+              f"设备 {plan.device['device_name']}, 时间预算 {plan.time_budget or '无限制'}")
+        return 0
+    run_scenario(plan, args.duration)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
-from appium import webdriver
 from appium.options.android import UiAutomator2Options
+import os
 import time
+from functools import partial
+from datetime import datetime
+from uiautomator_core import get_screen_geometry, print_geometry_stats, make_pacing, print_pacing_stats, GestureRecorder, SessionManager, SessionSupervisor
 
 APPIUM_SERVER = 'http://localhost:4723'
 
@@ -16,24 +19,29 @@ options.set_capability("noReset", True)
 #当设备上已安装uiautomator2包，可以设置
 #options.set_capability("skipServerInstallation",True)
 
+# 热启动 (改为 True 开启): 结束时保留会话, 下次运行直接复用; 设备初始化过一次后, 新建会话时自动设置
+# skipServerInstallation / skipDeviceInitialization 等 (见 uiautomator_core.SessionManager)
+# 默认 False, 与原来一样每次新建会话、结束时关闭
+WARM_START = False
+
+# 手势之后的等待方式: 默认 'fixed' 固定等待 1 秒 (与原来一样);
+# 改为 'idle' 则轮询截图, 画面不再变化 (地图渲染完成) 就继续, 最多等 1 秒。
+# 'idle' 每次轮询都要拉取整张 PNG 截图, 请求和传输开销较大, 按需开启
+PACING_MODE = 'fixed'
+PACING_TIMEOUT = 1
+
+# 每次手势请求的时间、类型、参数和往返延迟, 每 30 秒追加写入 CSV (改为 .jsonl 扩展名则写 JSONL)
+LATENCY_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'latency_logs',
+                           f"gesture_latency_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+
 def get_central_area(driver):
-    """计算屏幕中央区域"""
-    window_size = driver.get_window_size()
-    area_width = int(window_size['width'] * 0.4)
-    area_height = int(window_size['height'] * 0.4)
-    left = (window_size['width'] - area_width) // 2
-    top = (window_size['height'] - area_height) // 2
-    return {
-        'width': area_width,
-        'height': area_height,
-        'left': max(0, left),
-        'top': max(0, top)
-    }
+    """计算屏幕中央区域 (屏幕尺寸按会话缓存, 不再每次请求 get_window_size)"""
+    return get_screen_geometry(driver).central_area(0.4)
 
-def perform_pinch_close(driver):
+def perform_pinch_close(driver, recorder, sessions, pacing):
     """执行缩小操作"""
     area = get_central_area(driver)
-    driver.execute_script('mobile: pinchCloseGesture', {
+    recorder.execute_script(driver, 'mobile: pinchCloseGesture', {
         'percent': 0.7,
         'left': area['left'],
         'top': area['top'],
@@ -41,13 +49,14 @@ def perform_pinch_close(driver):
         'height': area['height'],
         'speed': 1500
     })
+    sessions.first_gesture_done(driver)
     print("缩小操作完成")
-    time.sleep(1)
+    pacing.wait(driver)
 
-def perform_pinch_open(driver):
+def perform_pinch_open(driver, recorder, sessions, pacing):
     """执行放大操作"""
     area = get_central_area(driver)
-    driver.execute_script('mobile: pinchOpenGesture', {
+    recorder.execute_script(driver, 'mobile: pinchOpenGesture', {
         'percent': 0.7,
         'left': area['left'],
         'top': area['top'],
@@ -55,32 +64,52 @@ def perform_pinch_open(driver):
         'height': area['height'],
         'speed': 1500
     })
+    sessions.first_gesture_done(driver)
     print("放大操作完成")
-    time.sleep(1)
+    pacing.wait(driver)
+
+def report_progress(index):
+    """每完成一个手势打印进度 (index 为本轮中的序号)"""
+    if index < 10:
+        print(f"已完成缩小操作 {index+1}/10 次")
+    else:
+        print(f"已完成放大操作 {index-9}/10 次")
 
 def main():
+    # 会话管理器、延迟记录器和等待策略在运行时创建, 导入本模块不会创建日志目录等
+    sessions = SessionManager(APPIUM_SERVER, warm=WARM_START)
+    recorder = GestureRecorder(LATENCY_LOG)
+    pacing = make_pacing(PACING_MODE, PACING_TIMEOUT)
+    # 会话失效 (UiAutomator2 服务崩溃等) 时自动重建会话, 并从出错的那个手势继续
+    supervisor = SessionSupervisor(sessions, options)
     try:
-        driver = webdriver.Remote(APPIUM_SERVER, options=options)
+        driver = supervisor.connect()
         print("连接成功")  
-        time.sleep(5)
+        start_time = time.time()
+        gesture_count = 0
+        make_pacing(PACING_MODE, 5).wait(driver)
 
+        # 每轮 10 次缩小 + 10 次放大
+        gestures = {'recorder': recorder, 'sessions': sessions, 'pacing': pacing}
+        steps = [partial(perform_pinch_close, **gestures)] * 10 + [partial(perform_pinch_open, **gestures)] * 10
         while True:
-            # 执行10次缩小
-            for i in range(10):
-                perform_pinch_close(driver)
-                print(f"已完成缩小操作 {i+1}/10 次")
+            gesture_count += supervisor.run(steps, report_progress)
 
-            # 执行10次放大
-            for i in range(10):
-                perform_pinch_open(driver)
-                print(f"已完成放大操作 {i+1}/10 次")
+            print_pacing_stats(pacing, gesture_count, time.time() - start_time)
+            print(recorder.cycle_summary())
 
     except KeyboardInterrupt:
         print("手动停止")
     finally:
-        if 'driver' in locals():
-            driver.quit()
-            print("驱动关闭")
+        recorder.close()
+        print(f"手势延迟记录已保存到: {LATENCY_LOG}")
+        supervisor.report()
+        if supervisor.driver is not None:
+            print_geometry_stats(supervisor.driver)
+            sessions.release(supervisor.driver)
+            sessions.report()
+            if not WARM_START:
+                print("驱动关闭")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file